@@ -1,27 +1,16 @@
 import yfinance as yf
 import openai
-from textblob import TextBlob
 import pandas as pd
 from dotenv import load_dotenv
 import os
+from shared_utils import (load_processed_articles, save_processed_articles, append_sentiment, score_sentiment,
+                          SENTIMENT_DATASET)
 
 #API for GPT
 load_dotenv()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-# Articles that were already processed
-PROCESSED_ARTICLES_FILE = "processed_articles.csv"
-
-def load_processed_articles():
-    if os.path.exists(PROCESSED_ARTICLES_FILE):
-        return pd.read_csv(PROCESSED_ARTICLES_FILE)['source_url'].tolist()
-    return []
-
-def save_processed_articles(processed_articles):
-    df = pd.DataFrame(processed_articles, columns=['source_url'])
-    df.to_csv(PROCESSED_ARTICLES_FILE, index=False)
-
 def get_stock_news(stock_id):
 
     # Stock ticker data
@@ -61,21 +50,9 @@ def summarize_article(title):
         print(f"An error occurred: {e}")
         return "No summary available."
 
-# Calculate Sentiment Scores
-def analyze_sentiment(text):
-    blob = TextBlob(text)
-    sentiment = blob.sentiment
-    if sentiment.polarity > 0:
-        sentiment_category = 'Positive'
-    elif sentiment.polarity < 0:
-        sentiment_category = 'Negative'
-    else:
-        sentiment_category = 'Neutral'
-    return {
-        'polarity': sentiment.polarity,
-        'subjectivity': sentiment.subjectivity,
-        'sentiment_category': sentiment_category
-    }
+# Calculate Sentiment Scores for a batch of texts
+def analyze_sentiment(texts):
+    return score_sentiment(texts)
 
 def main():
     # Define stock_id (ticker symbol)
@@ -91,6 +68,7 @@ def main():
         # Prepare the data for the database
         data_for_db = []
         new_articles = []
+        summaries = []
 
         for article in articles:
             url = article['link']
@@ -106,10 +84,13 @@ def main():
             # Summarize the article
             summary = summarize_article(title)
             print(f"Summary:\n{summary}\n")
+            summaries.append((url, title, summary))
 
-            # Sentiment analysis on the summary
-            sentiment_result = analyze_sentiment(summary)
-            print("--- Sentiment Analysis ---")
+        # Sentiment analysis on all summaries at once
+        sentiment_results = analyze_sentiment(summary for _, _, summary in summaries)
+
+        for (url, title, summary), sentiment_result in zip(summaries, sentiment_results):
+            print(f"--- Sentiment Analysis: {title} ---")
             print(f"Polarity: {sentiment_result['polarity']}")
             print(f"Subjectivity: {sentiment_result['subjectivity']}")
             print(f"Sentiment Category: {sentiment_result['sentiment_category']}\n")
@@ -125,9 +106,8 @@ def main():
             # Add to new articles list
             new_articles.append(url)
 
-        # Save new articles to the processed list
-        processed_articles.extend(new_articles)
-        save_processed_articles(processed_articles)
+        # Append new articles to the processed store
+        save_processed_articles(processed_articles, new_articles)
 
         # Convert to a DF
         if data_for_db:
@@ -135,16 +115,9 @@ def main():
             print("\n--- Data Prepared for Database ---")
             print(df)
 
-            # Save to CSV or database
-            output_file = 'stock_news_sentiment.csv'
-            if os.path.exists(output_file):
-                # Append to existing file
-                df.to_csv(output_file, mode='a', header=False, index=False)
-            else:
-                # Create new file
-                df.to_csv(output_file, index=False)
-
-            print(f"\nNew data saved to '{output_file}'.")
+            # Save to the partitioned sentiment dataset
+            append_sentiment(data_for_db)
+            print(f"\nNew data saved to '{SENTIMENT_DATASET}'.")
         else:
             print("\nNo new articles to process.")
 
@@ -1,12 +1,13 @@
 import openai
 import os
-from textblob import TextBlob
 import praw
 from dotenv import load_dotenv
 from shared_utils import (
     load_processed_articles,
     save_processed_articles,
-    append_to_sentiment_csv
+    append_sentiment,
+    score_sentiment,
+    SENTIMENT_DATASET
 )
 
 load_dotenv()
@@ -50,17 +51,13 @@ def fetch_dd_posts(reddit, subreddit_name="wallstreetbets", flair="dd", limit=10
 
     return posts
 
-#Calculate Sentiment score for each posts' content
-def analyze_sentiment(text):
-    blob = TextBlob(text)
-    polarity = blob.sentiment.polarity
-    subjectivity = blob.sentiment.subjectivity
-    sentiment = 'Positive' if polarity > 0 else 'Negative' if polarity < 0 else 'Neutral'
-    return {
-        'polarity': polarity,
-        'subjectivity': subjectivity,
-        'sentiment': sentiment
-    }
+#Calculate Sentiment scores for every post's content in one batch
+def analyze_sentiment(texts):
+    return [{
+        'polarity': result['polarity'],
+        'subjectivity': result['subjectivity'],
+        'sentiment': result['sentiment_category']
+    } for result in score_sentiment(texts)]
 
 #GPT API identifies stock ticker(s) within contents of posts
 def identify_stock_symbols(text):
@@ -90,17 +87,21 @@ def process_posts(posts, processed_urls):
     new_articles = []
     sentiment_data = []
 
+    new_posts = []
     for post in posts:
-        url = post['url']
-        if url in processed_urls:
-            print(f"Skipping already processed post: {url}")
+        if post['url'] in processed_urls:
+            print(f"Skipping already processed post: {post['url']}")
             continue
+        new_posts.append(post)
+
+    # Sentiment Analysis for all new posts at once
+    sentiments = analyze_sentiment(post['text'] for post in new_posts)
 
+    for post, sentiment in zip(new_posts, sentiments):
+        url = post['url']
         print(f"\nProcessing post: {post['title']} by u/{post['author']}")
         print(f"URL: {url}\nContent:\n{post['text']}\n")
 
-        # Sentiment Analysis
-        sentiment = analyze_sentiment(post['text'])
         print("--- Sentiment Analysis ---")
         print(
             f"Polarity: {sentiment['polarity']}, Subjectivity: {sentiment['subjectivity']}, Sentiment: {sentiment['sentiment']}\n")
@@ -142,12 +143,12 @@ def main():
     new_articles, sentiment_data = process_posts(posts, processed_urls)
 
     if new_articles:
-        save_processed_articles(processed_urls + new_articles)
+        save_processed_articles(processed_urls, new_articles)
         print(f"\nSaved {len(new_articles)} new articles as processed.")
 
     if sentiment_data:
-        append_to_sentiment_csv(sentiment_data)
-        print("Appended new sentiment data to 'stock_news_sentiment.csv'.")
+        append_sentiment(sentiment_data)
+        print(f"Appended new sentiment data to '{SENTIMENT_DATASET}'.")
     else:
         print("No new sentiment data to append.")
 
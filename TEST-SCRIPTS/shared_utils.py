@@ -1,21 +1,221 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import os
+import re
+import shutil
+import sqlite3
+import sys
+import uuid
+from datetime import datetime
 
+# The ingesters' folder, for the shared sentiment engine (VIBE-SCRIPTS/sentiment_engine.py)
+VIBE_SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "VIBE-SCRIPTS")
 PROCESSED_ARTICLES_FILE = "processed_articles.csv"
+PROCESSED_ARTICLES_DB = "processed_articles.sqlite3"
 SENTIMENT_CSV = "stock_news_sentiment.csv"
+# Columns of the legacy CSV that can date a row, in order of preference
+SENTIMENT_CSV_DATE_COLUMNS = ('fetched_at', 'date', 'published', 'publish_time')
+# Parquet dataset partitioned as date=YYYY-MM-DD/ticker=XYZ
+SENTIMENT_DATASET = "stock_news_sentiment"
+# Partitions with more files than this are merged into one after an append
+SENTIMENT_COMPACT_MIN_FILES = int(os.getenv("SENTIMENT_COMPACT_MIN_FILES", "8"))
+
+# Indexed, append-only store of processed URLs (replaces rewriting processed_articles.csv every run).
+# Membership is a primary-key lookup and new URLs are appended in one transaction; the old CSV is
+# imported once on first open.
+class ProcessedUrlStore:
+    def __init__(self, path=PROCESSED_ARTICLES_DB, csv_path=PROCESSED_ARTICLES_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed_url (
+                url TEXT PRIMARY KEY,
+                processed_at TEXT NOT NULL
+            ) WITHOUT ROWID;
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);")
+        self.conn.commit()
+        if csv_path:
+            self.migrate_csv(csv_path)
+
+    def __contains__(self, url):
+        return self.conn.execute("SELECT 1 FROM processed_url WHERE url = ?;", (url,)).fetchone() is not None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM processed_url;").fetchone()[0]
+
+    # Record processed URLs; already-known URLs are ignored
+    def add_many(self, urls):
+        processed_at = datetime.now().isoformat(timespec='seconds')
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO processed_url (url, processed_at) VALUES (?, ?);",
+                ((url, processed_at) for url in urls)
+            )
+
+    def add(self, url):
+        self.add_many([url])
+
+    # One-time import of the legacy processed_articles.csv
+    def migrate_csv(self, csv_path):
+        if not os.path.exists(csv_path):
+            return
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_csv';").fetchone():
+            return
+        imported = 0
+        for chunk in pd.read_csv(csv_path, usecols=['source_url'], chunksize=50000):
+            urls = chunk['source_url'].dropna().astype(str).tolist()
+            self.add_many(urls)
+            imported += len(urls)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_csv', ?);", (csv_path,))
+        print(f"Migrated {imported} processed URLs from '{csv_path}' to '{self.path}'.")
+
+    def close(self):
+        self.conn.close()
 
 def load_processed_articles():
-    if os.path.exists(PROCESSED_ARTICLES_FILE):
-        return pd.read_csv(PROCESSED_ARTICLES_FILE)['source_url'].tolist()
-    return []
+    return ProcessedUrlStore()
+
+# Append newly processed URLs to the store
+def save_processed_articles(processed_articles, new_articles):
+    processed_articles.add_many(new_articles)
+
+# Score a batch of texts with the ingesters' sentiment engine (SENTIMENT_BACKEND, SENTIMENT_PROCESSES);
+# returns one {'polarity', 'subjectivity', 'sentiment_category'} per text
+def score_sentiment(texts):
+    if VIBE_SCRIPTS_DIR not in sys.path:
+        sys.path.append(VIBE_SCRIPTS_DIR)
+    from sentiment_engine import get_sentiment_engine
+    return get_sentiment_engine().score(list(texts))
+
+def _sentiment_schema():
+    return pa.schema([
+        ('stock_id', pa.string()),
+        ('source_url', pa.string()),
+        ('polarity', pa.float64()),
+        ('subjectivity', pa.float64()),
+        ('fetched_at', pa.timestamp('s')),
+    ])
 
-def save_processed_articles(processed_articles):
-    df = pd.DataFrame(processed_articles, columns=['source_url'])
-    df.to_csv(PROCESSED_ARTICLES_FILE, index=False)
+def _sentiment_partitioning():
+    return ds.partitioning(pa.schema([('date', pa.date32()), ('ticker', pa.string())]), flavor='hive')
 
-def append_to_sentiment_csv(data):
+# Ticker as a safe partition directory name ("N/A" -> "N_A")
+def _partition_ticker(stock_id):
+    return re.sub(r"[^A-Z0-9.\-]", "_", str(stock_id).upper()) or "_"
+
+# Typed frame in the dataset layout; accepts the news script's predicted_* column names too
+def _sentiment_frame(data, fetched_at=None):
     df = pd.DataFrame(data)
-    if os.path.exists(SENTIMENT_CSV):
-        df.to_csv(SENTIMENT_CSV, mode='a', header=False, index=False)
+    for legacy, column in (('predicted_polarity', 'polarity'), ('predicted_subjectivity', 'subjectivity')):
+        if legacy in df:
+            df[column] = df[column].fillna(df[legacy]) if column in df else df[legacy]
+            df = df.drop(columns=[legacy])
+    if 'fetched_at' not in df:
+        df['fetched_at'] = fetched_at or datetime.now()
+    df['fetched_at'] = pd.to_datetime(df['fetched_at']).dt.floor('s')
+    df['stock_id'] = df['stock_id'].astype(str)
+    df['source_url'] = df['source_url'].astype(str)
+    df['polarity'] = pd.to_numeric(df['polarity'], errors='coerce')
+    df['subjectivity'] = pd.to_numeric(df['subjectivity'], errors='coerce')
+    df['date'] = df['fetched_at'].dt.date
+    df['ticker'] = df['stock_id'].map(_partition_ticker)
+    return df[['stock_id', 'source_url', 'polarity', 'subjectivity', 'fetched_at', 'date', 'ticker']]
+
+# Append sentiment rows to the partitioned Parquet dataset, then compact the partitions that were touched
+def append_sentiment(data, dataset_path=SENTIMENT_DATASET):
+    if not os.path.exists(dataset_path) and os.path.exists(SENTIMENT_CSV):
+        import_sentiment_csv(SENTIMENT_CSV, dataset_path)
+    _write_sentiment(data, dataset_path)
+
+def _write_sentiment(data, dataset_path):
+    df = _sentiment_frame(data)
+    if df.empty:
+        return
+    schema = _sentiment_schema().append(pa.field('date', pa.date32())).append(pa.field('ticker', pa.string()))
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    ds.write_dataset(
+        table,
+        dataset_path,
+        format='parquet',
+        partitioning=_sentiment_partitioning(),
+        existing_data_behavior='overwrite_or_ignore',
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet"
+    )
+    touched = {(row.date, row.ticker) for row in df[['date', 'ticker']].drop_duplicates().itertuples()}
+    compact_sentiment(dataset_path, partitions=touched)
+
+# One-time import of the legacy stock_news_sentiment.csv into the dataset.
+# Rows are dated by their own date column when the CSV has one. The scripts that wrote the legacy CSV stored
+# no date, so those rows (and rows with an unparseable date) get the file's modification time: the time of the
+# last append, not when each row was fetched, so they all land in that day's partitions.
+# The dataset directory existing is what marks the import done, so the rows are written to a scratch directory
+# that only replaces it once the whole import succeeded; a failed import is retried by the next append.
+def import_sentiment_csv(csv_path=SENTIMENT_CSV, dataset_path=SENTIMENT_DATASET):
+    # Keep the literal "N/A" ticker the scripts wrote instead of reading it as NaN
+    df = pd.read_csv(csv_path, dtype={'stock_id': str}, keep_default_na=False)
+    if df.empty:
+        return
+    modified = datetime.fromtimestamp(os.path.getmtime(csv_path))
+    column = next((column for column in SENTIMENT_CSV_DATE_COLUMNS if column in df), None)
+    fetched_at = pd.to_datetime(df[column], errors='coerce') if column else pd.Series(pd.NaT, index=df.index)
+    undated = int(fetched_at.isna().sum())
+    df['fetched_at'] = fetched_at.fillna(pd.Timestamp(modified))
+    df = df.drop(columns=[c for c in SENTIMENT_CSV_DATE_COLUMNS if c in df and c != 'fetched_at'])
+    rows = _sentiment_frame(df).drop(columns=['date', 'ticker'])
+    if os.path.exists(dataset_path):
+        _write_sentiment(rows, dataset_path)
+    else:
+        scratch = f"{dataset_path}.importing"
+        shutil.rmtree(scratch, ignore_errors=True)  # left by an import that failed
+        os.makedirs(scratch)
+        _write_sentiment(rows, scratch)
+        os.replace(scratch, dataset_path)
+    print(f"Imported {len(df)} rows from '{csv_path}' into '{dataset_path}'.")
+    if undated:
+        print(f"{undated} rows had no date and were dated {modified:%Y-%m-%d %H:%M} (the file's modification time).")
+
+# Merge the small files of each partition into one Parquet file
+def compact_sentiment(dataset_path=SENTIMENT_DATASET, partitions=None, min_files=SENTIMENT_COMPACT_MIN_FILES):
+    if partitions is None:
+        directories = [root for root, _, files in os.walk(dataset_path) if any(f.endswith('.parquet') for f in files)]
     else:
-        df.to_csv(SENTIMENT_CSV, index=False)
\ No newline at end of file
+        directories = [os.path.join(dataset_path, f"date={date}", f"ticker={ticker}") for date, ticker in partitions]
+
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.parquet'))
+        if len(files) <= max(min_files, 1):
+            continue
+        table = pa.concat_tables([pq.read_table(f, schema=_sentiment_schema()) for f in files])
+        # Written under a hidden name first, which dataset readers skip
+        tmp_path = os.path.join(directory, f".compacted-{uuid.uuid4().hex}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(directory, f"compacted-{uuid.uuid4().hex}.parquet"))
+        for f in files:
+            os.remove(f)
+        print(f"Compacted {len(files)} files in '{directory}'.")
+
+# Load sentiment rows for some tickers and/or a date range; filters are pushed down to the partition
+# directories and Parquet row groups, so only the matching files are read
+def read_sentiment(tickers=None, start=None, end=None, columns=None, dataset_path=SENTIMENT_DATASET):
+    if not os.path.exists(dataset_path):
+        return pd.DataFrame(columns=columns or [field.name for field in _sentiment_schema()] + ['date', 'ticker'])
+    dataset = ds.dataset(dataset_path, format='parquet', partitioning=_sentiment_partitioning())
+    condition = None
+
+    def both(left, right):
+        return right if left is None else left & right
+
+    if tickers:
+        condition = both(condition, ds.field('ticker').isin([_partition_ticker(ticker) for ticker in tickers]))
+    if start:
+        condition = both(condition, ds.field('date') >= pd.Timestamp(start).date())
+    if end:
+        condition = both(condition, ds.field('date') <= pd.Timestamp(end).date())
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
@@ -0,0 +1,416 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+import psycopg
+from psycopg.conninfo import make_conninfo
+from fake_llm_server import FakeChatServer, echo_reply
+from symbol_batching import BATCH_SYSTEM_PROMPT
+
+# End-to-end benchmark for both SourcesTable pipelines with every external service replaced by a local fake:
+# canned yfinance news, the fake chat-completions server, a fake PRAW client and a throwaway Postgres schema.
+# Postgres comes from BENCH_DATABASE_URL (a scratch schema is created and dropped), or from the optional
+# `pgserver` package, which runs a temporary local server.
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+
+SCHEMA_DDL = """
+    CREATE TABLE stock (id BIGSERIAL PRIMARY KEY, abbreviation TEXT UNIQUE, name TEXT);
+    CREATE TABLE source_origin (id BIGSERIAL PRIMARY KEY, name TEXT UNIQUE);
+    CREATE TABLE source (
+        id BIGSERIAL PRIMARY KEY,
+        url TEXT UNIQUE NOT NULL,
+        source_origin_id BIGINT REFERENCES source_origin (id),
+        predicted_sentiment_score DOUBLE PRECISION,
+        predicted_opinion_score DOUBLE PRECISION,
+        date_fetched TIMESTAMP
+    );
+    CREATE TABLE stocks_source (
+        stock_id BIGINT REFERENCES stock (id),
+        source_id BIGINT REFERENCES source (id),
+        PRIMARY KEY (stock_id, source_id)
+    );
+"""
+SOURCE_ORIGINS = ["Yahoo Finance", "WallStreetBets", "r/stocks"]
+REDDIT_SOURCES = "wallstreetbets:dd;stocks:*"
+
+HINT_RE = re.compile(r"\(ticker hint: ([a-z]+)\)")
+ARTICLE_RE = re.compile(r"^(?:Title|Content): (.*)$", re.M)
+# Closing remarks for fake summaries, so a summary's sentiment differs from its title's the way a real one can
+SUMMARY_CLOSERS = ("Analysts expect strong growth.", "Investors worry about weak demand.",
+                   "The company reported the results.", "The outlook looks great.", "Margins were disappointing.",
+                   "Shares traded in line with the market.")
+WORDS = ("strong weak great poor growth guidance beat miss upgrade downgrade demand margin revenue outlook "
+         "bullish bearish solid disappointing record quarter shares analysts expect risk").split()
+
+
+# Per-stage latency samples, collected by wrapping pipeline functions in place
+class StageStats:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._patches = []
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def patch(self, owner, name, stage):
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+
+        setattr(owner, name, timed)
+        self._patches.append((owner, name, original))
+
+    # Time a future-returning call from submission until its future resolves
+    def patch_future(self, owner, name, stage):
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            future = original(*args, **kwargs)
+            future.add_done_callback(lambda _: self.record(stage, time.perf_counter() - started))
+            return future
+
+        setattr(owner, name, timed)
+        self._patches.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches = []
+
+    def report(self, wall):
+        rows = {}
+        for stage, samples in sorted(self.samples.items()):
+            values = np.array(samples) * 1000
+            rows[stage] = {
+                'calls': len(values),
+                'calls_per_s': len(values) / wall if wall else 0.0,
+                'p50_ms': float(np.percentile(values, 50)),
+                'p90_ms': float(np.percentile(values, 90)),
+                'p99_ms': float(np.percentile(values, 99)),
+                'max_ms': float(values.max()),
+                'total_s': float(values.sum() / 1000),
+            }
+        return rows
+
+
+def print_report(name, result):
+    print(f"\n=== {name}: {result['items']} {result['unit']} in {result['wall_s']:.2f}s "
+          f"({result['items_per_s']:.1f}/s); {result['sources']} sources, {result['links']} links written ===")
+    print(f"{'stage':<16}{'calls':>8}{'calls/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'total s':>10}")
+    for stage, row in result['stages'].items():
+        print(f"{stage:<16}{row['calls']:>8}{row['calls_per_s']:>10.1f}{row['p50_ms']:>10.1f}{row['p90_ms']:>10.1f}"
+              f"{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}{row['total_s']:>10.2f}")
+
+
+# Synthetic ticker symbols that the local extractor won't mistake for common words
+def make_symbols(count):
+    from ticker_extractor import STOPLIST
+    letters = "BCDFGHJKLMNPQRSTVWXZ"
+    symbols = []
+    for length in (3, 4):
+        for combo in itertools.product(letters, repeat=length):
+            symbol = "".join(combo)
+            if symbol not in STOPLIST:
+                symbols.append(symbol)
+                if len(symbols) == count:
+                    return symbols
+    return symbols
+
+
+# Fake article summary built from the prompt's Title/Content lines plus a closing remark picked by hash, so
+# summaries (and their sentiment) vary per article
+def fake_summary(text):
+    body = " ".join(ARTICLE_RE.findall(text))
+    return f"{body} {SUMMARY_CLOSERS[zlib.crc32(body.encode('utf-8')) % len(SUMMARY_CLOSERS)]}"
+
+
+# Fake LLM replies: symbol requests answer with the hinted tickers, article summaries come from fake_summary(),
+# anything else is echoed
+def fake_reply(messages):
+    system = messages[0]['content'] if messages else ''
+    text = messages[-1]['content'] if messages else ''
+    if system == BATCH_SYSTEM_PROMPT:
+        sections = re.split(r"^### Post (\d+)\n", text, flags=re.M)
+        results = {sections[i]: [hint.upper() for hint in HINT_RE.findall(sections[i + 1])]
+                   for i in range(1, len(sections) - 1, 2)}
+        return json.dumps({'results': results})
+    if system.startswith("Identify stock ticker symbols"):
+        return ", ".join(hint.upper() for hint in HINT_RE.findall(text))
+    if ARTICLE_RE.search(text):
+        return fake_summary(text)
+    return echo_reply(messages)
+
+
+def random_sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+# Stand-in for the yfinance module: Ticker(symbol).news returns canned articles, some shared between tickers
+class FakeYFinance:
+    def __init__(self, symbols, articles_per_ticker, shared_fraction=0.2, latency=0.0, seed=1):
+        rng = random.Random(seed)
+        now = int(time.time())
+        shared = [self._article(rng, f"shared-{n}", now) for n in range(max(1, articles_per_ticker))]
+        self.news = {}
+        for symbol in symbols:
+            articles = [self._article(rng, f"{symbol}-{n}", now) for n in range(articles_per_ticker)]
+            for n in range(articles_per_ticker):
+                if rng.random() < shared_fraction:
+                    articles[n] = shared[n]
+            self.news[symbol] = articles
+        self.latency = latency
+        fake = self
+
+        class Ticker:
+            def __init__(self, symbol):
+                self.symbol = symbol
+
+            @property
+            def news(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                return fake.news.get(self.symbol, [])
+
+        self.Ticker = Ticker
+
+    @staticmethod
+    def _article(rng, key, now):
+        return {
+            'title': f"{random_sentence(rng, 8)} ({key})",
+            'link': f"https://news.example.com/{key}-{uuid.uuid4().hex[:8]}",
+            'providerPublishTime': now - rng.randint(0, 86400 * 7),
+        }
+
+
+class FakeSubmission:
+    def __init__(self, subreddit, number, created_utc, flair, title, text):
+        self.subreddit = FakeSubreddit(subreddit, None)
+        self.fullname = f"t3_{subreddit}{number}"
+        self.created_utc = created_utc
+        self.link_flair_text = flair
+        self.title = title
+        self.selftext = text
+        self.url = f"https://www.reddit.com/r/{subreddit}/comments/{number}"
+        self.author = f"user{number % 97}"
+
+
+class FakeSubreddit:
+    def __init__(self, name, reddit):
+        self.display_name = name
+        self.reddit = reddit
+
+    def new(self, limit=100):
+        names = {name.lower() for name in self.display_name.split('+')}
+        submissions = [s for s in self.reddit.submissions if s.subreddit.display_name.lower() in names]
+        if self.reddit.latency:
+            time.sleep(self.reddit.latency * (len(submissions[:limit]) // 100 + 1))  # one request per 100
+        return iter(submissions[:limit])
+
+
+# Stand-in for praw.Reddit: a fixed, newest-first set of submissions across the benchmark subreddits.
+# Half of the posts carry a cashtag (resolved locally), the rest only a hint the fake LLM understands.
+class FakeReddit:
+    def __init__(self, symbols, posts, latency=0.0, seed=2):
+        rng = random.Random(seed)
+        now = time.time()
+        self.latency = latency
+        self.submissions = []
+        for number in range(posts):
+            subreddit = "wallstreetbets" if number % 3 else "stocks"
+            symbol = rng.choice(symbols)
+            mention = f"${symbol}" if number % 2 else f"(ticker hint: {symbol.lower()})"
+            text = f"{random_sentence(rng, 40)} {mention} {random_sentence(rng, 40)}"
+            flair = "DD" if subreddit == "stocks" or rng.random() < 0.7 else "Meme"
+            self.submissions.append(FakeSubmission(subreddit, number, now - number * 60, flair,
+                                                   random_sentence(rng, 6), text))
+
+    def subreddit(self, name):
+        return FakeSubreddit(name, self)
+
+
+# Scratch schema on a real Postgres; yields the DATABASE_URL the pipelines should use
+class BenchDatabase:
+    def __init__(self, url=BENCH_DATABASE_URL):
+        self.server = None
+        if not url:
+            try:
+                import pgserver
+            except ImportError:
+                raise SystemExit("Set BENCH_DATABASE_URL to a scratch Postgres, or `pip install pgserver` "
+                                 "to run a temporary local one.")
+            self.server = pgserver.get_server(tempfile.mkdtemp(prefix="vibe-bench-pg-"), cleanup_mode='delete')
+            url = self.server.get_uri()
+        self.admin_url = url
+        self.schema = f"bench_{uuid.uuid4().hex[:8]}"
+        self.url = make_conninfo(url, options=f"-c search_path={self.schema}")
+
+    def create(self, symbols):
+        with psycopg.connect(self.admin_url, autocommit=True) as conn:
+            conn.execute(f"CREATE SCHEMA {self.schema};")
+        with psycopg.connect(self.url) as conn:
+            conn.execute(SCHEMA_DDL)
+            with conn.cursor() as cur:
+                cur.executemany("INSERT INTO stock (abbreviation, name) VALUES (%s, %s);",
+                                [(symbol, f"{symbol} Holdings") for symbol in symbols])
+                cur.executemany("INSERT INTO source_origin (name) VALUES (%s);", [(name,) for name in SOURCE_ORIGINS])
+
+    def counts(self):
+        with psycopg.connect(self.url) as conn:
+            sources = conn.execute("SELECT COUNT(*) FROM source;").fetchone()[0]
+            links = conn.execute("SELECT COUNT(*) FROM stocks_source;").fetchone()[0]
+        return sources, links
+
+    def drop(self):
+        try:
+            with psycopg.connect(self.admin_url, autocommit=True) as conn:
+                conn.execute(f"DROP SCHEMA IF EXISTS {self.schema} CASCADE;")
+        finally:
+            if self.server is not None:
+                self.server.cleanup()
+
+
+def run_news(db, args, symbols):
+    import news_api_SourcesTable as news
+    from llm_engine import EnrichmentEngine, close_engine
+    from sentiment_engine import SentimentEngine, close_sentiment_engine
+    from source_writer import SourceWriter
+    from source_dedupe import KnownUrls
+
+    news.yf = FakeYFinance(symbols, args.articles, latency=args.fetch_latency)
+    stats = StageStats()
+    stats.patch(news, 'get_stock_news', 'fetch')
+    stats.patch(KnownUrls, 'filter_new', 'dedupe')
+    stats.patch_future(EnrichmentEngine, 'submit', 'llm')
+    stats.patch(SentimentEngine, 'score', 'sentiment')
+    stats.patch(SourceWriter, '_write_batch', 'db_write')
+
+    before = db.counts()
+    started = time.perf_counter()
+    try:
+        news.main(fast=args.news_fast)
+    finally:
+        close_engine()
+        close_sentiment_engine()
+        stats.restore()
+    wall = time.perf_counter() - started
+    after = db.counts()
+    items = len(symbols) * args.articles
+    return {
+        'items': items, 'unit': "articles", 'wall_s': wall, 'items_per_s': items / wall,
+        'sources': after[0] - before[0], 'links': after[1] - before[1], 'stages': stats.report(wall),
+    }
+
+
+def run_reddit(db, args, symbols):
+    import reddit_api_SourcesTable as reddit
+    import reddit_sources
+    from llm_engine import EnrichmentEngine, close_engine
+    from sentiment_engine import SentimentEngine, close_sentiment_engine
+    from source_writer import SourceWriter
+
+    fake = FakeReddit(symbols, args.posts, latency=args.fetch_latency)
+    reddit.authenticate_reddit = lambda: fake
+    stats = StageStats()
+    stats.patch(reddit_sources, 'scan_listing', 'fetch')
+    stats.patch_future(EnrichmentEngine, 'submit', 'llm')
+    stats.patch(SentimentEngine, 'submit', 'sentiment')
+    stats.patch(reddit, 'process_stocks_for_post', 'stock_lookup')
+    stats.patch(SourceWriter, '_write_batch', 'db_write')
+
+    before = db.counts()
+    started = time.perf_counter()
+    try:
+        reddit.main(sources_spec=REDDIT_SOURCES)
+    finally:
+        close_engine()
+        close_sentiment_engine()
+        stats.restore()
+    wall = time.perf_counter() - started
+    after = db.counts()
+    return {
+        'items': args.posts, 'unit': "posts", 'wall_s': wall, 'items_per_s': args.posts / wall,
+        'sources': after[0] - before[0], 'links': after[1] - before[1], 'stages': stats.report(wall),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the news and Reddit pipelines against local fakes.")
+    parser.add_argument("--pipeline", choices=["news", "reddit", "both"], default="both")
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--articles", type=int, default=5, help="articles per ticker")
+    parser.add_argument("--posts", type=int, default=200)
+    parser.add_argument("--news-fast", action="store_true",
+                        help="run news on the fast path (title scores first, LLM refinement after)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake chat completion")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--fetch-latency", type=float, default=0.05, help="seconds per fake news/Reddit request")
+    parser.add_argument("--json", help="also write the results to this file (for comparing runs)")
+    parser.add_argument("--quiet", action="store_true", help="hide the pipelines' own output")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="vibe-bench-")
+    db = BenchDatabase()
+    symbols = make_symbols(args.tickers)
+    db.create(symbols)
+
+    # The pipeline modules read their settings at import time, so configure the environment first
+    os.environ.update({
+        'DATABASE_URL': db.url,
+        'LLM_CACHE_PATH': "off",
+        'REDDIT_CURSOR_PATH': os.path.join(workdir, "reddit_cursor.json"),
+        'NEWS_STAGING_PATH': os.path.join(workdir, "news_staging.sqlite3"),
+        'NEAR_DUP_INDEX_PATH': os.path.join(workdir, "near_dup_index.sqlite3"),
+        'OPENAI_API_KEY': "bench",
+        'NEWS_FETCH_RATE': "0",
+        'REDDIT_REQUEST_RATE': "0",
+        'REDDIT_FIRST_RUN_LIMIT': str(args.posts),
+    })
+    results = {'started': datetime.now().isoformat(timespec='seconds'), 'args': vars(args)}
+    try:
+        with FakeChatServer(latency=args.llm_latency, error_rate=args.llm_error_rate, reply=fake_reply) as server:
+            import openai
+            from contextlib import nullcontext, redirect_stdout
+            from metrics import configure_logging
+            configure_logging("WARNING" if args.quiet else os.getenv("LOG_LEVEL", "INFO").upper())
+            openai.api_base = server.api_base
+            openai.api_key = "bench"
+            with open(os.devnull, "w") if args.quiet else nullcontext() as output:
+                for name, run in (("news", run_news), ("reddit", run_reddit)):
+                    if args.pipeline not in (name, "both"):
+                        continue
+                    with redirect_stdout(output) if output else nullcontext():
+                        results[name] = run(db, args, symbols)
+                    print_report(name, results[name])
+            if args.news_fast and 'news' in results:
+                from score_report import load_comparisons, compare, print_report as print_scores
+                rows = load_comparisons()
+                results['news']['scores'] = compare(rows)
+                print()
+                print_scores(results['news']['scores'], rows, top=5)
+    finally:
+        from db_pool import close_pool
+        close_pool()
+        db.drop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to '{args.json}'.")
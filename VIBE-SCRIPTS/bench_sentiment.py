@@ -0,0 +1,74 @@
+import argparse
+import random
+import time
+from sentiment_engine import SentimentEngine, score_textblob
+
+FILLER = ("the company stock shares market quarter revenue guidance earnings analysts investors price "
+          "report growth outlook margin demand supply deal tesla apple is was a it to of and in on").split()
+SENTIMENT_WORDS = ("good bad great terrible strong weak amazing awful bullish bearish positive negative "
+                   "excellent poor solid disappointing impressive horrible better worse best worst").split()
+MODIFIERS = "very really extremely slightly incredibly absolutely quite".split()
+NEGATIONS = "not never no".split()
+PUNCTUATION = [",", ".", "!", "?", ";"]
+
+
+# Synthetic news/DD-style texts with modifiers, negations and punctuation
+def synthetic_texts(count, words_per_text, seed=7):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = []
+        for _ in range(words_per_text):
+            roll = rng.random()
+            if roll < 0.15:
+                words.append(rng.choice(SENTIMENT_WORDS))
+            elif roll < 0.22:
+                words.append(rng.choice(MODIFIERS))
+            elif roll < 0.27:
+                words.append(rng.choice(NEGATIONS))
+            elif roll < 0.35:
+                words.append(rng.choice(PUNCTUATION))
+            else:
+                words.append(rng.choice(FILLER))
+        texts.append(" ".join(words))
+    return texts
+
+
+def run(name, engine, texts, reference):
+    start = time.perf_counter()
+    results = engine.score(texts)
+    elapsed = time.perf_counter() - start
+    polarity_diff = max(abs(a['polarity'] - b['polarity']) for a, b in zip(results, reference))
+    subjectivity_diff = max(abs(a['subjectivity'] - b['subjectivity']) for a, b in zip(results, reference))
+    mismatches = sum(
+        1 for a, b in zip(results, reference)
+        if abs(a['polarity'] - b['polarity']) > 1e-9 or abs(a['subjectivity'] - b['subjectivity']) > 1e-9
+    )
+    print(f"{name:<28} {len(texts) / elapsed:>12,.0f} texts/s   "
+          f"max |dPolarity| {polarity_diff:.2e}   max |dSubjectivity| {subjectivity_diff:.2e}   "
+          f"{mismatches} texts differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the sentiment backends.")
+    parser.add_argument("--texts", type=int, default=2000, help="number of texts")
+    parser.add_argument("--words", type=int, default=120, help="words per synthetic text")
+    parser.add_argument("--file", help="score lines from this file instead of synthetic texts")
+    parser.add_argument("--processes", type=int, default=4, help="worker processes for the pooled runs")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()][:args.texts]
+    else:
+        texts = synthetic_texts(args.texts, args.words)
+
+    print(f"Scoring {len(texts)} texts")
+    reference = score_textblob(texts)
+    for backend in ("textblob", "lexicon"):
+        for processes in (0, args.processes):
+            engine = SentimentEngine(backend=backend, processes=processes)
+            engine.score(texts[:engine.chunk_size * max(processes, 1)])  # warm up workers and lexicon
+            label = f"{backend} ({'in-process' if not processes else f'{processes} processes'})"
+            run(label, engine, texts, reference)
+            engine.close()
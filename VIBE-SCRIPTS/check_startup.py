@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from vibe import COMMANDS
+
+# Import budget per subcommand in seconds (best of --runs fresh interpreters); prices needs pandas and pyarrow
+STARTUP_BUDGETS = {'news': 0.4, 'reddit': 0.4, 'prices': 1.0, 'daemon': 0.4, 'scores': 0.4}
+
+# Modules each subcommand must not load just by being imported; they belong to the stage that uses them
+HEAVY_MODULES = ('openai', 'aiohttp', 'yfinance', 'praw', 'prawcore', 'textblob', 'nltk', 'pandas', 'twelvedata')
+ALLOWED_MODULES = {
+    'prices': {'pandas'},  # the price store works on DataFrames
+}
+
+# Runs in a fresh interpreter: time the subcommand's import and report which heavy modules it loaded
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import vibe
+vibe.load(sys.argv[1])
+seconds = time.perf_counter() - started
+print(json.dumps({'seconds': seconds, 'modules': [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def measure(command, runs):
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE, command, *HEAVY_MODULES], cwd=here, check=True,
+                                capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    best = min(result['seconds'] for result in results)
+    modules = sorted({module for result in results for module in result['modules']})
+    return best, modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time and heavy imports of each vibe.py subcommand.")
+    parser.add_argument("--commands", default=",".join(COMMANDS), help="comma-separated subcommands")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per subcommand (best run counts)")
+    parser.add_argument("--budget", type=float, help="seconds allowed per import (default: STARTUP_BUDGETS)")
+    args = parser.parse_args()
+
+    failures = 0
+    for command in args.commands.split(','):
+        seconds, modules = measure(command, args.runs)
+        unexpected = [module for module in modules if module not in ALLOWED_MODULES.get(command, set())]
+        budget = args.budget or STARTUP_BUDGETS[command]
+        ok = seconds <= budget and not unexpected
+        failures += not ok
+        print(f"{command:>8}: {seconds * 1000:7.0f} ms (budget {budget * 1000:.0f} ms)"
+              f"{', loads ' + ', '.join(unexpected) if unexpected else ''}  {'ok' if ok else 'FAIL'}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,34 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+
+# Run `fetch(item)` on a bounded worker pool and yield (item, result) as each call finishes.
+# At most `max_workers * 2` calls are queued at once, so huge sweeps don't pre-submit everything.
+def fetch_concurrently(items, fetch, max_workers=8):
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+
+        def submit_next():
+            for item in items:
+                in_flight[executor.submit(fetch, item)] = item
+                return True
+            return False
+
+        for _ in range(max_workers * 2):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error("Error fetching %s: %s", item, e)
+                    result = None
+                submit_next()
+                yield item, result
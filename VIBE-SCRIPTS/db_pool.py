@@ -0,0 +1,76 @@
+import logging
+import os
+import weakref
+from contextlib import contextmanager
+from psycopg_pool import ConnectionPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pool sizing and health-check settings (override through the environment)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "4"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_seen_connections = weakref.WeakSet()
+_stats = {'created': 0, 'checkouts': 0, 'reused': 0}
+
+
+# Count every physical connection the pool opens
+def _on_connect(conn):
+    _stats['created'] += 1
+
+
+# Create the process-wide pool on first use
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            os.getenv("DATABASE_URL"),
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=max(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+            timeout=DB_POOL_TIMEOUT,
+            max_idle=DB_POOL_MAX_IDLE,
+            max_lifetime=DB_POOL_MAX_LIFETIME,
+            configure=_on_connect,
+            check=ConnectionPool.check_connection,
+            open=True,
+        )
+    return _pool
+
+
+# Borrow a connection; it is committed (or rolled back on error) and returned on exit
+@contextmanager
+def get_connection():
+    with get_pool().connection() as conn:
+        _stats['checkouts'] += 1
+        if conn in _seen_connections:
+            _stats['reused'] += 1
+        else:
+            _seen_connections.add(conn)
+        yield conn
+
+
+# Snapshot of the connection counters for this run
+def pool_stats():
+    return dict(_stats)
+
+
+# Run-level summary line
+def print_pool_stats():
+    stats = pool_stats()
+    logger.info("DB pool: %d connections created, %d reused across %d checkouts.",
+                stats['created'], stats['reused'], stats['checkouts'])
+
+
+# Close the pool at the end of a run
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
@@ -0,0 +1,97 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Default canned reply: a short "summary" built from the user prompt
+def echo_reply(messages):
+    user_text = messages[-1]['content'] if messages else ''
+    return f"Summary: {' '.join(user_text.split()[:20])}"
+
+
+# Local stand-in for the OpenAI chat-completions endpoint.
+# Point the ingesters at it with OPENAI_API_BASE=http://127.0.0.1:<port>/v1
+class FakeChatServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, reply=echo_reply):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reply = reply
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_base(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if random.random() < fake.error_rate:
+                    status = random.choice((429, 500, 503))
+                    self._send(status, {'error': {'message': f"fake error {status}", 'type': 'server_error'}})
+                    return
+                content = fake.reply(body.get('messages', []))
+                self._send(200, {
+                    'id': f"chatcmpl-fake-{fake.requests}",
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': body.get('model', 'fake'),
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                                 'finish_reason': 'stop'}],
+                    'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+                })
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake chat-completions server for local testing.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/5xx")
+    args = parser.parse_args()
+
+    fake = FakeChatServer(port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f"Fake chat-completions server listening on {fake.api_base}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,219 @@
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+from db_pool import print_pool_stats, close_pool
+from source_writer import SourceWriter
+from source_dedupe import KnownUrls
+from llm_engine import close_engine
+from sentiment_engine import close_sentiment_engine
+from near_duplicates import close_near_duplicate_index
+from symbol_index import get_symbol_index
+from reddit_cursor import RedditCursor
+from reddit_sources import REDDIT_SOURCES, parse_sources, scan_listing, source_key
+from scheduler import PollSchedule
+from staging_queue import open_default_staging
+from metrics import metrics, configure_logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Per-ticker news polling: interval bounds in seconds and the overall budget in polls per minute
+NEWS_POLL_MIN_SECONDS = float(os.getenv("NEWS_POLL_MIN_SECONDS", "300"))
+NEWS_POLL_MAX_SECONDS = float(os.getenv("NEWS_POLL_MAX_SECONDS", "86400"))
+NEWS_POLL_BUDGET = float(os.getenv("NEWS_POLL_BUDGET", "60"))
+# Per-subreddit polling (each poll is one listing scan, usually one or two Reddit requests)
+REDDIT_POLL_MIN_SECONDS = float(os.getenv("REDDIT_POLL_MIN_SECONDS", "60"))
+REDDIT_POLL_MAX_SECONDS = float(os.getenv("REDDIT_POLL_MAX_SECONDS", "3600"))
+REDDIT_POLL_BUDGET = float(os.getenv("REDDIT_POLL_BUDGET", "10"))
+# Polls in flight at once
+DAEMON_WORKERS = int(os.getenv("DAEMON_WORKERS", "8"))
+# Seconds between schedule log lines and metrics exports
+DAEMON_REPORT_SECONDS = float(os.getenv("DAEMON_REPORT_SECONDS", "300"))
+
+
+# Long-running ingester: one poll schedule for news tickers and one for subreddits, both adaptive.
+# Connections, the LLM engine, the sentiment models, the symbol index and the URL set stay warm between
+# polls. Polls run on a thread pool; their results are handled on the daemon's own thread.
+class IngestDaemon:
+    def __init__(self, news=True, reddit=True, sources_spec=REDDIT_SOURCES, workers=DAEMON_WORKERS):
+        self.news = news
+        self.reddit = reddit
+        self.sources = {source_key(source): source for source in parse_sources(sources_spec)} if reddit else {}
+        self.workers = workers
+        self.news_schedule = PollSchedule("news", NEWS_POLL_MIN_SECONDS, NEWS_POLL_MAX_SECONDS, NEWS_POLL_BUDGET)
+        self.reddit_schedule = PollSchedule("reddit", REDDIT_POLL_MIN_SECONDS, REDDIT_POLL_MAX_SECONDS,
+                                            REDDIT_POLL_BUDGET)
+        self.known_urls = KnownUrls()
+        self.staging = open_default_staging() if news else None
+        self.stop = threading.Event()
+        self._local = threading.local()
+        self._reported_at = time.monotonic()
+
+    # Add a news job for every stock not scheduled yet (new stocks are picked up by watermark refresh)
+    def refresh_tickers(self):
+        index = get_symbol_index()
+        index.refresh_if_stale()
+        now = time.monotonic()
+        for abbreviation, stock_id in index.items():
+            self.news_schedule.add((stock_id, abbreviation.upper()), now)
+
+    # PRAW clients aren't thread-safe, so each pool thread authenticates once and keeps its client
+    def _reddit_client(self):
+        if not hasattr(self._local, 'reddit'):
+            from reddit_api_SourcesTable import authenticate_reddit
+            self._local.reddit = authenticate_reddit()
+        return self._local.reddit
+
+    def _poll_news(self, ticker):
+        from news_api_SourcesTable import get_stock_news
+        return get_stock_news(ticker[1])
+
+    def _poll_reddit(self, key):
+        return scan_listing(self._reddit_client(), self.cursor, [self.sources[key]])[0]
+
+    def run(self):
+        from news_api_SourcesTable import NewsPipeline, get_source_origin_id, written_callback
+        from reddit_api_SourcesTable import process_posts
+
+        self.cursor = RedditCursor()
+        now = time.monotonic()
+        for key in self.sources:
+            self.reddit_schedule.add(key, now)
+
+        with SourceWriter(on_written=written_callback(self.staging) if self.staging else None) as writer, \
+                ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pipeline = None
+            if self.news:
+                source_origin_id = get_source_origin_id()
+                if source_origin_id:
+                    pipeline = NewsPipeline(source_origin_id, writer, self.staging, self.known_urls)
+                    pipeline.pump()  # resume what an interrupted run left staged
+                    self.refresh_tickers()
+                else:
+                    logger.error("News polling disabled: no source_origin_id for 'Yahoo Finance'.")
+            if not self.news_schedule and not self.reddit_schedule:
+                logger.error("Nothing to poll. Exiting.")
+                return
+            logger.info("Daemon started: %d tickers, %d subreddit sources.", len(self.news_schedule),
+                        len(self.reddit_schedule))
+
+            in_flight = {}  # future -> (schedule, key)
+            while not self.stop.is_set():
+                # Start every due poll there is room for
+                now = time.monotonic()
+                while len(in_flight) < self.workers:
+                    if pipeline and (key := self.news_schedule.pop_due(now)) is not None:
+                        in_flight[executor.submit(self._poll_news, key)] = (self.news_schedule, key)
+                    elif (key := self.reddit_schedule.pop_due(now)) is not None:
+                        in_flight[executor.submit(self._poll_reddit, key)] = (self.reddit_schedule, key)
+                    else:
+                        break
+
+                # Sleep until the next poll is due (if a worker is free) or one in flight finishes;
+                # wake at least every second while summaries are outstanding
+                dues = [due for due in (self.news_schedule.next_due(), self.reddit_schedule.next_due()) if due]
+                timeout = DAEMON_REPORT_SECONDS
+                if dues and len(in_flight) < self.workers:
+                    timeout = max(0.0, min(dues) - time.monotonic())
+                if pipeline and pipeline.pending:
+                    timeout = min(timeout, 1.0)
+                elif pipeline and pipeline.fast:
+                    # Fast-path articles become refinable as the writer commits them
+                    timeout = min(timeout, writer.max_delay)
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    done = ()
+                    self.stop.wait(timeout)
+
+                for future in done:
+                    schedule, key = in_flight.pop(future)
+                    self._handle(schedule, key, future, pipeline, process_posts)
+
+                if pipeline:
+                    pipeline.finish(block=False)
+                self._report()
+
+            logger.info("Stopping: waiting for %d polls and %d summaries in flight...", len(in_flight),
+                        len(pipeline.pending) if pipeline else 0)
+            for future in wait(in_flight).done:
+                schedule, key = in_flight.pop(future)
+                self._handle(schedule, key, future, pipeline, process_posts)
+            if pipeline:
+                pipeline.finish(block=True)
+            if self.sources:
+                self.cursor.save()
+
+    # Feed one finished poll into its pipeline and reschedule the source by how many new items it produced
+    def _handle(self, schedule, key, future, pipeline, process_posts):
+        try:
+            result = future.result()
+            if schedule is self.news_schedule:
+                new_items = pipeline.add(key[0], key[1], result or [])
+            else:
+                source = self.sources[key]
+                new_items = process_posts(result['posts'], source.source_origin, self.known_urls)
+                # Keep the cursor where it was if the posts weren't written, so the next poll fetches them again
+                if result['newest'] and new_items is not None:
+                    self.cursor.advance(key, *result['newest'])
+                    self.cursor.save()
+        except Exception as e:
+            metrics.inc("poll_failures", schedule=schedule.name)
+            logger.warning("%s poll for %s failed: %s", schedule.name, key, e)
+            new_items = None
+        metrics.inc("polls", schedule=schedule.name)
+        if new_items:
+            metrics.inc("poll_new_items", new_items, schedule=schedule.name)
+        schedule.record(key, new_items)
+
+    # Periodically pick up new stocks, retry failed summaries, log the schedules and export metrics
+    def _report(self):
+        if time.monotonic() - self._reported_at < DAEMON_REPORT_SECONDS:
+            return
+        self._reported_at = time.monotonic()
+        if self.news and self.news_schedule:
+            self.refresh_tickers()
+        if self.staging is not None:
+            self.staging.retry_failed()
+        self.news_schedule.log_summary()
+        self.reddit_schedule.log_summary()
+        metrics.export("daemon")
+
+
+# Command-line entry point (also `python vibe.py daemon`)
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Keep polling news and Reddit, each source on its own adaptive interval.")
+    parser.add_argument("--no-news", action="store_true", help="don't poll ticker news")
+    parser.add_argument("--no-reddit", action="store_true", help="don't poll Reddit")
+    parser.add_argument("--sources", default=REDDIT_SOURCES,
+                        help='subreddits as "subreddit:flair1|flair2:limit:source origin;..." (default: REDDIT_SOURCES)')
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    daemon = IngestDaemon(news=not args.no_news, reddit=not args.no_reddit, sources_spec=args.sources)
+    # Ctrl-C and SIGTERM (systemd, docker stop) stop new polls and let in-flight work finish
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: daemon.stop.set())
+    try:
+        with metrics.timer("run"):
+            daemon.run()
+    finally:
+        if daemon.staging is not None:
+            daemon.staging.close()
+        close_engine()
+        close_sentiment_engine()
+        close_near_duplicate_index()
+        print_pool_stats()
+        close_pool()
+        metrics.log_summary()
+        metrics.export("daemon")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from metrics import metrics
+
+# Cache location and eviction limits (set LLM_CACHE_PATH to "off" to disable the cache)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+
+# Run eviction once every this many writes
+EVICT_EVERY = 500
+
+logger = logging.getLogger(__name__)
+
+
+# Hash of (model, system prompt, user prompt, temperature, max tokens, response format) for a chat-completion
+# request; replies cut short by max_tokens or in another format are different replies
+def cache_key(request):
+    messages = request.get('messages', [])
+    system = "\n".join(m['content'] for m in messages if m['role'] == 'system')
+    user = "\n".join(m['content'] for m in messages if m['role'] != 'system')
+    payload = json.dumps([request.get('model'), system, user, request.get('temperature'), request.get('max_tokens'),
+                          request.get('response_format')], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# SQLite-backed cache of chat-completion replies with size and age eviction
+class LLMCache:
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, max_age_days=LLM_CACHE_MAX_AGE_DAYS):
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                reply TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used);")
+        self.evict()
+
+    # Cached reply text for a request, or None
+    def get(self, request):
+        key = cache_key(request)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT reply FROM llm_cache WHERE key = ? AND created_at >= ?;", (key, now - self.max_age)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.inc("llm_cache_misses")
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?;", (now, key))
+            self.hits += 1
+            metrics.inc("llm_cache_hits")
+            return row[0]
+
+    def put(self, request, reply):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, reply, created_at, last_used) VALUES (?, ?, ?, ?, ?);",
+                (cache_key(request), request.get('model'), reply, now, now),
+            )
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    # Drop expired entries, then the least recently used ones above max_entries
+    def evict(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM llm_cache WHERE created_at < ?;", (time.time() - self.max_age,))
+            self.conn.execute("""
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                );
+            """, (self.max_entries,))
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        logger.info("LLM cache: %d hits, %d misses (%.0f%% hit rate).", self.hits, self.misses, rate * 100)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# Default cache for the ingesters, or None when disabled
+def open_default_cache():
+    if LLM_CACHE_PATH.lower() in ("", "off", "none"):
+        return None
+    return LLMCache()
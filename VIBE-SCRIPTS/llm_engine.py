@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from dotenv import load_dotenv
+from llm_cache import open_default_cache
+from metrics import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Enrichment settings (override through the environment; OPENAI_API_BASE points at a fake server for testing)
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "30"))
+
+
+# 429s, 5xx responses and timeouts are worth retrying; anything else is final
+def is_retryable(error):
+    import openai
+    retryable_errors = (
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+        openai.error.APIConnectionError,
+        openai.error.Timeout,
+        asyncio.TimeoutError,
+    )
+    if isinstance(error, retryable_errors):
+        return True
+    status = getattr(error, 'http_status', None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+# Full-jitter exponential backoff
+def backoff_delay(attempt, base=LLM_BACKOFF_BASE, cap=LLM_BACKOFF_CAP):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# Asyncio chat-completion engine running on its own event-loop thread.
+# Callers on any thread submit requests to its queue and get back a concurrent.futures.Future
+# resolving to the reply text; at most `max_in_flight` requests are sent at once.
+# With a `cache` (see llm_cache.py), cached replies resolve immediately and new replies are stored.
+class EnrichmentEngine:
+    def __init__(self, max_in_flight=LLM_MAX_IN_FLIGHT, timeout=LLM_REQUEST_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                 cache=None):
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+        self.loop = asyncio.new_event_loop()
+        self.queue = None
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        # The loop thread failed before its workers started (e.g. openai or aiohttp missing)
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Queue one chat-completion request; returns a Future with the reply text.
+    # `validate(reply)` runs before the reply is cached: if it raises, the reply is not cached and the Future
+    # fails with its error, so a malformed reply is requested again next time instead of served from the cache.
+    def submit(self, validate=None, **request):
+        future = Future()
+        if self.cache is not None:
+            reply = self.cache.get(request)
+            if reply is not None:
+                future.set_result(reply)
+                return future
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (request, validate, future))
+        return future
+
+    # Let queued requests finish, then stop the loop thread
+    def close(self):
+        if self._thread.is_alive():
+            for _ in range(self.max_in_flight):
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+            self._thread.join()
+
+    def print_stats(self):
+        stats = self.stats
+        logger.info("LLM engine: %d requests, %d retries, %d failures.", stats['requests'], stats['retries'],
+                    stats['failures'])
+        if self.cache is not None:
+            self.cache.print_stats()
+
+    # Loop thread; _ready is set even if _serve() fails, so __init__ never waits forever
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            if self._ready.is_set():
+                logger.error("LLM engine stopped: %s", e)
+            self._error = e
+        finally:
+            self._ready.set()
+            self.loop.close()
+
+    # openai and aiohttp are imported here, on the engine's own thread, so runs that never call the LLM skip them
+    async def _serve(self):
+        import aiohttp
+        import openai
+        if openai.api_key is None:
+            openai.api_key = os.getenv("OPENAI_API_KEY")
+        self.queue = asyncio.Queue()
+        async with aiohttp.ClientSession() as session:
+            # Workers inherit this context, so every request reuses one HTTP session
+            openai.aiosession.set(session)
+            workers = [asyncio.create_task(self._worker()) for _ in range(self.max_in_flight)]
+            self._ready.set()
+            await asyncio.gather(*workers)
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            request, validate, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                reply = await self._complete(request)
+                if validate is not None:
+                    validate(reply)
+                if self.cache is not None:
+                    # SQLite write (and the occasional eviction) runs off the loop, so other requests keep going
+                    await asyncio.get_running_loop().run_in_executor(None, self.cache.put, request, reply)
+                future.set_result(reply)
+            except Exception as e:
+                self.stats['failures'] += 1
+                metrics.inc("llm_failures")
+                future.set_exception(e)
+
+    async def _complete(self, request):
+        import openai
+        attempt = 0
+        while True:
+            self.stats['requests'] += 1
+            metrics.inc("llm_requests")
+            started = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(
+                    openai.ChatCompletion.acreate(request_timeout=self.timeout, **request),
+                    self.timeout,
+                )
+                metrics.observe("llm_request_seconds", time.perf_counter() - started)
+                return response['choices'][0]['message']['content'].strip()
+            except Exception as e:
+                metrics.observe("llm_request_seconds", time.perf_counter() - started)
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt)
+                attempt += 1
+                self.stats['retries'] += 1
+                metrics.inc("llm_retries")
+                logger.warning("LLM request failed (%s). Retry %d/%d in %.1fs.", e, attempt, self.max_retries, delay)
+                await asyncio.sleep(delay)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+# Process-wide engine shared by the ingesters
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = EnrichmentEngine(cache=open_default_cache())
+        return _engine
+
+
+def close_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+            _engine.print_stats()
+            if _engine.cache is not None:
+                _engine.cache.close()
+            _engine = None
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Log level for the ingesters; per-item messages are DEBUG, so INFO (the default) keeps runs quiet
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Directory for <job>.json run reports and <job>.prom Prometheus textfiles ("off" disables both)
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+
+# Latency histogram buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger(__name__)
+
+
+# Leveled logging for the scripts' own output (call once from __main__)
+def configure_logging(level=LOG_LEVEL):
+    logging.basicConfig(level=getattr(logging, level, logging.INFO), format="%(asctime)s %(levelname)s %(message)s")
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    # Quantile estimated by linear interpolation inside the bucket that holds it
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if count and seen + count >= rank:
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+            lower = upper
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+# Process-wide counters and latency histograms, keyed by name and labels
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    # Time a block into the `stage_seconds` histogram
+    @contextmanager
+    def timer(self, stage, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'duration_seconds': time.time() - self.started,
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [{'name': name, 'labels': dict(labels), **histogram.summary()}
+                               for (name, labels), histogram in sorted(self.histograms.items())],
+            }
+
+    def prometheus(self, job):
+        lines = []
+
+        def label_text(labels, **extra):
+            items = [('job', job), *labels, *extra.items()]
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE vibe_{name}_total counter")
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f"vibe_{name}_total{label_text(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE vibe_{name} histogram")
+                for (histogram_name, labels), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"vibe_{name}_bucket{label_text(labels, le=bound)} {cumulative}")
+                    lines.append(f"vibe_{name}_bucket{label_text(labels, le='+Inf')} {histogram.count}")
+                    lines.append(f"vibe_{name}_sum{label_text(labels)} {histogram.sum}")
+                    lines.append(f"vibe_{name}_count{label_text(labels)} {histogram.count}")
+            lines.append("# TYPE vibe_last_run_timestamp_seconds gauge")
+            lines.append(f"vibe_last_run_timestamp_seconds{label_text(())} {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    # Write <job>.json and <job>.prom under `directory` (atomically, for the node-exporter textfile collector)
+    def export(self, job, directory=METRICS_DIR):
+        if directory.lower() in ("", "off", "none"):
+            return
+        try:
+            os.makedirs(directory, exist_ok=True)
+            for suffix, content in (("json", json.dumps({'job': job, **self.snapshot()}, indent=2)),
+                                    ("prom", self.prometheus(job))):
+                path = os.path.join(directory, f"{job}.{suffix}")
+                with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                    f.write(content)
+                os.replace(f"{path}.tmp", path)
+            logger.info("Metrics written to %s/%s.{json,prom}", directory, job)
+        except OSError as e:
+            logger.error("Error writing metrics: %s", e)
+
+    # One line per stage for the end of a run
+    def log_summary(self):
+        for item in self.snapshot()['histograms']:
+            labels = ",".join(f"{k}={v}" for k, v in item['labels'].items())
+            logger.info("%s{%s}: %d calls, p50 %.0f ms, p90 %.0f ms, p99 %.0f ms, total %.1fs", item['name'], labels,
+                        item['count'], item['p50'] * 1000, item['p90'] * 1000, item['p99'] * 1000, item['sum'])
+        for item in self.snapshot()['counters']:
+            labels = ",".join(f"{k}={v}" for k, v in item['labels'].items())
+            logger.info("%s{%s}: %s", item['name'], labels, item['value'])
+
+
+metrics = Metrics()
@@ -0,0 +1,256 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from metrics import metrics
+
+# Index location ("off" disables near-duplicate detection), how long after it was indexed a story can still be
+# matched, and the estimated Jaccard similarity of word shingles at which two texts count as the same story
+NEAR_DUP_INDEX_PATH = os.getenv("NEAR_DUP_INDEX_PATH", "near_dup_index.sqlite3")
+NEAR_DUP_WINDOW_HOURS = float(os.getenv("NEAR_DUP_WINDOW_HOURS", "72"))
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+# Texts with fewer words are only matched by canonical URL
+NEAR_DUP_MIN_WORDS = int(os.getenv("NEAR_DUP_MIN_WORDS", "5"))
+
+# MinHash signature length and LSH banding (16 bands of 4 rows find pairs down to ~0.5 similarity, which are
+# then checked against the threshold)
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Fixed seed: signatures are stored, so the hash functions must not change between runs
+PERM_SEED = 20240601
+
+# Query parameters that only track the click (ad and newsletter campaigns, Yahoo's consent redirect), never
+# which page it is; generic keys such as `s`, `src` or `ref` are kept because some sites use them for content
+TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|dclid|gbraid|wbraid|msclkid|yclid|mc_cid|mc_eid|_ga|_gl|igshid|"
+                             r"guccounter|guce_\w+)$", re.I)
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+logger = logging.getLogger(__name__)
+
+
+# URL with tracking parameters, fragments, "www." and trailing slashes removed and the query sorted
+def canonical_url(url):
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    host = (parts.hostname or '').lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not TRACKING_PARAMS.match(key))
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit(('https' if parts.scheme in ('http', 'https') else parts.scheme, host, path, urlencode(query), ''))
+
+
+def _stable_hash(text, size=8):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=size).digest(), 'big')
+
+
+# Word shingles of normalized text: bigrams for headlines, trigrams for longer posts
+def shingles(text):
+    words = WORD_RE.findall(text.lower())
+    if len(words) < NEAR_DUP_MIN_WORDS:
+        return set()
+    size = 3 if len(words) > 50 else 2
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+# Persistent MinHash/LSH index of recently written news titles and posts.
+# Each document keeps its MinHash signature and canonical URL; LSH band keys find candidate copies in a few
+# indexed lookups, and candidates are confirmed by the fraction of equal signature rows (the estimated
+# Jaccard similarity). check() returns the URL of the first copy, so callers can reuse its enrichment and
+# link to its `source` row instead of enriching again. A new story is only held in memory (pending) until
+# confirm() reports its `source` row committed, so the persistent index never points at a row that doesn't
+# exist. Both layers keep documents for NEAR_DUP_WINDOW_HOURS after they were indexed.
+class NearDuplicateIndex:
+    def __init__(self, kind, path=NEAR_DUP_INDEX_PATH, window_hours=NEAR_DUP_WINDOW_HOURS,
+                 threshold=NEAR_DUP_THRESHOLD):
+        self.kind = kind
+        self.doc, self.band = f"{kind}_doc", f"{kind}_band"
+        self.window = window_hours * 3600
+        self.threshold = threshold
+        self.stats = {'checked': 0, 'url_matches': 0, 'text_matches': 0, 'indexed': 0}
+        self._lock = threading.Lock()
+        self._perms = None
+        # Pending stories: url -> (canonical url, signature, indexed at), plus lookups by canonical url and band key
+        self._pending = {}
+        self._pending_urls = {}
+        self._pending_bands = {}
+        self._adds = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.doc} (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                canonical_url TEXT NOT NULL,
+                indexed_at REAL NOT NULL,
+                signature BLOB
+            );
+        """)
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {self.doc}_canonical_url ON {self.doc} (canonical_url);")
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.band} (key INTEGER NOT NULL, doc_id INTEGER NOT NULL);")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {self.band}_key ON {self.band} (key);")
+        self.evict()
+
+    # MinHash signature (NUM_PERM uint32 values) of a text, or None if it is too short to compare
+    def signature(self, text):
+        items = shingles(text or '')
+        if not items:
+            return None
+        import numpy as np
+        if self._perms is None:
+            rng = random.Random(PERM_SEED)
+            self._perms = (np.array([rng.randrange(1, 2 ** 32, 2) for _ in range(NUM_PERM)], dtype=np.uint64),
+                           np.array([rng.randrange(0, 2 ** 32) for _ in range(NUM_PERM)], dtype=np.uint64))
+        a, b = self._perms
+        hashes = np.fromiter((_stable_hash(item, 4) for item in items), dtype=np.uint64, count=len(items))
+        # (a * x + b) mod 2^32 with odd a permutes 32-bit values; the products fit in uint64
+        return ((a[:, None] * hashes[None, :] + b[:, None]) & 0xFFFFFFFF).min(axis=1).astype(np.uint32)
+
+    @staticmethod
+    def _band_keys(signature):
+        data = signature.tobytes()
+        width = ROWS * 4
+        return [_stable_hash(f"{band}:{data[band * width:(band + 1) * width].hex()}") - 2 ** 63
+                for band in range(BANDS)]
+
+    # URL of an earlier copy (written, or pending in this process), or None. A story with no earlier copy is
+    # held as pending until confirm(), so copies of it arriving in the meantime are matched too.
+    def check(self, url, text):
+        canonical = canonical_url(url)
+        signature = self.signature(text)
+        keys = self._band_keys(signature) if signature is not None else []
+        since = time.time() - self.window
+        with metrics.timer("near_dup_lookup"), self._lock:
+            self.stats['checked'] += 1
+            original = self._pending_urls.get(canonical)
+            if original is None:
+                row = self.conn.execute(f"SELECT url FROM {self.doc} WHERE canonical_url = ? AND indexed_at >= ? "
+                                        "ORDER BY id LIMIT 1;", (canonical, since)).fetchone()
+                original = row[0] if row else None
+            if original is not None:
+                self.stats['url_matches'] += 1
+                metrics.inc("near_duplicates", match="url")
+                return original
+
+            candidates = []
+            if keys:
+                candidates = self.conn.execute(f"""
+                    SELECT DISTINCT d.id, d.url, d.signature FROM {self.band} b JOIN {self.doc} d ON d.id = b.doc_id
+                    WHERE b.key IN ({', '.join('?' * len(keys))}) AND d.indexed_at >= ?
+                    ORDER BY d.id;
+                """, (*keys, since)).fetchall()
+                candidates = [(candidate_url, stored) for _, candidate_url, stored in candidates]
+                pending = {candidate_url for key in keys for candidate_url in self._pending_bands.get(key, ())}
+                candidates += [(candidate_url, self._pending[candidate_url][1].tobytes())
+                               for candidate_url in sorted(pending, key=lambda u: self._pending[u][2])]
+            if candidates:
+                import numpy as np
+                for candidate_url, stored in candidates:
+                    if float((np.frombuffer(stored, dtype=np.uint32) == signature).mean()) >= self.threshold:
+                        self.stats['text_matches'] += 1
+                        metrics.inc("near_duplicates", match="text")
+                        return candidate_url
+
+            if url not in self._pending:
+                self._pending[url] = (canonical, signature, time.time())
+                self._pending_urls.setdefault(canonical, url)
+                for key in keys:
+                    self._pending_bands.setdefault(key, set()).add(url)
+            return None
+
+    # SourceWriter callback: stories whose `source` row is now committed move from pending to the index
+    # (other URLs, such as score updates or duplicates, are ignored)
+    def confirm(self, urls):
+        with self._lock:
+            docs = [(url, *self._pop_pending(url)) for url in urls if url in self._pending]
+            if not docs:
+                return
+            self.conn.execute("BEGIN;")
+            try:
+                for url, canonical, signature, indexed_at in docs:
+                    doc_id = self.conn.execute(
+                        f"INSERT INTO {self.doc} (url, canonical_url, indexed_at, signature) VALUES (?, ?, ?, ?);",
+                        (url, canonical, indexed_at, signature.tobytes() if signature is not None else None)).lastrowid
+                    if signature is not None:
+                        self.conn.executemany(f"INSERT INTO {self.band} (key, doc_id) VALUES (?, ?);",
+                                              [(key, doc_id) for key in self._band_keys(signature)])
+                self.conn.execute("COMMIT;")
+            except Exception:
+                self.conn.execute("ROLLBACK;")
+                raise
+            self.stats['indexed'] += len(docs)
+            self._adds += len(docs)
+            due = self._adds >= 1000
+            if due:
+                self._adds = 0
+        if due:
+            self.evict()
+
+    # Remove a pending story and return (canonical url, signature, indexed at); caller holds the lock
+    def _pop_pending(self, url):
+        canonical, signature, indexed_at = self._pending.pop(url)
+        if self._pending_urls.get(canonical) == url:
+            del self._pending_urls[canonical]
+        if signature is not None:
+            for key in self._band_keys(signature):
+                urls = self._pending_bands.get(key)
+                if urls is not None:
+                    urls.discard(url)
+                    if not urls:
+                        del self._pending_bands[key]
+        return canonical, signature, indexed_at
+
+    # Drop documents (and their band keys) indexed longer ago than the window, including pending stories that
+    # were never written (e.g. posts without symbols)
+    def evict(self):
+        cutoff = time.time() - self.window
+        with self._lock:
+            for url in [url for url, (_, _, indexed_at) in self._pending.items() if indexed_at < cutoff]:
+                self._pop_pending(url)
+            self.conn.execute(f"DELETE FROM {self.band} WHERE doc_id IN (SELECT id FROM {self.doc} WHERE indexed_at < ?);",
+                              (cutoff,))
+            self.conn.execute(f"DELETE FROM {self.doc} WHERE indexed_at < ?;", (cutoff,))
+
+    def print_stats(self):
+        logger.info("Near-duplicate index (%s): %d checked, %d canonical-URL matches, %d text matches, %d indexed.",
+                    self.kind, self.stats['checked'], self.stats['url_matches'], self.stats['text_matches'],
+                    self.stats['indexed'])
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+# Process-wide index for one kind of document ("news" or "reddit"; each has its own tables, so an article is
+# never linked to a post), or None when NEAR_DUP_INDEX_PATH is "off"
+def get_near_duplicate_index(kind):
+    if NEAR_DUP_INDEX_PATH.lower() in ("", "off", "none"):
+        return None
+    with _index_lock:
+        if kind not in _indexes:
+            _indexes[kind] = NearDuplicateIndex(kind)
+        return _indexes[kind]
+
+
+def close_near_duplicate_index():
+    with _index_lock:
+        for index in _indexes.values():
+            index.print_stats()
+            index.close()
+        _indexes.clear()
@@ -1,53 +1,89 @@
-import yfinance as yf
-import openai
-from textblob import TextBlob
-import psycopg
+import argparse
+import logging
+from concurrent.futures import wait, FIRST_COMPLETED
 from dotenv import load_dotenv
+from db_pool import get_connection, print_pool_stats, close_pool
+from source_dedupe import KnownUrls
+from source_writer import SourceWriter
+from concurrent_fetch import fetch_concurrently
+from rate_limit import HostRateLimiter
+from staging_queue import (FETCHED, SUMMARIZING, SUMMARIZED, SCORED, WRITING, REFINE, REFINING, REFINED, UPDATING,
+                           REFINE_FAILED, WRITTEN_STAGES, open_default_staging)
+from ticker_leases import TickerLeases, parse_shard
+from near_duplicates import get_near_duplicate_index, close_near_duplicate_index
+from llm_engine import get_engine, close_engine
+from sentiment_engine import get_sentiment_engine, close_sentiment_engine
+from metrics import metrics, configure_logging
 import os
 from datetime import datetime, timedelta
 
 load_dotenv()
 
-# OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
+
+# yfinance (and the pandas it pulls in) is imported on the first fetch, so runs with no tickers skip it
+yf = None
+
+# Fetch stage: worker pool size and per-host request cap (requests per second)
+NEWS_FETCH_WORKERS = int(os.getenv("NEWS_FETCH_WORKERS", "8"))
+NEWS_FETCH_RATE = float(os.getenv("NEWS_FETCH_RATE", "4"))
+YAHOO_NEWS_HOST = "query2.finance.yahoo.com"
+# Summaries requested at once (the rest of the fetched articles wait in the staging queue) and summaries per
+# sentiment batch
+NEWS_SUMMARY_WINDOW = int(os.getenv("NEWS_SUMMARY_WINDOW", "64"))
+NEWS_SCORE_BATCH = int(os.getenv("NEWS_SCORE_BATCH", "256"))
+# Fast path: write each article with its title's sentiment right away and replace the scores with the
+# summary's once the LLM answers (off by default; `news --fast` turns it on for one run)
+NEWS_FAST_PATH = os.getenv("NEWS_FAST_PATH", "0").lower() in ("1", "true", "yes", "on")
+host_limiter = HostRateLimiter(NEWS_FETCH_RATE)
 
 def get_source_origin_id(source_origin_name="Yahoo Finance"):
     try:
-        with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
+        with get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT id FROM source_origin WHERE name = %s;", (source_origin_name,))
                 result = cur.fetchone()
                 if result:
-                    print(f"Retrieved ID {result[0]} for source '{source_origin_name}'.")
+                    logger.info("Retrieved ID %s for source '%s'.", result[0], source_origin_name)
                     return result[0]
                 else:
-                    print(f"Source '{source_origin_name}' not found.")
+                    logger.error("Source '%s' not found.", source_origin_name)
                     return None
     except Exception as e:
-        print(f"Error fetching source_origin_id: {e}")
+        logger.error("Error fetching source_origin_id: %s", e)
         return None
 
-def get_all_stock_tickers():
+# Every stock, or only shard I of N ((I, N), by stock id) when several workers split the sweep statically
+def get_all_stock_tickers(shard=None):
     try:
-        with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
+        with get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT id, abbreviation FROM stock;")
+                if shard:
+                    cur.execute("SELECT id, abbreviation FROM stock WHERE id %% %s = %s;", (shard[1], shard[0]))
+                else:
+                    cur.execute("SELECT id, abbreviation FROM stock;")
                 tickers = [(row[0], row[1]) for row in cur.fetchall()]
-                print(f"Retrieved {len(tickers)} stock tickers from the database.")
+                logger.info("Retrieved %d stock tickers from the database.", len(tickers))
                 return tickers
     except Exception as e:
-        print(f"Error fetching stock tickers: {e}")
+        logger.error("Error fetching stock tickers: %s", e)
         return []
 
 def get_stock_news(stock_ticker):
+    global yf
+    if yf is None:
+        import yfinance as yf
     ticker_data = yf.Ticker(stock_ticker)
     try:
-        news = ticker_data.news
+        host_limiter.acquire(YAHOO_NEWS_HOST)
+        with metrics.timer("fetch_news"):
+            news = ticker_data.news
         if not news:
-            print(f"No news found for ticker '{stock_ticker}'.")
+            logger.debug("No news found for ticker '%s'.", stock_ticker)
             return []
     except Exception as e:
-        print(f"Error fetching news for ticker '{stock_ticker}': {e}")
+        metrics.inc("news_fetch_failures")
+        logger.warning("Error fetching news for ticker '%s': %s", stock_ticker, e)
         return []
 
     thirty_days_ago = datetime.now() - timedelta(days=30)
@@ -59,7 +95,7 @@ def get_stock_news(stock_ticker):
 
         title = article.get('title', 'No Title')
         link = article.get('link', 'No Link')
-        print(f"Found Article - Title: {title}, Published: {publish_time}, Link: {link}")
+        logger.debug("Found Article - Title: %s, Published: %s, Link: %s", title, publish_time, link)
 
         articles.append({
             'title': title,
@@ -67,9 +103,11 @@ def get_stock_news(stock_ticker):
             'publish_time': publish_time
         })
 
+    metrics.inc("news_articles_fetched", len(articles))
     return articles
 
-def summarize_article(title, content=''):
+# Chat-completion request for an article summary
+def summary_request(title, content=''):
     prompt = (
         "Please provide a concise summary of the following article with no subjectivity or bias on how the stock will move:\n\n"
         f"Title: {title}\n\n"
@@ -78,127 +116,277 @@ def summarize_article(title, content=''):
         prompt += f"Content: {content}\n\n"
     prompt += "Summary:"
 
+    return {
+        'model': "gpt-4o-mini",
+        'messages': [
+            {"role": "system",
+             "content": "You are a helpful assistant that summarizes news articles with no subjectivity or bias on how the stock will move."},
+            {"role": "user", "content": prompt}
+        ],
+        'temperature': 0.3,
+        'max_tokens': 150
+    }
+
+# Summary text from a finished enrichment future
+def summary_result(future):
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system",
-                 "content": "You are a helpful assistant that summarizes news articles with no subjectivity or bias on how the stock will move."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=150
-        )
-        summary = response['choices'][0]['message']['content'].strip()
+        summary = future.result()
         return summary if summary else "No summary available."
     except Exception as e:
-        print(f"Error during summarization: {e}")
+        metrics.inc("summary_failures")
+        logger.error("Error during summarization: %s", e)
         return "No summary available."
 
+def summarize_article(title, content=''):
+    return summary_result(get_engine().submit(**summary_request(title, content)))
+
 def analyze_sentiment(text):
-    blob = TextBlob(text)
-    sentiment = blob.sentiment
-    if sentiment.polarity > 0:
-        sentiment_category = 'Positive'
-    elif sentiment.polarity < 0:
-        sentiment_category = 'Negative'
-    else:
-        sentiment_category = 'Neutral'
-    return {
-        'polarity': sentiment.polarity,
-        'subjectivity': sentiment.subjectivity,
-        'sentiment_category': sentiment_category
-    }
+    return get_sentiment_engine().score([text])[0]
 
-def insert_source_record(url, source_origin_id, sentiment_score, opinion_score, date_fetched, stock_id):
-    try:
-        with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO source (url, source_origin_id, predicted_sentiment_score, predicted_opinion_score, date_fetched)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id;
-                """, (url, source_origin_id, sentiment_score, opinion_score, date_fetched))
-                source_id = cur.fetchone()[0]
-
-                cur.execute("""
-                INSERT INTO stocks_source (stock_id, source_id)
-                VALUES (%s, %s)
-                """, (stock_id, source_id))
-
-                conn.commit()
-                print(f"Inserted source record with ID: {source_id}")
-                return source_id
-    except psycopg.errors.UniqueViolation:
-        print(f"Duplicate entry found for URL '{url}'. Skipping insertion.")
-        return None
-    except Exception as e:
-        print(f"Error inserting source record for URL '{url}': {e}")
-        return None
+# Per-URL state for a news sweep, shared by every ticker. Fetched articles go into the durable staging
+# queue, and pump() moves them through summarize -> score -> write in bounded batches, committing each
+# step, so a restart resumes where the last run stopped. Each new URL is summarized once and repeats are
+# linked to it, as are syndicated copies of a story under another URL (same canonical URL or near-identical
+# title): the ticker is linked to the first copy's `source` row, which carries its summary and sentiment.
+# With `fast`, articles are written with their title's sentiment first and the summary-based scores
+# follow as an update. main() uses one per run; the ingest daemon keeps one for its whole lifetime.
+class NewsPipeline:
+    def __init__(self, source_origin_id, writer, staging, known_urls=None, near_duplicates=None,
+                 fast=NEWS_FAST_PATH):
+        self.source_origin_id = source_origin_id
+        self.writer = writer  # created with on_written=written_callback(staging)
+        self.staging = staging
+        # URLs already in `source`, shared by every ticker
+        self.known_urls = known_urls if known_urls is not None else KnownUrls()
+        # Recent stories by canonical URL and title (None when NEAR_DUP_INDEX_PATH is off)
+        self.near_duplicates = near_duplicates if near_duplicates is not None else get_near_duplicate_index("news")
+        self.fast = fast
+        self.pending = {}  # summary future -> (url, is a refinement)
 
-def main():
-    # Get all stock tickers from the database
-    stock_tickers = get_all_stock_tickers()
-    if not stock_tickers:
-        print("No stock tickers found. Exiting.")
-        return
+    # Stage one ticker's fetched articles; returns how many were new
+    def add(self, ticker_id, ticker, articles):
+        logger.debug("Fetched %d articles for ticker: %s (ID: %s)", len(articles), ticker, ticker_id)
+
+        # Resolve every candidate URL for this ticker in one round trip (and one staging lookup)
+        urls = [article['link'] for article in articles]
+        new_urls = set(self.known_urls.filter_new(urls))
+        staged = self.staging.stages(urls)
+
+        queued = 0
+        for article in articles:
+            url = article['link']
+            title = article['title']
+
+            logger.debug("Processing article: %s", title)
+
+            # Already staged for another ticker (in this run or an interrupted one): link, don't re-summarize
+            stage = staged.get(url)
+            if stage:
+                metrics.inc("duplicate_articles", reason="staged")
+                logger.debug("Article already staged for another ticker. Linking %s to URL: %s", ticker, url)
+                self._link(url, ticker_id, stage)
+                continue
 
+            # Already in the database from an earlier run: only add the missing stock link
+            if url not in new_urls or url in self.known_urls:
+                metrics.inc("duplicate_articles", reason="in_database")
+                logger.debug("Article already exists in the database. Linking %s to URL: %s", ticker, url)
+                self.writer.add_links(url, [ticker_id])
+                continue
+
+            # Another copy of the same story, staged or written recently: link to it instead of summarizing
+            if self.near_duplicates is not None:
+                original = self.near_duplicates.check(url, title)
+                if original and original != url:
+                    metrics.inc("duplicate_articles", reason="near_duplicate")
+                    logger.debug("Article '%s' duplicates %s. Linking %s to it.", title, original, ticker)
+                    self._link(original, ticker_id, self.staging.stages([original]).get(original))
+                    continue
+            self.known_urls.add(url)
+
+            self.staging.put(url, title, article.get('publish_time'), self.source_origin_id, [ticker_id])
+            staged[url] = FETCHED
+            queued += 1
+
+        self.pump()
+        return queued
+
+    # Link a stock to an article that is staged (at `stage`) or already written (stage None)
+    def _link(self, url, ticker_id, stage):
+        if stage and stage not in WRITTEN_STAGES:
+            self.staging.add_stocks(url, [ticker_id])
+        if stage in (None, WRITING) or stage in WRITTEN_STAGES:
+            self.writer.add_links(url, [ticker_id])
+
+    # Advance every stage as far as it can go without waiting
+    def pump(self):
+        # Store the summaries that came back; failed requests wait in the queue for the next run
+        summaries, refined, failed, refine_failed = {}, {}, [], []
+        for future in [future for future in self.pending if future.done()]:
+            url, refining = self.pending.pop(future)
+            if future.exception() is None:
+                (refined if refining else summaries)[url] = future.result() or "No summary available."
+            else:
+                metrics.inc("summary_failures")
+                logger.error("Error during summarization of %s: %s", url, future.exception())
+                (refine_failed if refining else failed).append(url)
+        self.staging.set_summaries(summaries)
+        self.staging.set_summaries(refined, stage=REFINED)
+        self.staging.set_failed(failed)
+        self.staging.set_failed(refine_failed, stage=REFINE_FAILED)
+
+        if self.fast:
+            # Fast path: score titles locally and write right away; the summary comes later as a refinement
+            while True:
+                rows = self.staging.take(FETCHED, FETCHED, NEWS_SCORE_BATCH)
+                if not rows:
+                    break
+                with metrics.timer("title_score"):
+                    sentiments = get_sentiment_engine().score([row['title'] for row in rows])
+                self.staging.set_title_scores({row['url']: result for row, result in zip(rows, sentiments)})
+        else:
+            # Request more summaries, keeping at most NEWS_SUMMARY_WINDOW in flight
+            for row in self.staging.take(FETCHED, SUMMARIZING, NEWS_SUMMARY_WINDOW - len(self.pending)):
+                self.pending[get_engine().submit(**summary_request(row['title']))] = (row['url'], False)
+
+        # Refinements of written articles use whatever room in the window new articles leave
+        for row in self.staging.take(REFINE, REFINING, NEWS_SUMMARY_WINDOW - len(self.pending)):
+            self.pending[get_engine().submit(**summary_request(row['title']))] = (row['url'], True)
+
+        # Load the sentiment models while the first summaries are in flight
+        if self.pending:
+            get_sentiment_engine().warm()
+
+        # Sentiment analysis on finished summaries, one batch at a time
+        while True:
+            rows = self.staging.take(SUMMARIZED, SUMMARIZED, NEWS_SCORE_BATCH)
+            if not rows:
+                break
+            sentiments = get_sentiment_engine().score([row['summary'] for row in rows])
+            for row, sentiment_result in zip(rows, sentiments):
+                logger.debug("Summary for '%s': %s | Polarity: %s, Subjectivity: %s, Sentiment Category: %s",
+                             row['title'], row['summary'], sentiment_result['polarity'],
+                             sentiment_result['subjectivity'], sentiment_result['sentiment_category'])
+            self.staging.set_scores({row['url']: result for row, result in zip(rows, sentiments)})
+
+        # Refined scores replace the title scores in `source`
+        while True:
+            rows = self.staging.take(REFINED, UPDATING, NEWS_SCORE_BATCH)
+            if not rows:
+                break
+            sentiments = get_sentiment_engine().score([row['summary'] for row in rows])
+            self.staging.set_scores({row['url']: result for row, result in zip(rows, sentiments)}, stage=UPDATING)
+            for row, result in zip(rows, sentiments):
+                logger.debug("Refined '%s': polarity %s -> %s, subjectivity %s -> %s", row['title'], row['polarity'],
+                             result['polarity'], row['subjectivity'], result['subjectivity'])
+                self.writer.update_scores(row['url'], result['polarity'], result['subjectivity'])
+
+        # Queue scored articles for the batched insert into source / stocks_source
+        while True:
+            rows = self.staging.take(SCORED, WRITING, NEWS_SCORE_BATCH)
+            if not rows:
+                break
+            for row in rows:
+                self.writer.add(
+                    url=row['url'],
+                    source_origin_id=row['source_origin_id'],
+                    sentiment_score=row['polarity'],
+                    opinion_score=row['subjectivity'],
+                    date_fetched=datetime.now(),
+                    stock_ids=row['stock_ids']
+                )
+
+    # Score and write finished summaries; block=True waits until every staged article is queued for writing
+    # (and, on the fast path, until every refinement is queued)
+    def finish(self, block):
+        self.pump()
+        while block:
+            if not self.pending:
+                # Fast-path articles only become refinable once their `source` row is committed
+                self.writer.flush()
+                self.pump()
+                if not self.pending:
+                    break
+            wait(self.pending, return_when=FIRST_COMPLETED)
+            self.pump()
+
+# SourceWriter callback for the news pipeline: committed articles leave the staging queue and become
+# matchable in the near-duplicate index
+def written_callback(staging, near_duplicates=None):
+    near_duplicates = near_duplicates if near_duplicates is not None else get_near_duplicate_index("news")
+
+    def on_written(urls):
+        staging.mark_written(urls)
+        if near_duplicates is not None:
+            near_duplicates.confirm(urls)
+    return on_written
+
+# One sweep over every ticker. With `shard` only that hash partition is swept; with `leases` (a TickerLeases)
+# tickers are claimed from the shared lease table batch by batch, so any number of workers split the sweep.
+def main(shard=None, leases=None, fast=NEWS_FAST_PATH):
     # Get the source_origin_id for 'Yahoo Finance'
     source_origin_id = get_source_origin_id()
     if not source_origin_id:
-        print("Cannot proceed without a valid source_origin_id for 'Yahoo Finance'.")
+        logger.error("Cannot proceed without a valid source_origin_id for 'Yahoo Finance'.")
         return
 
-    for tkr in stock_tickers:
-        ticker_id = tkr[0]
-        ticker = tkr[1]
-        print(f"\nFetching news for ticker: {ticker} (ID: {ticker_id})")
-        articles = get_stock_news(ticker)
+    if leases is not None:
+        stock_tickers = leases.tickers()
+    else:
+        # Get all stock tickers from the database
+        stock_tickers = get_all_stock_tickers(shard)
+        if not stock_tickers:
+            logger.error("No stock tickers found. Exiting.")
+            return
 
-        for article in articles:
-            url = article['link']
-            title = article['title']
+    staging = open_default_staging()
+    try:
+        with SourceWriter(on_written=written_callback(staging)) as writer:
+            pipeline = NewsPipeline(source_origin_id, writer, staging, fast=fast)
 
-            print(f"\nProcessing article: {title}")
-
-            # Check if the article has already been processed
-            try:
-                with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
-                    with conn.cursor() as cur:
-                        cur.execute("SELECT id FROM source WHERE url = %s;", (url,))
-                        if cur.fetchone():
-                            print(f"Article already exists in the database. Skipping URL: {url}")
-                            continue
-            except Exception as e:
-                print(f"Error checking existing URL '{url}': {e}")
-                continue
+            # Resume whatever an interrupted run left in the staging queue
+            pipeline.pump()
 
-            # Summarize the article
-            summary = summarize_article(title)
-            print(f"Summary:\n{summary}")
-
-            # Sentiment analysis on the summary
-            sentiment_result = analyze_sentiment(summary)
-            print("--- Sentiment Analysis ---")
-            print(f"Polarity: {sentiment_result['polarity']}")
-            print(f"Subjectivity: {sentiment_result['subjectivity']}")
-            print(f"Sentiment Category: {sentiment_result['sentiment_category']}")
-
-            # Insert into source table
-            date_fetched = datetime.now()
-            source_id = insert_source_record(
-                url=url,
-                source_origin_id=source_origin_id,
-                sentiment_score=sentiment_result['polarity'],
-                opinion_score=sentiment_result['subjectivity'],
-                date_fetched=date_fetched,
-                stock_id=ticker_id
-            )
-
-            if source_id:
-                print(f"Successfully inserted article with ID: {source_id}")
+            # Fetch tickers on a worker pool; each ticker's articles are handled as soon as they arrive
+            fetched = fetch_concurrently(stock_tickers, lambda tkr: get_stock_news(tkr[1]),
+                                         max_workers=NEWS_FETCH_WORKERS)
+            for tkr, articles in fetched:
+                pipeline.add(tkr[0], tkr[1], articles or [])
+                if leases is not None:
+                    leases.done(tkr[0])
+
+            pipeline.finish(block=True)
+    finally:
+        staging.close()
+
+# Command-line entry point (also `python vibe.py news`)
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest Yahoo Finance news for every stock into the VIBE database.")
+    sharding = parser.add_mutually_exclusive_group()
+    sharding.add_argument("--shard", type=parse_shard, metavar="I/N",
+                          help="only sweep stocks with id %% N == I (run one worker per shard)")
+    sharding.add_argument("--lease", action="store_true",
+                          help="claim tickers from the shared ticker_lease table, so any number of workers split the sweep")
+    parser.add_argument("--fast", action="store_true", default=NEWS_FAST_PATH,
+                        help="write title scores right away and refine them with LLM summaries in the background "
+                             "(default: NEWS_FAST_PATH)")
+    args = parser.parse_args(argv)
+    configure_logging()
+    try:
+        with metrics.timer("run"):
+            if args.lease:
+                with TickerLeases() as leases:
+                    main(leases=leases, fast=args.fast)
             else:
-                print(f"Failed to insert article: {url}")
+                main(shard=args.shard, fast=args.fast)
+    finally:
+        close_engine()
+        close_sentiment_engine()
+        close_near_duplicate_index()
+        print_pool_stats()
+        close_pool()
+        metrics.log_summary()
+        metrics.export("news")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
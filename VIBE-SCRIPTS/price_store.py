@@ -0,0 +1,253 @@
+import argparse
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from dotenv import load_dotenv
+from rate_limit import RateLimiter
+from db_pool import get_connection
+from metrics import configure_logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# One Arrow IPC file per interval/symbol under this directory
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", "price_store")
+# Symbols per multi-symbol Twelve Data request (the API allows up to 120)
+PRICE_BATCH_SIZE = int(os.getenv("PRICE_BATCH_SIZE", "8"))
+# API credits per minute for the plan (each symbol in a request costs one credit)
+TWELVE_CREDITS_PER_MINUTE = float(os.getenv("TWELVE_CREDITS_PER_MINUTE", "8"))
+# Twelve Data returns at most this many bars per symbol and request; longer windows are split
+PRICE_MAX_BARS = 5000
+
+INTERVAL_SECONDS = {
+    '1min': 60, '5min': 300, '15min': 900, '30min': 1800, '45min': 2700,
+    '1h': 3600, '2h': 7200, '4h': 14400, '8h': 28800,
+    '1day': 86400, '1week': 604800, '1month': 2678400,
+}
+
+PRICE_SCHEMA = pa.schema([
+    ('datetime', pa.timestamp('s')),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.float64()),
+])
+
+
+# Local OHLCV store on top of the Twelve Data client.
+# Each symbol/interval is one uncompressed Arrow IPC file whose metadata records the contiguous UTC
+# range already fetched, so a sync only requests the missing edges of a window. Symbols needing the
+# same window share multi-symbol requests, and reads memory-map the file so numeric columns reach
+# pandas without copying.
+class PriceStore:
+    def __init__(self, path=PRICE_STORE_DIR, client=None, credits_per_minute=TWELVE_CREDITS_PER_MINUTE,
+                 batch_size=PRICE_BATCH_SIZE):
+        self.path = path
+        self.client = client
+        self.batch_size = batch_size
+        self.credits = RateLimiter(credits_per_minute / 60.0, burst=credits_per_minute)
+        self.requests = 0
+        self.bars_fetched = 0
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if self.client is None:
+            from twelvedata import TDClient
+            self.client = TDClient(apikey=os.getenv("TWELVE_API_KEY"))
+        return self.client
+
+    def _file(self, symbol, interval):
+        return os.path.join(self.path, interval, f"{symbol.upper().replace('/', '_')}.arrow")
+
+    # Memory-mapped table for a symbol, or None
+    def _table(self, symbol, interval):
+        path = self._file(symbol, interval)
+        if not os.path.exists(path):
+            return None
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+    # (start, end) already fetched for a symbol, or None
+    def coverage(self, symbol, interval):
+        path = self._file(symbol, interval)
+        if not os.path.exists(path):
+            return None
+        with pa.memory_map(path, 'r') as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        if b'covered_start' not in metadata:
+            return None
+        return (datetime.fromisoformat(metadata[b'covered_start'].decode()),
+                datetime.fromisoformat(metadata[b'covered_end'].decode()))
+
+    # Parts of [start, end] not covered yet, each split to fit one request
+    def missing(self, symbol, interval, start, end):
+        covered = self.coverage(symbol, interval)
+        if covered is None:
+            gaps = [(start, end)]
+        else:
+            gaps = []
+            if start < covered[0]:
+                gaps.append((start, covered[0]))
+            if end > covered[1]:
+                gaps.append((covered[1], end))
+        bar = timedelta(seconds=INTERVAL_SECONDS[interval])
+        step = bar * PRICE_MAX_BARS
+        windows = []
+        for gap_start, gap_end in gaps:
+            if gap_end - gap_start < bar:
+                continue  # nothing new can have closed yet
+            while gap_start < gap_end:
+                windows.append((gap_start, min(gap_start + step, gap_end)))
+                gap_start += step
+        return windows
+
+    # Fetch whatever is missing for these symbols between start and end (UTC, end defaults to now)
+    def sync(self, symbols, interval, start, end=None):
+        if interval not in INTERVAL_SECONDS:
+            raise ValueError(f"Unknown interval '{interval}' (expected one of {list(INTERVAL_SECONDS)})")
+        # The newest bar may still be forming; leave it uncovered so the next sync refetches it
+        latest = datetime.utcnow() - timedelta(seconds=INTERVAL_SECONDS[interval])
+        end = min(end or latest, latest).replace(microsecond=0)
+        start = start.replace(microsecond=0)
+        symbols = sorted({symbol.upper() for symbol in symbols})
+
+        # Later windows depend on earlier ones (coverage must stay contiguous), so fill in rounds;
+        # a symbol whose window comes back empty or failed is left for the next sync
+        failed = set()
+        while True:
+            by_window = {}
+            for symbol in symbols:
+                windows = self.missing(symbol, interval, start, end) if symbol not in failed else []
+                if windows:
+                    by_window.setdefault(windows[0], []).append(symbol)
+            if not by_window:
+                break
+            for window, window_symbols in by_window.items():
+                for offset in range(0, len(window_symbols), self.batch_size):
+                    failed.update(self._fetch(window_symbols[offset:offset + self.batch_size], interval, *window))
+        if failed:
+            logger.warning("Could not fetch %s prices for %d symbols: %s", interval, len(failed),
+                           ', '.join(sorted(failed)))
+
+    # One request for several symbols; returns the symbols that got nothing back
+    def _fetch(self, symbols, interval, start, end):
+        for _ in symbols:
+            self.credits.acquire()
+        try:
+            result = self._client().time_series(
+                symbol=symbols,
+                interval=interval,
+                start_date=start.strftime("%Y-%m-%d %H:%M:%S"),
+                end_date=end.strftime("%Y-%m-%d %H:%M:%S"),
+                outputsize=PRICE_MAX_BARS,
+                timezone="UTC",
+                order="asc"
+            ).as_json()
+        except Exception as e:
+            logger.error("Error fetching %s prices for %s (%s - %s): %s", interval, ', '.join(symbols), start, end, e)
+            return symbols
+        with self._lock:
+            self.requests += 1
+
+        # A single symbol comes back as its rows; several as {symbol: rows}, without symbols that failed
+        rows_by_symbol = {symbols[0]: result} if len(symbols) == 1 else {k.upper(): v for k, v in result.items()}
+        failed = []
+        for symbol in symbols:
+            if symbol not in rows_by_symbol:
+                logger.warning("No %s prices for %s between %s and %s.", interval, symbol, start, end)
+                failed.append(symbol)
+                continue
+            self._merge(symbol, interval, rows_by_symbol[symbol], start, end)
+        return failed
+
+    # Merge fetched rows into the symbol's file and extend its coverage
+    def _merge(self, symbol, interval, rows, start, end):
+        fetched = pd.DataFrame(list(rows), columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
+        fetched['datetime'] = pd.to_datetime(fetched['datetime'])
+        for column in ('open', 'high', 'low', 'close', 'volume'):
+            fetched[column] = pd.to_numeric(fetched[column], errors='coerce')
+        with self._lock:
+            self.bars_fetched += len(fetched)
+
+        existing = self._table(symbol, interval)
+        covered = self.coverage(symbol, interval)
+        frames = [fetched]
+        if existing is not None:
+            frames.insert(0, existing.to_pandas())
+        merged = (pd.concat(frames, ignore_index=True)
+                  .drop_duplicates('datetime', keep='last')
+                  .sort_values('datetime', ignore_index=True))
+        covered_start = min(start, covered[0]) if covered else start
+        covered_end = max(end, covered[1]) if covered else end
+
+        table = pa.Table.from_pandas(merged, schema=PRICE_SCHEMA, preserve_index=False).replace_schema_metadata({
+            'covered_start': covered_start.isoformat(),
+            'covered_end': covered_end.isoformat(),
+        })
+        path = self._file(symbol, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    # Prices for one symbol as a DataFrame indexed by datetime (UTC); sync=True fetches missing bars first
+    def get_prices(self, symbol, interval, start, end=None, sync=True):
+        if sync:
+            self.sync([symbol], interval, start, end)
+        table = self._table(symbol, interval)
+        if table is None:
+            return pd.DataFrame(columns=PRICE_SCHEMA.names[1:], index=pd.DatetimeIndex([], name='datetime'))
+        # Slice by binary search on the memory-mapped timestamps instead of filtering a copy
+        times = table.column('datetime').to_numpy()
+        first = np.searchsorted(times, np.datetime64(start, 's'), side='left')
+        last = np.searchsorted(times, np.datetime64(end, 's'), side='right') if end else len(times)
+        df = table.slice(first, last - first).to_pandas(split_blocks=True)
+        return df.set_index('datetime')
+
+    # Prices for several symbols in one long DataFrame with a `symbol` column
+    def get_many(self, symbols, interval, start, end=None, sync=True):
+        if sync:
+            self.sync(symbols, interval, start, end)
+        frames = [self.get_prices(symbol, interval, start, end, sync=False).assign(symbol=symbol.upper())
+                  for symbol in symbols]
+        return pd.concat(frames) if frames else pd.DataFrame()
+
+    def print_stats(self):
+        logger.info("Price store: %d requests, %d bars fetched.", self.requests, self.bars_fetched)
+
+
+def get_stock_symbols():
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT abbreviation FROM stock WHERE abbreviation IS NOT NULL;")
+                return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        logger.error("Error fetching stock symbols: %s", e)
+        return []
+
+
+# Command-line entry point (also `python vibe.py prices`)
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Bring the local price store up to date.")
+    parser.add_argument("--interval", default="1day", choices=list(INTERVAL_SECONDS))
+    parser.add_argument("--days", type=int, default=365, help="history to keep, in days")
+    parser.add_argument("--symbols", help="comma-separated symbols (default: every stock in the `stock` table)")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    symbols = args.symbols.split(',') if args.symbols else get_stock_symbols()
+    store = PriceStore()
+    store.sync(symbols, args.interval, datetime.utcnow() - timedelta(days=args.days))
+    store.print_stats()
+
+
+if __name__ == "__main__":
+    cli()
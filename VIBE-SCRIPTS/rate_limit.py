@@ -0,0 +1,47 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+
+# Thread-safe token bucket: `rate` requests per second with bursts of up to `burst`
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, self.rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Block until a request may be sent
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# One token bucket per host, created on first use
+class HostRateLimiter:
+    def __init__(self, rate, burst=None, overrides=None):
+        self.rate = rate
+        self.burst = burst
+        self.overrides = overrides or {}  # host -> requests per second
+        self.limiters = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host_or_url):
+        host = urlparse(host_or_url).hostname or host_or_url
+        with self._lock:
+            limiter = self.limiters.get(host)
+            if limiter is None:
+                limiter = RateLimiter(self.overrides.get(host, self.rate), self.burst)
+                self.limiters[host] = limiter
+        limiter.acquire()
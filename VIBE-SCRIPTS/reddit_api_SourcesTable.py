@@ -1,89 +1,205 @@
-import openai
+import argparse
+import logging
 import os
-from textblob import TextBlob
-import praw
-import psycopg
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
 from dotenv import load_dotenv
+from db_pool import get_connection, print_pool_stats, close_pool
+from source_dedupe import KnownUrls
+from source_writer import SourceWriter
+from reddit_cursor import RedditCursor
+from reddit_sources import (REDDIT_SOURCES, parse_sources, source_key, submission_post,
+                            flair_matches, fetch_sources)
+from datetime import datetime
+from llm_engine import get_engine, close_engine
+from sentiment_engine import get_sentiment_engine, close_sentiment_engine
+from symbol_index import get_symbol_index
+from ticker_extractor import TICKER_EXTRACTOR_MODE, AgreementStats, get_ticker_extractor
+from symbol_batching import SYMBOL_BATCH_ENABLED, pack_batches, batch_symbols_request, parse_batch_reply
+from near_duplicates import get_near_duplicate_index, close_near_duplicate_index
+from metrics import metrics, configure_logging
 
 load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
 
-# Authenticate Reddit Account
+# Streaming mode: posts per pipeline batch, and the wait before reconnecting after an error
+REDDIT_STREAM_BATCH_SIZE = int(os.getenv("REDDIT_STREAM_BATCH_SIZE", "25"))
+REDDIT_STREAM_RETRY_SECONDS = float(os.getenv("REDDIT_STREAM_RETRY_SECONDS", "30"))
+
+# Authenticate Reddit Account (praw is only imported once a run needs Reddit)
 def authenticate_reddit():
+    import praw
+    from reddit_sources import RateLimitedRequestor
     reddit = praw.Reddit(
         client_id=os.getenv("REDDIT_CLIENT_ID"),
         client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
         username=os.getenv("REDDIT_USERNAME"),
         password=os.getenv("REDDIT_PASSWORD"),
-        user_agent=os.getenv("REDDIT_USER_AGENT")
+        user_agent=os.getenv("REDDIT_USER_AGENT"),
+        requestor_class=RateLimitedRequestor  # every client shares one request budget
     )
-    print(f"Authenticated as: {reddit.user.me()}")
+    logger.info("Authenticated as: %s", reddit.user.me())
     return reddit
 
-# Fetch Reddit posts
-def fetch_dd_posts(reddit, subreddit_name="wallstreetbets", flair="dd", limit=10):
-    subreddit = reddit.subreddit(subreddit_name)
-    return [
-        {
-            'title': submission.title,
-            'text': submission.selftext,
-            'url': submission.url,
-            'author': str(submission.author),
-            'created_utc': submission.created_utc
-        }
-        for submission in subreddit.new(limit=100)
-        if submission.link_flair_text and submission.link_flair_text.lower() == flair.lower()
-    ][:limit]
+# Long-running mode: follow the sources' combined submission stream and feed matching posts into the
+# pipeline in small batches, advancing the cursors after each batch so a restart resumes where it stopped.
+def stream_posts(reddit, cursor, sources):
+    by_subreddit = {source.subreddit.lower(): source for source in sources}
+    origin_by_key = {source_key(source): source.source_origin for source in sources}
+    subreddit = reddit.subreddit("+".join(source.subreddit for source in sources))
+    known_urls = KnownUrls()
+    logger.info("Streaming r/%s...", subreddit.display_name)
+
+    while True:
+        batches = {}  # source origin -> posts
+        positions = {}  # cursor key -> (fullname, created_utc)
+
+        # Write the batches and advance the cursors of the origins that were written; a failed origin keeps
+        # its posts and position for the next flush (they stay out of known_urls until written, so the retry
+        # writes them)
+        def flush():
+            nonlocal batches, positions
+            failed = {origin for origin, batch in batches.items() if process_posts(batch, origin, known_urls) is None}
+            advanced = [key for key in positions if origin_by_key[key] not in failed]
+            for key in advanced:
+                cursor.advance(key, *positions.pop(key))
+            if advanced:
+                cursor.save()
+            batches = {origin: batch for origin, batch in batches.items() if origin in failed}
+
+        try:
+            # pause_after=-1 yields None after each response, so partial batches are flushed promptly
+            for submission in subreddit.stream.submissions(pause_after=-1):
+                if submission is None:
+                    flush()
+                    continue
+                source = by_subreddit.get(submission.subreddit.display_name.lower())
+                key = source_key(source) if source else None
+                if source is None or cursor.reached(key, submission):
+                    continue
+                if key not in positions or submission.created_utc > positions[key][1]:
+                    positions[key] = (submission.fullname, submission.created_utc)
+                if flair_matches(submission, source.flairs):
+                    logger.debug("New post in r/%s: %s", source.subreddit, submission.title)
+                    batches.setdefault(source.source_origin, []).append(submission_post(submission))
+                if sum(len(batch) for batch in batches.values()) >= REDDIT_STREAM_BATCH_SIZE:
+                    flush()
+        except KeyboardInterrupt:
+            logger.info("Stopping stream.")
+            return
+        except Exception as e:
+            metrics.inc("reddit_stream_errors")
+            logger.warning("Reddit stream error: %s. Reconnecting in %.0fs...", e, REDDIT_STREAM_RETRY_SECONDS)
+            time.sleep(REDDIT_STREAM_RETRY_SECONDS)
 
 # Analyze sentiment
 def analyze_sentiment(text):
-    blob = TextBlob(text)
+    sentiment = get_sentiment_engine().score([text])[0]
     return {
-        'polarity': blob.sentiment.polarity,
-        'subjectivity': blob.sentiment.subjectivity,
+        'polarity': sentiment['polarity'],
+        'subjectivity': sentiment['subjectivity'],
     }
 
-# Identify stock symbols using Assistant GPT
-def identify_stock_symbols(text):
+# Chat-completion request asking GPT for the stock symbols in a post
+def symbols_request(text):
     prompt = (
         "Identify any stock ticker symbols mentioned in this text:\n\n"
         f"{text}\n\nReturn only the ticker symbols separated by commas."
     )
+    return {
+        'model': "gpt-4o-mini",
+        'messages': [
+            {"role": "system",
+             "content": "Identify stock ticker symbols in the text. Return them as comma-separated values."},
+            {"role": "user", "content": prompt}
+        ],
+        'temperature': 0.1
+    }
 
+# Symbols from a finished enrichment future
+def symbols_result(future):
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system",
-                 "content": "Identify stock ticker symbols in the text. Return them as comma-separated values."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1
-        )
-        symbols = response.choices[0].message['content'].strip()
+        symbols = future.result()
         return [symbol.strip() for symbol in symbols.split(',') if symbol.strip()]
     except Exception as e:
-        print(f"Error identifying stock symbols: {e}")
+        metrics.inc("symbol_failures")
+        logger.error("Error identifying stock symbols: %s", e)
         return []
 
-# Fetch existing stocks from the database
-def fetch_existing_stocks():
-    try:
-        with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT LOWER(abbreviation), id FROM stock;")
-                result = cur.fetchall()
-                print("Fetched existing stocks (case-insensitive):", result)
-                return {row[0]: row[1] for row in result}  # Map lowercase abbreviation to stock ID
-    except Exception as e:
-        print(f"Error fetching stocks: {e}")
-        return {}
+# Identify stock symbols using Assistant GPT
+def identify_stock_symbols(text):
+    return symbols_result(get_engine().submit(**symbols_request(text)))
+
+# Yield (post, symbols) for each post: confident local extractions first, then GPT replies as they finish.
+# TICKER_EXTRACTOR_MODE picks "prepass" (default), "compare" (always ask GPT and report agreement) or "off".
+# Posts that need GPT are packed into multi-post JSON requests; a batch whose reply fails validation
+# falls back to one request per post.
+def identify_symbols_for_posts(posts, mode=TICKER_EXTRACTOR_MODE, batched=SYMBOL_BATCH_ENABLED):
+    extractor = get_ticker_extractor(get_symbol_index()) if mode in ("prepass", "compare") else None
+    agreement = AgreementStats() if mode == "compare" else None
+    pending = {}  # future -> ('batch', [posts]) or ('post', post)
+    local_results = {}
+    confident = []
+    llm_posts = []
+    for post in posts:
+        extraction = extractor.extract(post['text']) if extractor else None
+        if mode == "prepass" and extraction.confident:
+            confident.append((post, extraction.symbols))
+            continue
+        local_results[post['url']] = extraction
+        llm_posts.append(post)
+
+    # The engine (and openai) only starts when some post needs GPT
+    engine = get_engine() if llm_posts else None
+
+    batches, singles = pack_batches(llm_posts) if batched else ([], llm_posts)
+    for batch in batches:
+        if len(batch) == 1:
+            singles.extend(batch)
+        else:
+            # A reply that fails validation is never cached, so a rerun asks again instead of falling back for good
+            pending[engine.submit(validate=lambda reply, batch=batch: parse_batch_reply(reply, batch),
+                                  **batch_symbols_request(batch))] = ('batch', batch)
+    for post in singles:
+        pending[engine.submit(**symbols_request(post['text']))] = ('post', post)
+
+    # GPT requests are already in flight while the local results are handled
+    metrics.inc("symbol_posts", len(confident), method="local")
+    metrics.inc("symbol_posts", len(llm_posts), method="llm")
+    for post, symbols in confident:
+        logger.debug("Local extractor found %s in post '%s'", symbols, post['title'])
+        yield post, symbols
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            kind, payload = pending.pop(future)
+            if kind == 'batch':
+                try:
+                    results = parse_batch_reply(future.result(), payload)
+                except Exception as e:
+                    metrics.inc("symbol_batch_fallbacks")
+                    logger.warning("Batched symbol request for %d posts failed (%s). Falling back to one request per post.",
+                                   len(payload), e)
+                    for post in payload:
+                        pending[engine.submit(**symbols_request(post['text']))] = ('post', post)
+                    continue
+            else:
+                results = [(payload, symbols_result(future))]
+
+            for post, symbols in results:
+                if agreement:
+                    agreement.record(local_results[post['url']], symbols)
+                yield post, symbols
+
+    if agreement:
+        agreement.print_stats()
 
 # Add a new stock to the database
 def insert_new_stock(abbreviation):
     try:
-        with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
+        with get_connection() as conn:
             with conn.cursor() as cur:
                 # Insert the stock
                 cur.execute("""
@@ -93,109 +209,213 @@ def insert_new_stock(abbreviation):
                 """, (abbreviation.upper(), abbreviation))  # Ensure abbreviation is uppercase
                 stock_id = cur.fetchone()[0]
                 conn.commit()
-                print(f"Inserted new stock: {abbreviation} (ID: {stock_id})")
-                return stock_id
+                metrics.inc("stocks_inserted")
+                logger.info("Inserted new stock: %s (ID: %s)", abbreviation, stock_id)
+        # Keep the shared symbol index current
+        get_symbol_index().add(abbreviation, stock_id)
+        return stock_id
     except Exception as e:
-        print(f"Error inserting new stock: {e}")
+        logger.error("Error inserting new stock: %s", e)
         return None
 
-# Add stock and source to the `stocks_source` table
-def insert_into_stocks_source(stock_id, source_id):
-    try:
-        with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO stocks_source (stock_id, source_id)
-                    VALUES (%s, %s);
-                """, (stock_id, source_id))
-                conn.commit()
-                print(f"Linked stock ID '{stock_id}' to source ID '{source_id}'.")
-    except Exception as e:
-        print(f"Error inserting into stocks_source: {e}")
-
 # Fetch source_origin_id based on the source name
 def get_source_origin_id(source_origin_name):
     try:
-        with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
+        with get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT id FROM source_origin WHERE name = %s;", (source_origin_name,))
                 result = cur.fetchone()
                 return result[0] if result else None
     except Exception as e:
-        print(f"Error fetching source_origin_id: {e}")
+        logger.error("Error fetching source_origin_id: %s", e)
         return None
 
-# Process stocks for a given post
-def process_stocks_for_post(symbols, source_id):
-    existing_stocks = fetch_existing_stocks()
-    print("Existing stocks at start:", existing_stocks)
+# Resolve the stock IDs for a given post, adding unknown symbols to the stock table
+def process_stocks_for_post(symbols):
+    stock_ids = []
+    existing_stocks = get_symbol_index()
 
     for symbol in symbols:
-        # Normalize symbol for case-insensitivity
-        symbol_lower = symbol.lower()
-        if symbol_lower in existing_stocks:
-            stock_id = existing_stocks[symbol_lower]
-            print(f"Stock '{symbol}' already exists with ID {stock_id}")
+        # Lookups are case-insensitive
+        stock_id = existing_stocks.get(symbol)
+        if stock_id:
+            logger.debug("Stock '%s' already exists with ID %s", symbol, stock_id)
         else:
-            print(f"Stock '{symbol}' does not exist. Adding to the stock table...")
+            logger.debug("Stock '%s' does not exist. Adding to the stock table...", symbol)
             stock_id = insert_new_stock(symbol)
             if not stock_id:
-                print(f"Failed to insert stock: {symbol}")
+                # Another process may have added it since our last refresh
+                existing_stocks.refresh()
+                stock_id = existing_stocks.get(symbol)
+            if not stock_id:
+                logger.error("Failed to insert stock: %s", symbol)
                 continue  # Skip if failed to insert stock
-            # Update the cache so we don't check again for this stock
-            existing_stocks[symbol_lower] = stock_id
-            print(f"Added '{symbol}' to existing_stocks with ID {stock_id}")
 
-        # Add to stocks_source table using stock_id and source_id
-        insert_into_stocks_source(stock_id=stock_id, source_id=source_id)
+        stock_ids.append(stock_id)
 
-# Main processing function
-def process_posts(posts, source_origin_name):
+    return stock_ids
+
+# Main processing function; returns how many posts were new, or None when they couldn't be written (unknown
+# source origin or failed inserts), in which case the caller must not advance the cursor past them
+def process_posts(posts, source_origin_name, known_urls=None):
     source_origin_id = get_source_origin_id(source_origin_name)
     if not source_origin_id:
-        print(f"Source origin '{source_origin_name}' not found.")
-        return
+        logger.error("Source origin '%s' not found.", source_origin_name)
+        return None
 
-    for post in posts:
-        symbols = identify_stock_symbols(post['text'])
-        print(f"Symbols identified for post '{post['title']}': {symbols}")
+    # Pick up stocks added by other processes since the last refresh
+    get_symbol_index().refresh_if_stale()
 
-        if not symbols:
-            print(f"No stocks identified in post: {post['title']}")
+    # Drop posts whose URL is already in `source` (one round trip for the whole pull)
+    known_urls = known_urls if known_urls is not None else KnownUrls()
+    new_urls = set(known_urls.filter_new([post['url'] for post in posts]))
+    near_duplicates = get_near_duplicate_index("reddit")
+
+    new_posts = []
+    duplicates = []  # (post, URL of the first copy)
+    seen = set()  # URLs taken from this batch, so a post listed twice is only written once
+    for post in posts:
+        if post['url'] not in new_urls or post['url'] in seen:
+            metrics.inc("duplicate_posts")
+            logger.debug("Post already exists in the database. Skipping URL: %s", post['url'])
             continue
+        seen.add(post['url'])
+        # Reposts of a recent post (or link posts to a URL already seen, tracking parameters aside): written as a
+        # copy of the first copy's `source` row, with its sentiment and stocks, instead of calling the LLM again
+        if near_duplicates is not None:
+            original = near_duplicates.check(post['url'], f"{post['title']}\n{post['text']}")
+            if original and original != post['url']:
+                metrics.inc("near_duplicate_posts")
+                logger.debug("Post '%s' duplicates %s. Linking URL: %s", post['title'], original, post['url'])
+                duplicates.append((post, original))
+                continue
+        new_posts.append(post)
 
-        # Analyze sentiment
-        sentiment = analyze_sentiment(post['text'])
+    if not new_posts and not duplicates:
+        return 0
 
-        # Insert post into `source`
-        try:
-            with psycopg.connect(os.getenv("DATABASE_URL")) as conn:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                        INSERT INTO source (url, source_origin_id, predicted_sentiment_score, 
-                                            predicted_opinion_score)
-                        VALUES (%s, %s, %s, %s)
-                        RETURNING id;
-                    """, (post['url'], source_origin_id, sentiment['polarity'], sentiment['subjectivity']))
-                    source_id = cur.fetchone()[0]
-                    conn.commit()
-        except Exception as e:
-            print(f"Error inserting post into source: {e}")
-            continue
+    # Load the sentiment models on the workers before the batch reaches them
+    if new_posts:
+        get_sentiment_engine().warm()
+
+    # Score every new post in one batch (on worker processes when SENTIMENT_PROCESSES > 0)
+    sentiments = get_sentiment_engine().submit(post['text'] for post in new_posts)
+    sentiment_by_url = None
+
+    # Posts become known (and matchable by later duplicates) only once their `source` row is committed, so a
+    # failed write leaves them new for the caller's retry
+    def on_written(urls):
+        for url in urls:
+            known_urls.add(url)
+        if near_duplicates is not None:
+            near_duplicates.confirm(urls)
+
+    with SourceWriter(on_written=on_written) as writer:
+        for post, symbols in identify_symbols_for_posts(new_posts):
+            logger.debug("Symbols identified for post '%s': %s", post['title'], symbols)
+
+            if not symbols:
+                # Nothing to write, now or on a retry
+                known_urls.add(post['url'])
+                metrics.inc("posts_without_symbols")
+                logger.debug("No stocks identified in post: %s", post['title'])
+                continue
 
-        # Process stocks for this post
-        process_stocks_for_post(symbols, source_id)
+            # Analyze sentiment
+            if sentiment_by_url is None:
+                sentiment_by_url = {new_post['url']: result for new_post, result in zip(new_posts, sentiments.result())}
+            sentiment = sentiment_by_url[post['url']]
+
+            # Process stocks for this post
+            stock_ids = process_stocks_for_post(symbols)
+
+            # Queue the post for the batched insert into `source` / `stocks_source`
+            writer.add(
+                url=post['url'],
+                source_origin_id=source_origin_id,
+                sentiment_score=sentiment['polarity'],
+                opinion_score=sentiment['subjectivity'],
+                date_fetched=datetime.now(),
+                stock_ids=stock_ids
+            )
+
+        # Queued after every original, so a copy never reaches the database before the row it copies
+        for post, original in duplicates:
+            writer.add_copy(post['url'], original, source_origin_id, datetime.now())
+    if writer.stats['failed']:
+        return None
+    return len(new_posts) + len(duplicates)
 
 # Main
-def main():
+def main(stream=False, sources_spec=REDDIT_SOURCES):
+    sources = parse_sources(sources_spec)
+    if not sources:
+        logger.error("No subreddits configured (REDDIT_SOURCES). Exiting.")
+        return
+    # Skip sources whose origin isn't in source_origin: their posts couldn't be written, and fetching them
+    # would move their cursors past posts that were never stored
+    origin_ids = {origin: get_source_origin_id(origin) for origin in {source.source_origin for source in sources}}
+    for origin in [origin for origin, origin_id in origin_ids.items() if not origin_id]:
+        logger.error("Source origin '%s' not found. Skipping %s.", origin,
+                     ", ".join(f"r/{source.subreddit}" for source in sources if source.source_origin == origin))
+    sources = [source for source in sources if origin_ids[source.source_origin]]
+    if not sources:
+        return
     reddit = authenticate_reddit()
-    posts = fetch_dd_posts(reddit)
+    cursor = RedditCursor()
 
-    if not posts:
-        print("No posts found.")
+    if stream:
+        stream_posts(reddit, cursor, sources)
         return
 
-    process_posts(posts, source_origin_name="WallStreetBets")
+    # The main client is reused by the first fetch worker; other workers authenticate their own
+    clients = [reddit]
+    with metrics.timer("fetch_reddit"):
+        posts_by_origin, positions = fetch_sources(lambda: clients.pop() if clients else authenticate_reddit(), cursor,
+                                                   sources)
+
+    if not posts_by_origin:
+        logger.info("No posts found.")
+
+    # One URL set for the whole run, so a post is only written once whichever subreddit it came from
+    known_urls = KnownUrls()
+    failed = set()
+    for source_origin_name, posts in posts_by_origin.items():
+        try:
+            if process_posts(posts, source_origin_name, known_urls) is None:
+                failed.add(source_origin_name)
+        except Exception as e:
+            logger.error("Error processing posts for '%s': %s", source_origin_name, e)
+            failed.add(source_origin_name)
+
+    # Only move the cursors of sources whose posts were written; failed ones are fetched again next run
+    origin_by_key = {source_key(source): source.source_origin for source in sources}
+    for key, newest in positions.items():
+        if origin_by_key[key] in failed:
+            logger.warning("Keeping the cursor for %s: its posts were not written.", key)
+            continue
+        cursor.advance(key, *newest)
+    cursor.save()
+
+# Command-line entry point (also `python vibe.py reddit`)
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest Reddit posts into the VIBE database.")
+    parser.add_argument("--stream", action="store_true", help="keep running and process posts as they are submitted")
+    parser.add_argument("--sources", default=REDDIT_SOURCES,
+                        help='subreddits as "subreddit:flair1|flair2:limit:source origin;..." (default: REDDIT_SOURCES)')
+    args = parser.parse_args(argv)
+    configure_logging()
+    try:
+        with metrics.timer("run"):
+            main(stream=args.stream, sources_spec=args.sources)
+    finally:
+        close_engine()
+        close_sentiment_engine()
+        close_near_duplicate_index()
+        print_pool_stats()
+        close_pool()
+        metrics.log_summary()
+        metrics.export("reddit")
 
 if __name__ == "__main__":
-    main()
+    cli()
@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+import threading
+
+# JSON file holding the newest submission seen per subreddit/flair
+REDDIT_CURSOR_PATH = os.getenv("REDDIT_CURSOR_PATH", "reddit_cursor.json")
+
+logger = logging.getLogger(__name__)
+
+
+# Persisted watermark for Reddit listings: the newest submission (fullname + created_utc) already handled.
+# Listings are newest-first, so a run pages until it reaches the cursor instead of a fixed window.
+class RedditCursor:
+    def __init__(self, path=REDDIT_CURSOR_PATH):
+        self.path = path
+        self.positions = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key(subreddit_name, flair):
+        return f"{subreddit_name.lower()}/{(flair or '').lower()}"
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.positions = json.load(f)
+        except FileNotFoundError:
+            self.positions = {}
+        except (OSError, ValueError) as e:
+            logger.error("Error reading Reddit cursor %s: %s. Starting without a cursor.", self.path, e)
+            self.positions = {}
+
+    # Last position for a listing, or None on the first run
+    def get(self, key):
+        return self.positions.get(key)
+
+    # True once the listing reaches a submission at or before the cursor
+    def reached(self, key, submission):
+        position = self.positions.get(key)
+        if not position:
+            return False
+        return submission.fullname == position['fullname'] or submission.created_utc < position['created_utc']
+
+    # Move the cursor forward (never backwards) to this submission
+    def advance(self, key, fullname, created_utc):
+        with self._lock:
+            position = self.positions.get(key)
+            if position and position['created_utc'] > created_utc:
+                return
+            self.positions[key] = {'fullname': fullname, 'created_utc': created_utc}
+
+    # Write atomically so a crash never leaves a half-written cursor
+    def save(self):
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.positions, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error("Error saving Reddit cursor %s: %s", self.path, e)
@@ -0,0 +1,201 @@
+import logging
+import os
+import threading
+from collections import namedtuple
+from concurrent_fetch import fetch_concurrently
+from rate_limit import RateLimiter
+from reddit_cursor import RedditCursor
+from metrics import metrics
+
+# Subreddits to ingest: "subreddit:flair1|flair2:limit:source origin" entries separated by ";".
+# Flair "*" (or empty) takes every post; limit caps the submissions scanned per run; the source origin
+# must exist in `source_origin` (defaults to "r/<subreddit>", "WallStreetBets" for r/wallstreetbets).
+REDDIT_SOURCES = os.getenv("REDDIT_SOURCES", "wallstreetbets:dd")
+# Submissions scanned on the first run (no cursor yet); later runs page back to the cursor, up to Reddit's listing cap
+REDDIT_FIRST_RUN_LIMIT = int(os.getenv("REDDIT_FIRST_RUN_LIMIT", "100"))
+REDDIT_MAX_LISTING = int(os.getenv("REDDIT_MAX_LISTING", "1000"))
+# Subreddits per combined "a+b+c" listing, and listings fetched at once
+REDDIT_COMBINE_MAX = int(os.getenv("REDDIT_COMBINE_MAX", "10"))
+REDDIT_FETCH_WORKERS = int(os.getenv("REDDIT_FETCH_WORKERS", "4"))
+# One request budget shared by every Reddit client in the process (OAuth clients get 100 requests/minute)
+REDDIT_REQUEST_RATE = float(os.getenv("REDDIT_REQUEST_RATE", "1.5"))
+REDDIT_REQUEST_BURST = float(os.getenv("REDDIT_REQUEST_BURST", "5"))
+
+DEFAULT_SOURCE_ORIGINS = {'wallstreetbets': "WallStreetBets"}
+
+RedditSource = namedtuple('RedditSource', ['subreddit', 'flairs', 'limit', 'source_origin'])
+
+reddit_limiter = RateLimiter(REDDIT_REQUEST_RATE, REDDIT_REQUEST_BURST)
+
+logger = logging.getLogger(__name__)
+
+
+# prawcore requestor that takes a token from the shared limiter before every HTTP request.
+# Pass it as praw.Reddit(requestor_class=RateLimitedRequestor) so concurrent clients share one budget.
+# The class is built on first access (module __getattr__), so importing this module doesn't load prawcore.
+def _rate_limited_requestor():
+    from prawcore import Requestor
+
+    class RateLimitedRequestor(Requestor):
+        def __init__(self, *args, limiter=None, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.limiter = limiter or reddit_limiter
+
+        def request(self, *args, **kwargs):
+            self.limiter.acquire()
+            return super().request(*args, **kwargs)
+
+    return RateLimitedRequestor
+
+
+def __getattr__(name):
+    if name == "RateLimitedRequestor":
+        globals()[name] = _rate_limited_requestor()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Parse REDDIT_SOURCES; repeated subreddits are merged into one source
+def parse_sources(spec=REDDIT_SOURCES):
+    sources = {}
+    for entry in spec.split(';'):
+        parts = [part.strip() for part in entry.split(':')]
+        if not parts[0]:
+            continue
+        subreddit = parts[0]
+        flairs = frozenset() if len(parts) < 2 or parts[1] in ('', '*') else frozenset(
+            flair.strip().lower() for flair in parts[1].split('|') if flair.strip())
+        limit = int(parts[2]) if len(parts) > 2 and parts[2] else None
+        source_origin = parts[3] if len(parts) > 3 and parts[3] else DEFAULT_SOURCE_ORIGINS.get(
+            subreddit.lower(), f"r/{subreddit}")
+
+        previous = sources.get(subreddit.lower())
+        if previous:
+            flairs = frozenset() if not (flairs and previous.flairs) else flairs | previous.flairs
+            limit = None if not (limit and previous.limit) else max(limit, previous.limit)
+            subreddit, source_origin = previous.subreddit, previous.source_origin
+        sources[subreddit.lower()] = RedditSource(subreddit, flairs, limit, source_origin)
+    return list(sources.values())
+
+
+# Cursor key for a source ("wallstreetbets/dd")
+def source_key(source):
+    return RedditCursor.key(source.subreddit, "|".join(sorted(source.flairs)) or "*")
+
+
+def submission_post(submission):
+    return {
+        'title': submission.title,
+        'text': submission.selftext,
+        'url': submission.url,
+        'author': str(submission.author),
+        'created_utc': submission.created_utc,
+        'subreddit': submission.subreddit.display_name
+    }
+
+
+def flair_matches(submission, flairs):
+    if not flairs:
+        return True
+    return bool(submission.link_flair_text) and submission.link_flair_text.lower() in flairs
+
+
+# Submissions to scan for a source this run
+def scan_limit(cursor, source):
+    limit = REDDIT_MAX_LISTING if cursor.get(source_key(source)) else REDDIT_FIRST_RUN_LIMIT
+    return min(limit, source.limit) if source.limit else limit
+
+
+# Page one listing ("a+b+c" for several sources) newest-first until every source reaches its cursor or limit.
+# Returns one state per source; 'done' is False for sources the combined listing ran out before reaching.
+def scan_listing(reddit, cursor, sources):
+    states = {
+        source.subreddit.lower(): {
+            'source': source,
+            'key': source_key(source),
+            'limit': scan_limit(cursor, source),
+            'scanned': 0,
+            'posts': [],
+            'newest': None,
+            'done': False
+        }
+        for source in sources
+    }
+    listing_limit = min(REDDIT_MAX_LISTING, sum(state['limit'] for state in states.values()))
+    open_states = len(states)
+    seen = 0
+    listing = reddit.subreddit("+".join(source.subreddit for source in sources)).new(limit=listing_limit)
+    for submission in listing:
+        seen += 1
+        state = states.get(submission.subreddit.display_name.lower())
+        if state is None or state['done']:
+            continue
+        if cursor.reached(state['key'], submission) or state['scanned'] >= state['limit']:
+            state['done'] = True
+            open_states -= 1
+            if not open_states:
+                break
+            continue
+        state['scanned'] += 1
+        if state['newest'] is None or submission.created_utc > state['newest'][1]:
+            state['newest'] = (submission.fullname, submission.created_utc)
+        if flair_matches(submission, state['source'].flairs):
+            state['posts'].append(submission_post(submission))
+
+    exhausted = seen < listing_limit  # nothing older left in the listing
+    for state in states.values():
+        if exhausted or state['scanned'] >= state['limit']:
+            state['done'] = True
+    return list(states.values())
+
+
+# Fetch new posts for every source within one request budget.
+# Sources share combined "a+b+c" listings; any source a combined listing couldn't page back far enough for
+# is fetched on its own. Listings run concurrently, each worker thread with its own client from
+# `reddit_factory` (PRAW clients aren't thread-safe). Posts are de-duplicated by URL across sources.
+# Returns ({source origin: [posts]}, {cursor key: (fullname, created_utc)}).
+def fetch_sources(reddit_factory, cursor, sources):
+    local = threading.local()
+
+    def scan(group):
+        if not hasattr(local, 'reddit'):
+            local.reddit = reddit_factory()
+        return scan_listing(local.reddit, cursor, group)
+
+    results = []
+    retry = []
+    groups = [sources[start:start + REDDIT_COMBINE_MAX] for start in range(0, len(sources), REDDIT_COMBINE_MAX)]
+    for group, states in fetch_concurrently(groups, scan, max_workers=REDDIT_FETCH_WORKERS):
+        for state in states or []:
+            if state['done']:
+                results.append(state)
+            else:
+                retry.append(state['source'])
+
+    if retry:
+        logger.info("Fetching %d busy-listing subreddits individually: %s", len(retry),
+                    ", ".join(s.subreddit for s in retry))
+        for group, states in fetch_concurrently([[source] for source in retry], scan, max_workers=REDDIT_FETCH_WORKERS):
+            results.extend(states or [])
+
+    posts_by_origin = {}
+    positions = {}
+    seen_urls = set()
+    duplicates = 0
+    for state in results:
+        logger.info("r/%s: scanned %d new submissions, %d matching.", state['source'].subreddit, state['scanned'],
+                    len(state['posts']))
+        metrics.inc("reddit_submissions_scanned", state['scanned'], subreddit=state['source'].subreddit.lower())
+        metrics.inc("reddit_posts_matched", len(state['posts']), subreddit=state['source'].subreddit.lower())
+        if state['newest']:
+            positions[state['key']] = state['newest']
+        for post in state['posts']:
+            if post['url'] in seen_urls:
+                duplicates += 1
+                continue
+            seen_urls.add(post['url'])
+            posts_by_origin.setdefault(state['source'].source_origin, []).append(post)
+    if duplicates:
+        metrics.inc("duplicate_posts", duplicates, reason="cross_subreddit")
+        logger.info("Dropped %d posts already fetched from another subreddit.", duplicates)
+    return posts_by_origin, positions
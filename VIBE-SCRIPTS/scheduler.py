@@ -0,0 +1,118 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+
+# New items a poll should find on average; a source's interval is stretched or shrunk towards this
+POLL_TARGET_ITEMS = float(os.getenv("POLL_TARGET_ITEMS", "1"))
+# Weight of the latest poll in the per-source item rate (exponential moving average)
+POLL_SMOOTHING = float(os.getenv("POLL_SMOOTHING", "0.3"))
+# Interval growth after an empty poll of a source that has never produced anything
+POLL_BACKOFF = float(os.getenv("POLL_BACKOFF", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+# Adaptive polling schedule for a set of sources (tickers, subreddits).
+# Each source keeps a smoothed rate of new items per second; after every poll its interval becomes the time
+# expected to produce `target_items` new items, clamped to [min_interval, max_interval]. When the sources
+# together would poll faster than `budget` polls per minute, every interval is stretched by the same factor.
+# The first poll of a source only primes it (it returns whatever backlog exists), so it leaves the rate alone.
+class PollSchedule:
+    def __init__(self, name, min_interval, max_interval, budget, target_items=POLL_TARGET_ITEMS,
+                 smoothing=POLL_SMOOTHING, backoff=POLL_BACKOFF):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget
+        self.target_items = target_items
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self.jobs = {}  # key -> {'interval', 'rate', 'polled_at', 'due', 'polls'}
+        self.demand = 0.0  # polls per second the base intervals ask for
+        self._heap = []  # (due, seq, key); entries whose due no longer matches the job are skipped
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __contains__(self, key):
+        return key in self.jobs
+
+    # Factor applied to every interval to stay within the budget
+    def scale(self):
+        budget = self.budget / 60.0
+        return max(1.0, self.demand / budget) if budget > 0 else 1.0
+
+    # Start polling a source; first polls are spread over one interval so a restart doesn't burst
+    def add(self, key, now=None):
+        if key in self.jobs:
+            return
+        now = time.monotonic() if now is None else now
+        interval = self.min_interval
+        self.jobs[key] = {'interval': interval, 'rate': None, 'polled_at': None, 'due': None, 'polls': 0}
+        self.demand += 1.0 / interval
+        self._schedule(key, now + random.uniform(0, interval * self.scale()))
+
+    def remove(self, key):
+        job = self.jobs.pop(key, None)
+        if job:
+            self.demand -= 1.0 / job['interval']
+
+    # Monotonic time of the next poll, or None if nothing is scheduled
+    def next_due(self):
+        while self._heap:
+            due, _, key = self._heap[0]
+            job = self.jobs.get(key)
+            if job is not None and job['due'] == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    # Key of a source due by `now` (it stays unscheduled until record()), or None
+    def pop_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        due = self.next_due()
+        if due is None or due > now:
+            return None
+        _, _, key = heapq.heappop(self._heap)
+        self.jobs[key]['due'] = None
+        return key
+
+    # Record a finished poll and schedule the next one; failed polls (new_items=None) keep the old estimate
+    def record(self, key, new_items, now=None):
+        job = self.jobs.get(key)
+        if job is None:
+            return
+        now = time.monotonic() if now is None else now
+        if new_items is not None and job['polled_at'] is not None:
+            observed = new_items / max(now - job['polled_at'], 1e-9)
+            job['rate'] = observed if job['rate'] is None else (
+                self.smoothing * observed + (1 - self.smoothing) * job['rate'])
+            if job['rate'] > 0:
+                interval = self.target_items / job['rate']
+            else:
+                interval = job['interval'] * self.backoff
+            interval = min(self.max_interval, max(self.min_interval, interval))
+            self.demand += 1.0 / interval - 1.0 / job['interval']
+            job['interval'] = interval
+        if new_items is not None:
+            job['polled_at'] = now
+        job['polls'] += 1
+        self._schedule(key, now + job['interval'] * self.scale())
+
+    def _schedule(self, key, due):
+        self.jobs[key]['due'] = due
+        heapq.heappush(self._heap, (due, next(self._seq), key))
+
+    # One log line: sources, polls per minute and the spread of effective intervals
+    def log_summary(self):
+        if not self.jobs:
+            return
+        scale = self.scale()
+        intervals = sorted(job['interval'] * scale for job in self.jobs.values())
+        logger.info("%s schedule: %d sources, %.1f polls/min (budget %.1f), interval min %.0fs, median %.0fs, "
+                    "max %.0fs.", self.name, len(self.jobs), 60.0 * self.demand / scale, self.budget, intervals[0],
+                    intervals[len(intervals) // 2], intervals[-1])
@@ -0,0 +1,98 @@
+import argparse
+import json
+import sqlite3
+import statistics
+import time
+from staging_queue import NEWS_STAGING_PATH
+from sentiment_engine import sentiment_category
+
+CATEGORIES = ('Negative', 'Neutral', 'Positive')
+COLUMNS = ('url', 'title', 'summary', 'title_polarity', 'title_subjectivity', 'polarity', 'subjectivity', 'refined_at')
+
+
+# Title scores next to their refined scores, oldest first. Read-only, so it is safe while ingesters run
+# (opening a StagingQueue would reset their in-flight articles).
+def load_comparisons(path=NEWS_STAGING_PATH, since=None):
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.OperationalError:  # no staging file yet
+        return []
+    try:
+        rows = conn.execute(f"""
+            SELECT {', '.join(COLUMNS)} FROM score_comparison WHERE refined_at >= ? ORDER BY refined_at;
+        """, (since or 0,)).fetchall()
+    except sqlite3.OperationalError:  # no fast-path run has refined anything yet
+        rows = []
+    finally:
+        conn.close()
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+
+def _correlation(xs, ys):
+    try:
+        return statistics.correlation(xs, ys)
+    except statistics.StatisticsError:  # fewer than two pairs, or a constant series
+        return float('nan')
+
+
+# Agreement between fast-path title scores and the summary-based scores that replaced them
+def compare(rows):
+    report = {'articles': len(rows)}
+    if not rows:
+        return report
+    for score in ('polarity', 'subjectivity'):
+        fast = [row[f'title_{score}'] for row in rows]
+        refined = [row[score] for row in rows]
+        report[score] = {
+            'title_mean': statistics.fmean(fast),
+            'refined_mean': statistics.fmean(refined),
+            'mean_abs_diff': statistics.fmean(abs(a - b) for a, b in zip(fast, refined)),
+            'correlation': _correlation(fast, refined),
+        }
+    confusion = {title: {refined: 0 for refined in CATEGORIES} for title in CATEGORIES}
+    for row in rows:
+        confusion[sentiment_category(row['title_polarity'])][sentiment_category(row['polarity'])] += 1
+    report['category_agreement'] = sum(confusion[category][category] for category in CATEGORIES) / len(rows)
+    report['categories'] = confusion  # title category -> refined category -> articles
+    return report
+
+
+def print_report(report, rows, top):
+    print(f"=== Fast title scores vs refined summary scores: {report['articles']} articles ===")
+    if not rows:
+        return
+    print(f"{'score':<14}{'title mean':>12}{'refined mean':>14}{'mean |diff|':>13}{'correlation':>13}")
+    for score in ('polarity', 'subjectivity'):
+        row = report[score]
+        print(f"{score:<14}{row['title_mean']:>12.3f}{row['refined_mean']:>14.3f}{row['mean_abs_diff']:>13.3f}"
+              f"{row['correlation']:>13.3f}")
+    print(f"\nSentiment category agreement: {report['category_agreement']:.1%} (rows: title, columns: refined)")
+    print(f"{'':<10}" + "".join(f"{category:>10}" for category in CATEGORIES))
+    for title in CATEGORIES:
+        print(f"{title:<10}" + "".join(f"{report['categories'][title][refined]:>10}" for refined in CATEGORIES))
+    if top:
+        print("\nLargest polarity changes:")
+        for row in sorted(rows, key=lambda row: abs(row['title_polarity'] - row['polarity']), reverse=True)[:top]:
+            print(f"  {row['title_polarity']:+.2f} -> {row['polarity']:+.2f}  {row['title']}")
+
+
+# Command-line entry point (also `python vibe.py scores`)
+def cli(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the fast path's title scores with the LLM-refined scores that replaced them.")
+    parser.add_argument("--path", default=NEWS_STAGING_PATH, help="staging database (default: NEWS_STAGING_PATH)")
+    parser.add_argument("--days", type=float, help="only articles refined in the last N days")
+    parser.add_argument("--top", type=int, default=10, help="list the N largest polarity changes")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    rows = load_comparisons(args.path, since=time.time() - args.days * 86400 if args.days else None)
+    report = compare(rows)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, rows, args.top)
+
+
+if __name__ == "__main__":
+    cli()
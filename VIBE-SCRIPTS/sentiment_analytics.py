@@ -0,0 +1,205 @@
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from dateutil import tz
+from dotenv import load_dotenv
+from db_pool import get_connection, close_pool
+from price_store import PriceStore
+from metrics import configure_logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Timezone of source.date_fetched (the ingesters store local time); prices are UTC
+SOURCE_TIMEZONE = os.getenv("SOURCE_TIMEZONE")
+# Bars per rolling window, and bars ahead for forward returns
+ANALYTICS_WINDOW = int(os.getenv("ANALYTICS_WINDOW", "5"))
+ANALYTICS_HORIZON = int(os.getenv("ANALYTICS_HORIZON", "1"))
+
+
+# Sentiment for every stock in one query: one row per (stock, source) link
+def load_sentiment(start, end=None, symbols=None):
+    query = """
+        SELECT UPPER(st.abbreviation), s.date_fetched, s.predicted_sentiment_score, s.predicted_opinion_score
+        FROM stocks_source ss
+        JOIN source s ON s.id = ss.source_id
+        JOIN stock st ON st.id = ss.stock_id
+        WHERE s.date_fetched >= %s AND s.date_fetched < %s
+    """
+    params = [start, end or datetime.now()]
+    if symbols:
+        query += " AND UPPER(st.abbreviation) = ANY(%s)"
+        params.append([symbol.upper() for symbol in symbols])
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query + ";", params)
+                rows = cur.fetchall()
+    except Exception as e:
+        logger.error("Error loading sentiment: %s", e)
+        rows = []
+
+    sentiment = pd.DataFrame(rows, columns=['symbol', 'fetched_at', 'polarity', 'subjectivity'])
+    sentiment['polarity'] = sentiment['polarity'].astype(float)
+    sentiment['subjectivity'] = sentiment['subjectivity'].astype(float)
+    local = tz.gettz(SOURCE_TIMEZONE) if SOURCE_TIMEZONE else tz.tzlocal()
+    sentiment['fetched_at'] = (pd.to_datetime(sentiment['fetched_at'])
+                               .dt.tz_localize(local, ambiguous='NaT', nonexistent='shift_forward')
+                               .dt.tz_convert('UTC').dt.tz_localize(None))
+    return sentiment.dropna(subset=['fetched_at'])
+
+
+# Attach each sentiment row to the first bar that opens after it (an as-of join per symbol) and
+# aggregate per bar; bars without sentiment keep zero mentions
+def align(sentiment, prices):
+    bars = prices.reset_index()[['symbol', 'datetime', 'close', 'volume']]
+    bars = bars.sort_values(['symbol', 'datetime'], ignore_index=True)
+    bars['datetime'] = bars['datetime'].astype('datetime64[ns]')
+    if sentiment.empty:
+        return bars.assign(mentions=0, polarity_sum=0.0, subjectivity_sum=0.0)
+
+    matched = pd.merge_asof(
+        sentiment.astype({'fetched_at': 'datetime64[ns]'}).sort_values('fetched_at'),
+        bars[['symbol', 'datetime']].sort_values('datetime').assign(bar=lambda df: df['datetime']),
+        left_on='fetched_at', right_on='datetime', by='symbol',
+        direction='forward', allow_exact_matches=False
+    ).dropna(subset=['bar'])
+    per_bar = matched.groupby(['symbol', 'bar'], sort=False).agg(
+        mentions=('polarity', 'size'),
+        polarity_sum=('polarity', 'sum'),
+        subjectivity_sum=('subjectivity', 'sum')
+    )
+    bars = bars.join(per_bar, on=['symbol', 'datetime'])
+    bars['mentions'] = bars['mentions'].fillna(0).astype(np.int64)
+    bars[['polarity_sum', 'subjectivity_sum']] = bars[['polarity_sum', 'subjectivity_sum']].fillna(0.0)
+    return bars
+
+
+# Trailing sum over `window` rows that never crosses into the previous symbol (rows sorted by symbol)
+def _rolling_sum(values, group_start, window):
+    cumulative = np.concatenate(([0.0], np.cumsum(np.nan_to_num(values, nan=0.0))))
+    positions = np.arange(len(values))
+    lower = np.maximum(positions + 1 - window, group_start)
+    return cumulative[positions + 1] - cumulative[lower]
+
+
+def _correlation(n, sx, sy, sxx, syy, sxy):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+        corr = (n * sxy - sx * sy) / denominator
+    return np.where((n >= 3) & (denominator > 0), corr, np.nan)
+
+
+# Rolling sentiment and return features for every symbol at once. All windows are computed with
+# cumulative sums over the symbol-sorted arrays, so cost is linear in bars regardless of ticker count.
+def compute_features(bars, window=ANALYTICS_WINDOW, horizon=ANALYTICS_HORIZON):
+    bars = bars.sort_values(['symbol', 'datetime'], ignore_index=True)
+    codes, _ = pd.factorize(bars['symbol'], sort=False)
+    positions = np.arange(len(bars))
+    first = np.searchsorted(codes, codes, side='left')  # rows are grouped by symbol
+    last = np.searchsorted(codes, codes, side='right') - 1
+
+    mentions = bars['mentions'].to_numpy(dtype=float)
+    polarity_sum = bars['polarity_sum'].to_numpy(dtype=float)
+    volume = np.nan_to_num(bars['volume'].to_numpy(dtype=float), nan=0.0)
+    close = bars['close'].to_numpy(dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        polarity = np.where(mentions > 0, polarity_sum / mentions, np.nan)
+        bars['polarity'] = polarity
+        bars['rolling_mentions'] = _rolling_sum(mentions, first, window)
+        bars['rolling_polarity'] = _rolling_sum(polarity_sum, first, window) / bars['rolling_mentions'].to_numpy()
+        # Each mention weighted by the traded volume of its bar
+        bars['volume_weighted_polarity'] = (_rolling_sum(polarity_sum * volume, first, window)
+                                            / _rolling_sum(mentions * volume, first, window))
+
+        ahead = positions + horizon
+        valid = ahead <= last
+        future_close = close[np.where(valid, ahead, positions)]
+        forward_return = np.where(valid, future_close / close - 1.0, np.nan)
+    bars['forward_return'] = forward_return
+
+    # Rolling correlation between bar polarity and the forward return, over bars that have both
+    both = ~np.isnan(polarity) & ~np.isnan(forward_return)
+    x = np.where(both, polarity, 0.0)
+    y = np.where(both, forward_return, 0.0)
+    bars['rolling_corr'] = _correlation(
+        _rolling_sum(both.astype(float), first, window),
+        _rolling_sum(x, first, window), _rolling_sum(y, first, window),
+        _rolling_sum(x * x, first, window), _rolling_sum(y * y, first, window),
+        _rolling_sum(x * y, first, window)
+    )
+    return bars
+
+
+# One row per symbol: totals, mean polarity and the full-period sentiment/return correlation
+def summarize(features):
+    codes, symbols = pd.factorize(features['symbol'], sort=True)
+    polarity = features['polarity'].to_numpy()
+    forward_return = features['forward_return'].to_numpy()
+    both = ~np.isnan(polarity) & ~np.isnan(forward_return)
+    x = np.where(both, polarity, 0.0)
+    y = np.where(both, forward_return, 0.0)
+
+    def total(values):
+        return np.bincount(codes, weights=values, minlength=len(symbols))
+
+    mentions = total(features['mentions'].to_numpy(dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_polarity = total(features['polarity_sum'].to_numpy()) / mentions
+    return pd.DataFrame({
+        'bars': np.bincount(codes, minlength=len(symbols)),
+        'mentions': mentions.astype(np.int64),
+        'mean_polarity': mean_polarity,
+        'sentiment_return_corr': _correlation(total(both.astype(float)), total(x), total(y),
+                                              total(x * x), total(y * y), total(x * y)),
+    }, index=pd.Index(symbols, name='symbol'))
+
+
+# Sentiment and prices for every stock with sentiment in the period, joined and featurized
+def analyze(days=90, interval="1day", window=ANALYTICS_WINDOW, horizon=ANALYTICS_HORIZON, symbols=None,
+            sync_prices=True, store=None):
+    # date_fetched is local time, the price store is UTC
+    sentiment = load_sentiment(datetime.now() - timedelta(days=days), symbols=symbols)
+    start = datetime.utcnow() - timedelta(days=days)
+    symbols = symbols or sorted(sentiment['symbol'].unique())
+    if not symbols:
+        logger.warning("No sentiment in the period.")
+        return None, None
+    prices = (store or PriceStore()).get_many(symbols, interval, start, sync=sync_prices)
+    if prices.empty:
+        logger.warning("No prices available for the period.")
+        return None, None
+    features = compute_features(align(sentiment, prices), window, horizon)
+    return features, summarize(features)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Join stored sentiment with prices and compute rolling features.")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--interval", default="1day")
+    parser.add_argument("--window", type=int, default=ANALYTICS_WINDOW, help="bars per rolling window")
+    parser.add_argument("--horizon", type=int, default=ANALYTICS_HORIZON, help="bars ahead for forward returns")
+    parser.add_argument("--symbols", help="comma-separated symbols (default: every stock with sentiment)")
+    parser.add_argument("--no-sync", action="store_true", help="use stored prices only")
+    parser.add_argument("--output", help="write the per-bar features to this Parquet file")
+    args = parser.parse_args()
+    configure_logging()
+
+    started = time.perf_counter()
+    try:
+        features, summary = analyze(args.days, args.interval, args.window, args.horizon,
+                                    args.symbols.split(',') if args.symbols else None, not args.no_sync)
+    finally:
+        close_pool()
+    if features is not None:
+        print(summary.sort_values('mentions', ascending=False).head(25).to_string())
+        print(f"\n{len(features)} bars for {len(summary)} symbols in {time.perf_counter() - started:.1f}s")
+        if args.output:
+            features.to_parquet(args.output, index=False)
+            print(f"Features written to '{args.output}'.")
@@ -0,0 +1,283 @@
+import os
+import re
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from metrics import metrics
+
+# "textblob" (exact TextBlob scores) or "lexicon" (vectorized NumPy scorer over the same lexicon)
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "textblob")
+# Worker processes for scoring (0 scores in the calling process)
+SENTIMENT_PROCESSES = int(os.getenv("SENTIMENT_PROCESSES", "0"))
+SENTIMENT_CHUNK_SIZE = int(os.getenv("SENTIMENT_CHUNK_SIZE", "64"))
+
+TOKEN_RE = re.compile(r"\w+(?:-\w+)*|[^\w\s]")
+
+
+def sentiment_category(polarity):
+    if polarity > 0:
+        return 'Positive'
+    elif polarity < 0:
+        return 'Negative'
+    return 'Neutral'
+
+
+def _result(polarity, subjectivity):
+    return {
+        'polarity': polarity,
+        'subjectivity': subjectivity,
+        'sentiment_category': sentiment_category(polarity)
+    }
+
+
+# Reference backend: one TextBlob per text
+def score_textblob(texts):
+    from textblob import TextBlob
+    results = []
+    for text in texts:
+        sentiment = TextBlob(text).sentiment
+        results.append(_result(sentiment.polarity, sentiment.subjectivity))
+    return results
+
+
+# Vectorized scorer over TextBlob's pattern lexicon.
+# Texts are tokenized into vocabulary ids and every step of pattern's assessment rules runs as NumPy
+# array operations over the whole batch: modifier chains ("very good"), negation ("not good"), intensity
+# inversion under negation and "!" boosts. Emoticons and the "(!)" irony marker are not scored, and the
+# tokenizer is a simple regex, so scores can differ slightly from TextBlob on unusual text.
+class LexiconScorer:
+    def __init__(self):
+        import numpy as np
+        from textblob.en import sentiment as lexicon
+
+        self.np = np
+        self.vocab = {}
+        polarity, subjectivity, intensity, modifier, ly_modifier = [], [], [], [], []
+        for word, senses in lexicon.items():
+            if None not in senses or ' ' in word:
+                continue
+            p, s, i = senses[None]
+            self.vocab[word] = len(self.vocab)
+            polarity.append(p)
+            subjectivity.append(s)
+            intensity.append(i)
+            is_modifier = any(pos in senses for pos in lexicon.modifiers)
+            modifier.append(is_modifier)
+            ly_modifier.append(is_modifier and word.endswith("ly"))
+        self.polarity = np.array(polarity)
+        self.subjectivity = np.array(subjectivity)
+        self.intensity = np.array(intensity)
+        self.modifier = np.array(modifier)
+        self.ly_modifier = np.array(ly_modifier)
+        self.negations = set(lexicon.negations)
+
+    # Index of the previous position where `mask` is set, within the same text (-1 if none)
+    def _previous(self, mask, doc_start):
+        np = self.np
+        positions = np.where(mask, np.arange(len(mask)), -1)
+        previous = np.empty_like(positions)
+        previous[0] = -1
+        previous[1:] = np.maximum.accumulate(positions)[:-1]
+        previous[previous < doc_start] = -1
+        return previous
+
+    def score(self, texts):
+        np = self.np
+        if not texts:
+            return []
+
+        ids, raw_lengths, lengths, negation, exclamation, doc = [], [], [], [], [], []
+        for n, text in enumerate(texts):
+            for token in TOKEN_RE.findall(text.lower()):
+                ids.append(self.vocab.get(token, -1))
+                raw_lengths.append(len(token))
+                lengths.append(len(token.strip("'")))
+                negation.append(token in self.negations)
+                exclamation.append(token == "!")
+                doc.append(n)
+        n_docs = len(texts)
+        if not ids:
+            return [_result(0.0, 0.0) for _ in texts]
+
+        ids = np.array(ids)
+        raw_lengths = np.array(raw_lengths)
+        lengths = np.array(lengths)
+        negation = np.array(negation)
+        exclamation = np.array(exclamation)
+        doc = np.array(doc)
+        doc_start = np.searchsorted(doc, doc)  # first token position of each token's text
+
+        known = ids >= 0
+        safe_ids = np.where(known, ids, 0)
+        p = np.where(known, self.polarity[safe_ids], 0.0)
+        s = np.where(known, self.subjectivity[safe_ids], 0.0)
+        i = np.where(known, self.intensity[safe_ids], 1.0)
+        is_modifier = known & self.modifier[safe_ids]
+        is_ly_modifier = known & self.ly_modifier[safe_ids]
+
+        # Modifiers carry across unknown words of up to two characters; a negation right after an
+        # "-ly" modifier ("really not good") negates the modifier's assessment and is then skipped,
+        # which can expose the next negation to the same modifier ("really not never good")
+        carries_modifier = known | (raw_lengths > 2)
+        absorbed = np.zeros(len(ids), dtype=bool)
+        while True:
+            previous = self._previous(carries_modifier & ~absorbed, doc_start)
+            newly_absorbed = negation & (previous >= 0) & is_ly_modifier[np.maximum(previous, 0)]
+            if (newly_absorbed == absorbed).all():
+                break
+            absorbed = newly_absorbed
+        merged = known & (previous >= 0) & is_modifier[np.maximum(previous, 0)]
+
+        # Negations carry across one-character tokens until the next word
+        carries_negation = known | (lengths > 1) | negation
+        previous_word = self._previous(carries_negation, doc_start)
+        negated = known & (previous_word >= 0) & (negation & ~absorbed)[np.maximum(previous_word, 0)]
+
+        # Assessments: a head word plus any words merged into it through modifiers
+        head = known & ~merged
+        group = np.cumsum(head) - 1
+        n_groups = int(head.sum())
+        group_negated = np.zeros(n_groups, dtype=bool)
+        group_negated[group[negated]] = True
+        group_negated[group[previous[absorbed]]] = True
+
+        factor = np.ones(len(ids))
+        prior = np.maximum(previous, 0)
+        factor[merged] = np.where(negated[prior], 1.0 / np.where(i[prior] == 0, 1.0, i[prior]), i[prior])[merged]
+        p = np.where(merged, np.clip(p * factor, -1.0, 1.0), p)
+        s = np.where(merged, np.clip(s * factor, -1.0, 1.0), s)
+
+        # Each assessment keeps the values of its last word
+        known_positions = np.flatnonzero(known)
+        known_groups = group[known_positions]
+        last = np.ones(len(known_positions), dtype=bool)
+        last[:-1] = known_groups[:-1] != known_groups[1:]
+        group_p = p[known_positions[last]]
+        group_s = s[known_positions[last]]
+        group_doc = doc[known_positions[last]]
+
+        # "!" boosts the most recent assessment of the same text (a later merge overwrites the boost)
+        group_end = known_positions[last]
+        boosted = exclamation & (group >= 0)
+        boosted_positions = np.flatnonzero(boosted)
+        boosted[boosted_positions] = ((group_doc[group[boosted_positions]] == doc[boosted_positions])
+                                      & (group_end[group[boosted_positions]] < boosted_positions))
+        boosts = np.bincount(group[boosted], minlength=n_groups)
+        group_p = np.clip(group_p * 1.25 ** boosts, -1.0, 1.0)
+        group_p = np.where(group_negated, group_p * -0.5, group_p)
+
+        counts = np.bincount(group_doc, minlength=n_docs)
+        polarity = np.bincount(group_doc, weights=group_p, minlength=n_docs) / np.maximum(counts, 1)
+        subjectivity = np.bincount(group_doc, weights=group_s, minlength=n_docs) / np.maximum(counts, 1)
+        return [_result(float(pol), float(subj)) for pol, subj in zip(polarity, subjectivity)]
+
+
+_lexicon_scorer = None
+
+
+def score_lexicon(texts):
+    global _lexicon_scorer
+    if _lexicon_scorer is None:
+        _lexicon_scorer = LexiconScorer()
+    return _lexicon_scorer.score(texts)
+
+
+BACKENDS = {
+    'textblob': score_textblob,
+    'lexicon': score_lexicon,
+}
+
+
+def _score_chunk(backend, texts):
+    return BACKENDS[backend](texts)
+
+
+# Load a backend's lexicon by scoring one short text
+def _warm_backend(backend):
+    BACKENDS[backend](["warm up"])
+
+
+# Batched sentiment scoring shared by both ingesters; with processes > 0 chunks run on a process pool
+class SentimentEngine:
+    def __init__(self, backend=SENTIMENT_BACKEND, processes=SENTIMENT_PROCESSES, chunk_size=SENTIMENT_CHUNK_SIZE):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown sentiment backend '{backend}' (expected one of {sorted(BACKENDS)})")
+        self.backend = backend
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.executor = ProcessPoolExecutor(max_workers=processes) if processes > 0 else None
+        self._warmed = False
+
+    # Load the backend's models ahead of the first batch. The ingesters call this once they know there is
+    # work (right after the first LLM requests go out), so empty runs never load TextBlob; with a process
+    # pool every worker loads its own copy in the background.
+    def warm(self):
+        if self._warmed:
+            return
+        self._warmed = True
+        with metrics.timer("sentiment_warm"):
+            if self.executor is None:
+                _warm_backend(self.backend)
+            else:
+                for _ in range(self.processes):
+                    self.executor.submit(_warm_backend, self.backend)
+
+    # Score a batch of texts, in input order
+    def score(self, texts):
+        return self.submit(texts).result()
+
+    # Start scoring a batch; returns a Future resolving to the list of results
+    def submit(self, texts):
+        texts = list(texts)
+        result = Future()
+        metrics.inc("sentiment_texts", len(texts))
+        if not texts:
+            result.set_result([])
+            return result
+        if self.executor is None or len(texts) <= self.chunk_size:
+            try:
+                with metrics.timer("sentiment"):
+                    result.set_result(_score_chunk(self.backend, texts))
+            except Exception as e:
+                result.set_exception(e)
+            return result
+
+        chunks = [texts[start:start + self.chunk_size] for start in range(0, len(texts), self.chunk_size)]
+        futures = [self.executor.submit(_score_chunk, self.backend, chunk) for chunk in chunks]
+        remaining = [len(futures)]
+        started = time.perf_counter()
+
+        def collect(_):
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+            metrics.observe("stage_seconds", time.perf_counter() - started, stage="sentiment")
+            try:
+                result.set_result([item for future in futures for item in future.result()])
+            except Exception as e:
+                result.set_exception(e)
+
+        for future in futures:
+            future.add_done_callback(collect)
+        return result
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+_engine = None
+
+
+def get_sentiment_engine():
+    global _engine
+    if _engine is None:
+        _engine = SentimentEngine()
+    return _engine
+
+
+def close_sentiment_engine():
+    global _engine
+    if _engine is not None:
+        _engine.close()
+        _engine = None
@@ -0,0 +1,40 @@
+import logging
+from db_pool import get_connection
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Run-wide set of source URLs, resolved against the `source` table in bulk
+class KnownUrls:
+    def __init__(self):
+        self.known = set()    # URLs that already have a `source` row
+        self.checked = set()  # URLs already resolved against the database
+
+    def __contains__(self, url):
+        return url in self.known
+
+    def __len__(self):
+        return len(self.known)
+
+    # Remember a URL written during this run (or one that never needs writing)
+    def add(self, url):
+        self.known.add(url)
+        self.checked.add(url)
+
+    # Return the URLs (in input order) that are not in `source` yet, using one round trip
+    def filter_new(self, urls):
+        pending = list({url for url in urls if url not in self.checked})
+        if pending:
+            try:
+                with get_connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT url FROM source WHERE url = ANY(%s);", (pending,))
+                        self.known.update(row[0] for row in cur.fetchall())
+            except Exception as e:
+                logger.error("Error checking existing URLs: %s", e)
+                return []
+            self.checked.update(pending)
+        new = [url for url in urls if url not in self.known]
+        metrics.inc("known_urls_skipped", len(urls) - len(new))
+        return new
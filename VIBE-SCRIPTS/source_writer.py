@@ -0,0 +1,302 @@
+import logging
+import os
+import threading
+import time
+from db_pool import get_connection
+from metrics import metrics
+
+# Flush thresholds (override through the environment)
+SOURCE_WRITER_BATCH_SIZE = int(os.getenv("SOURCE_WRITER_BATCH_SIZE", "200"))
+SOURCE_WRITER_MAX_DELAY = float(os.getenv("SOURCE_WRITER_MAX_DELAY", "5"))
+
+SOURCE_COLUMNS = "(url, source_origin_id, predicted_sentiment_score, predicted_opinion_score, date_fetched)"
+
+logger = logging.getLogger(__name__)
+
+
+# Buffered write-behind writer for `source` rows and their `stocks_source` links.
+# Links are resolved by URL, so a stock can also be attached to a row written earlier (or by another run).
+# `on_written(urls)` is called after each commit with the record URLs that now have a `source` row (copies
+# included) and the URLs whose scores were updated.
+class SourceWriter:
+    def __init__(self, batch_size=SOURCE_WRITER_BATCH_SIZE, max_delay=SOURCE_WRITER_MAX_DELAY, on_written=None):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.on_written = on_written
+        self.pending = {}  # url -> record, so a URL queued twice becomes one row
+        self.pending_links = {}  # url -> stock ids to link to an already written row
+        self.pending_scores = {}  # url -> (sentiment, opinion) for an already written row
+        self.pending_copies = {}  # url -> copy of a written row (near-duplicates)
+        self.first_pending_at = None
+        self.stats = {'inserted': 0, 'duplicates': 0, 'links': 0, 'updated': 0, 'copied': 0, 'failed': 0, 'batches': 0}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_on_timer, daemon=True)
+        self._timer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Queue one enriched record; flushes inline once the batch is full
+    def add(self, url, source_origin_id, sentiment_score, opinion_score, date_fetched, stock_ids):
+        with self._lock:
+            record = self.pending.get(url)
+            if record:
+                record['stock_ids'].update(stock_ids)
+            else:
+                self.pending[url] = {
+                    'url': url,
+                    'source_origin_id': source_origin_id,
+                    'sentiment_score': sentiment_score,
+                    'opinion_score': opinion_score,
+                    'date_fetched': date_fetched,
+                    'stock_ids': set(stock_ids),
+                }
+            if self.first_pending_at is None:
+                self.first_pending_at = time.monotonic()
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    # Queue extra stock links for a URL that is (or will be) in `source`
+    def add_links(self, url, stock_ids):
+        with self._lock:
+            record = self.pending.get(url)
+            if record:
+                record['stock_ids'].update(stock_ids)
+                return
+            self.pending_links.setdefault(url, set()).update(stock_ids)
+            if self.first_pending_at is None:
+                self.first_pending_at = time.monotonic()
+            full = len(self.pending) + len(self.pending_links) >= self.batch_size
+        if full:
+            self.flush()
+
+    # Queue new scores for a URL that is (or will be) in `source`
+    def update_scores(self, url, sentiment_score, opinion_score):
+        with self._lock:
+            self.pending_scores[url] = (sentiment_score, opinion_score)
+            if self.first_pending_at is None:
+                self.first_pending_at = time.monotonic()
+            full = len(self.pending) + len(self.pending_links) + len(self.pending_scores) >= self.batch_size
+        if full:
+            self.flush()
+
+    # Queue a `source` row for a near-duplicate URL that reuses the scores and stock links of `original_url`'s
+    # row (written earlier, or queued before this call). Copies of a URL with no row are skipped and counted.
+    def add_copy(self, url, original_url, source_origin_id, date_fetched):
+        with self._lock:
+            self.pending_copies[url] = {
+                'url': url,
+                'original_url': original_url,
+                'source_origin_id': source_origin_id,
+                'date_fetched': date_fetched,
+            }
+            if self.first_pending_at is None:
+                self.first_pending_at = time.monotonic()
+            full = len(self.pending) + len(self.pending_copies) >= self.batch_size
+        if full:
+            self.flush()
+
+    # Write everything buffered so far in one transaction
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                records = list(self.pending.values())
+                links = self.pending_links
+                scores = self.pending_scores
+                copies = list(self.pending_copies.values())
+                self.pending = {}
+                self.pending_links = {}
+                self.pending_scores = {}
+                self.pending_copies = {}
+                self.first_pending_at = None
+            if not records and not links and not scores and not copies:
+                return
+            with metrics.timer("db_write"):
+                try:
+                    self._write_batch(records, links, scores, copies)
+                except Exception as e:
+                    logger.warning("Batch insert of %d records failed (%s). Retrying one by one.", len(records), e)
+                    for record in records:
+                        self._write_one(record)
+                    self._write_links(links)
+                    self._write_scores(scores)
+                    self._write_copies(copies)
+            self.stats['batches'] += 1
+
+    # Flush what is left and stop the timer thread
+    def close(self):
+        self._closed.set()
+        self._timer.join()
+        self.flush()
+        self.print_stats()
+
+    def print_stats(self):
+        stats = self.stats
+        logger.info("Source writer: %d inserted, %d duplicates, %d copies, %d stock links, %d score updates, "
+                    "%d failed in %d batches.", stats['inserted'], stats['duplicates'], stats['copied'], stats['links'],
+                    stats['updated'], stats['failed'], stats['batches'])
+
+    def _flush_on_timer(self):
+        while not self._closed.wait(min(1.0, self.max_delay)):
+            with self._lock:
+                due = (self.first_pending_at is not None
+                       and time.monotonic() - self.first_pending_at >= self.max_delay)
+            if due:
+                self.flush()
+
+    # Multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING, then one multi-row link insert.
+    # Records whose URL already exists are linked to the existing row instead of being dropped.
+    # Copies follow (after the rows they copy), then score updates as one UPDATE ... FROM (VALUES ...), all in
+    # the same transaction.
+    def _write_batch(self, records, links=None, scores=None, copies=None):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                source_ids = {}
+                if records:
+                    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(records))
+                    params = []
+                    for record in records:
+                        params.extend((record['url'], record['source_origin_id'], record['sentiment_score'],
+                                       record['opinion_score'], record['date_fetched']))
+                    cur.execute(f"""
+                        INSERT INTO source {SOURCE_COLUMNS}
+                        VALUES {values}
+                        ON CONFLICT DO NOTHING
+                        RETURNING id, url;
+                    """, params)
+                    source_ids = {url: source_id for source_id, url in cur.fetchall()}
+                inserted = dict(source_ids)
+
+                # Resolve ids for duplicates and link-only URLs in one round trip
+                wanted = {record['url']: record['stock_ids'] for record in records}
+                for url, stock_ids in (links or {}).items():
+                    wanted.setdefault(url, set()).update(stock_ids)
+                missing = [url for url in wanted if url not in source_ids]
+                if missing:
+                    cur.execute("SELECT id, url FROM source WHERE url = ANY(%s);", (missing,))
+                    source_ids.update({url: source_id for source_id, url in cur.fetchall()})
+
+                pairs = [
+                    (stock_id, source_ids[url])
+                    for url, stock_ids in wanted.items() if url in source_ids
+                    for stock_id in sorted(stock_ids)
+                ]
+                link_count = 0
+                if pairs:
+                    cur.execute(f"""
+                        INSERT INTO stocks_source (stock_id, source_id)
+                        SELECT v.stock_id, v.source_id
+                        FROM (VALUES {", ".join(["(%s::bigint, %s::bigint)"] * len(pairs))}) AS v(stock_id, source_id)
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM stocks_source s
+                            WHERE s.stock_id = v.stock_id AND s.source_id = v.source_id
+                        );
+                    """, [value for pair in pairs for value in pair])
+                    link_count = cur.rowcount
+
+                copied = {}  # url -> id of the copy's new row
+                if copies:
+                    cur.execute(f"""
+                        WITH v (url, original_url, source_origin_id, date_fetched) AS (
+                            VALUES {", ".join(["(%s, %s, %s::bigint, %s::timestamp)"] * len(copies))}
+                        )
+                        INSERT INTO source {SOURCE_COLUMNS}
+                        SELECT v.url, v.source_origin_id, o.predicted_sentiment_score, o.predicted_opinion_score,
+                               v.date_fetched
+                        FROM v JOIN source o ON o.url = v.original_url
+                        ON CONFLICT DO NOTHING
+                        RETURNING id, url;
+                    """, [value for copy in copies
+                          for value in (copy['url'], copy['original_url'], copy['source_origin_id'], copy['date_fetched'])])
+                    copied = {url: source_id for source_id, url in cur.fetchall()}
+                    originals = {copy['url']: copy['original_url'] for copy in copies if copy['url'] in copied}
+                    if originals:
+                        cur.execute(f"""
+                            INSERT INTO stocks_source (stock_id, source_id)
+                            SELECT ss.stock_id, v.source_id
+                            FROM (VALUES {", ".join(["(%s::bigint, %s)"] * len(originals))}) AS v(source_id, original_url)
+                            JOIN source o ON o.url = v.original_url
+                            JOIN stocks_source ss ON ss.source_id = o.id;
+                        """, [value for url, original_url in originals.items() for value in (copied[url], original_url)])
+                        link_count += cur.rowcount
+
+                updated = 0
+                if scores:
+                    cur.execute(f"""
+                        UPDATE source s
+                        SET predicted_sentiment_score = v.sentiment, predicted_opinion_score = v.opinion
+                        FROM (VALUES {", ".join(["(%s, %s::double precision, %s::double precision)"] * len(scores))})
+                            AS v(url, sentiment, opinion)
+                        WHERE s.url = v.url;
+                    """, [value for url, (sentiment, opinion) in scores.items() for value in (url, sentiment, opinion)])
+                    updated = cur.rowcount
+            conn.commit()
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for record in records:
+                if record['url'] in inserted:
+                    logger.debug("Inserted source record with ID: %s", inserted[record['url']])
+                else:
+                    logger.debug("Duplicate entry found for URL '%s'. Linking stocks to the existing row.", record['url'])
+        self.stats['inserted'] += len(inserted)
+        self.stats['duplicates'] += len(records) - len(inserted)
+        self.stats['links'] += link_count
+        metrics.inc("sources_inserted", len(inserted))
+        metrics.inc("source_duplicates", len(records) - len(inserted))
+        metrics.inc("stock_links", link_count)
+        self.stats['updated'] += updated
+        metrics.inc("source_score_updates", updated)
+        self.stats['copied'] += len(copied)
+        metrics.inc("source_copies", len(copied))
+        # Copies whose URL was already written, or whose original has no row (never written, or its write failed)
+        if copies and len(copied) < len(copies):
+            metrics.inc("source_copies_skipped", len(copies) - len(copied))
+            logger.debug("Skipped %d copies: URL already written or original missing.", len(copies) - len(copied))
+        if self.on_written is not None and (records or scores or copied):
+            self.on_written([record['url'] for record in records if record['url'] in source_ids] + list(copied)
+                            + list(scores or ()))
+
+    # Fallback path: one transaction per record so a bad row only loses itself
+    def _write_one(self, record):
+        try:
+            self._write_batch([record])
+        except Exception as e:
+            self.stats['failed'] += 1
+            metrics.inc("source_write_failures")
+            logger.error("Error inserting source record for URL '%s': %s", record['url'], e)
+
+    def _write_links(self, links):
+        if not links:
+            return
+        try:
+            self._write_batch([], links)
+        except Exception as e:
+            self.stats['failed'] += len(links)
+            metrics.inc("source_write_failures", len(links))
+            logger.error("Error linking stocks for %d URLs: %s", len(links), e)
+
+    def _write_copies(self, copies):
+        if not copies:
+            return
+        try:
+            self._write_batch([], None, None, copies)
+        except Exception as e:
+            self.stats['failed'] += len(copies)
+            metrics.inc("source_write_failures", len(copies))
+            logger.error("Error copying rows for %d URLs: %s", len(copies), e)
+
+    def _write_scores(self, scores):
+        if not scores:
+            return
+        try:
+            self._write_batch([], None, scores)
+        except Exception as e:
+            self.stats['failed'] += len(scores)
+            metrics.inc("source_write_failures", len(scores))
+            logger.error("Error updating scores for %d URLs: %s", len(scores), e)
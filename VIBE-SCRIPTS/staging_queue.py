@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from metrics import metrics
+
+# Staging database for the news pipeline ("off" keeps the queue in memory, so nothing survives a crash).
+# Use one file per worker process; a restart resets that file's in-flight summaries.
+NEWS_STAGING_PATH = os.getenv("NEWS_STAGING_PATH", "news_staging.sqlite3")
+# Failed summaries a long-running process retries (retry_failed()) before leaving the article for the next restart
+NEWS_STAGING_MAX_ATTEMPTS = int(os.getenv("NEWS_STAGING_MAX_ATTEMPTS", "5"))
+
+# Article stages, in order. Rows are deleted once their `source` row is committed.
+FETCHED, SUMMARIZING, SUMMARIZED, SCORED, WRITING = "fetched", "summarizing", "summarized", "scored", "writing"
+# Summary request failed; retried by retry_failed() or the next run rather than written without a summary
+FAILED = "failed"
+# Fast path: articles written with title scores wait in `refine` for their summary, then go
+# refining -> refined -> updating until the refined scores are committed (a failed summary waits in
+# `refine_failed` for retry_failed() or the next run)
+REFINE, REFINING, REFINED, UPDATING, REFINE_FAILED = "refine", "refining", "refined", "updating", "refine_failed"
+STAGES = (FETCHED, SUMMARIZING, SUMMARIZED, SCORED, WRITING, FAILED, REFINE, REFINING, REFINED, UPDATING, REFINE_FAILED)
+# Stages whose article already has a `source` row
+WRITTEN_STAGES = (REFINE, REFINING, REFINED, UPDATING, REFINE_FAILED)
+
+logger = logging.getLogger(__name__)
+
+
+# Durable queue between the news pipeline's stages: fetched -> summarizing -> summarized -> scored -> writing,
+# then deleted once the `source` row is committed. Every transition is committed to SQLite (WAL) before the
+# next stage sees the article, so after a crash or an LLM outage a restart resumes each article at the stage
+# it reached: paid-for summaries are scored, scored articles are written, and only summaries that were in
+# flight or failed are requested again (on open, "summarizing" and "failed" rows go back to "fetched" and
+# "writing" rows to "scored"; retry_failed() also retries failed summaries while the process runs, up to
+# NEWS_STAGING_MAX_ATTEMPTS times per article). Stages pull bounded batches, so a slow stage leaves work on disk, not in memory.
+# Articles written on the fast path with title scores (refine = 1) stay queued until their summary-based
+# scores replace the title scores; each such pair is kept in `score_comparison` for the score report.
+class StagingQueue:
+    def __init__(self, path=NEWS_STAGING_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS news_article (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                title TEXT,
+                publish_time TEXT,
+                source_origin_id INTEGER,
+                stock_ids TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                summary TEXT,
+                polarity REAL,
+                subjectivity REAL,
+                updated_at REAL NOT NULL
+            );
+        """)
+        # Fast-path columns (added in place to staging files created before them)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(news_article);")}
+        for column, kind in (("refine", "INTEGER NOT NULL DEFAULT 0"), ("title_polarity", "REAL"),
+                             ("title_subjectivity", "REAL"), ("attempts", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE news_article ADD COLUMN {column} {kind};")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS news_article_stage ON news_article (stage, seq);")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS score_comparison (
+                url TEXT PRIMARY KEY,
+                title TEXT,
+                summary TEXT,
+                title_polarity REAL,
+                title_subjectivity REAL,
+                polarity REAL,
+                subjectivity REAL,
+                refined_at REAL NOT NULL
+            );
+        """)
+        # Work in flight when the last process stopped: summaries were never stored, writes may not have committed
+        with self._lock:
+            for stage, previous in ((SUMMARIZING, FETCHED), (FAILED, FETCHED), (WRITING, SCORED),
+                                    (REFINING, REFINE), (REFINE_FAILED, REFINE), (UPDATING, REFINED)):
+                self.conn.execute("UPDATE news_article SET stage = ? WHERE stage = ?;", (previous, stage))
+            self.conn.execute("UPDATE news_article SET attempts = 0 WHERE attempts > 0;")
+        counts = self.counts()
+        if any(counts.values()):
+            logger.info("Staging queue %s: resuming %s.", path,
+                        ", ".join(f"{count} {stage}" for stage, count in counts.items() if count))
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM news_article;").fetchone()[0]
+
+    # Articles per stage
+    def counts(self):
+        with self._lock:
+            rows = dict(self.conn.execute("SELECT stage, COUNT(*) FROM news_article GROUP BY stage;").fetchall())
+        return {stage: rows.get(stage, 0) for stage in STAGES}
+
+    # Which of these URLs are staged (url -> stage)
+    def stages(self, urls):
+        urls = list(urls)
+        found = {}
+        with self._lock:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                found.update(self.conn.execute(
+                    f"SELECT url, stage FROM news_article WHERE url IN ({', '.join('?' * len(chunk))});", chunk
+                ).fetchall())
+        return found
+
+    # Stage a newly fetched article
+    def put(self, url, title, publish_time, source_origin_id, stock_ids):
+        with self._lock:
+            self.conn.execute("""
+                INSERT OR IGNORE INTO news_article (url, title, publish_time, source_origin_id, stock_ids, stage,
+                                                    updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?);
+            """, (url, title, publish_time.isoformat() if publish_time else None, source_origin_id,
+                  json.dumps(sorted(stock_ids)), FETCHED, time.time()))
+        metrics.inc("staging_articles", stage=FETCHED)
+
+    # Link more stocks to a staged article
+    def add_stocks(self, url, stock_ids):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE;")
+            try:
+                row = self.conn.execute("SELECT stock_ids FROM news_article WHERE url = ?;", (url,)).fetchone()
+                if row:
+                    merged = sorted(set(json.loads(row[0])) | set(stock_ids))
+                    self.conn.execute("UPDATE news_article SET stock_ids = ? WHERE url = ?;", (json.dumps(merged), url))
+                self.conn.execute("COMMIT;")
+            except Exception:
+                self.conn.execute("ROLLBACK;")
+                raise
+
+    # Move up to `limit` of the oldest articles from one stage to the next and return them
+    def take(self, stage, next_stage, limit):
+        if limit <= 0:
+            return []
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE;")
+            try:
+                rows = self.conn.execute("""
+                    SELECT url, title, publish_time, source_origin_id, stock_ids, summary, polarity, subjectivity
+                    FROM news_article WHERE stage = ? ORDER BY seq LIMIT ?;
+                """, (stage, limit)).fetchall()
+                if next_stage != stage:
+                    self.conn.executemany("UPDATE news_article SET stage = ?, updated_at = ? WHERE url = ?;",
+                                          [(next_stage, time.time(), row[0]) for row in rows])
+                self.conn.execute("COMMIT;")
+            except Exception:
+                self.conn.execute("ROLLBACK;")
+                raise
+        return [{
+            'url': url, 'title': title,
+            'publish_time': datetime.fromisoformat(publish_time) if publish_time else None,
+            'source_origin_id': source_origin_id, 'stock_ids': set(json.loads(stock_ids)),
+            'summary': summary, 'polarity': polarity, 'subjectivity': subjectivity,
+        } for url, title, publish_time, source_origin_id, stock_ids, summary, polarity, subjectivity in rows]
+
+    # Store finished summaries: {url: summary} (stage REFINED for refinements)
+    def set_summaries(self, summaries, stage=SUMMARIZED):
+        self._update("UPDATE news_article SET summary = ?, stage = ?, updated_at = ? WHERE url = ?;",
+                     [(summary, stage, time.time(), url) for url, summary in summaries.items()])
+        metrics.inc("staging_articles", len(summaries), stage=stage)
+
+    # Park articles whose summary request failed until retry_failed() or the next run (stage REFINE_FAILED for
+    # refinements)
+    def set_failed(self, urls, stage=FAILED):
+        self._update("UPDATE news_article SET stage = ?, attempts = attempts + 1, updated_at = ? WHERE url = ?;",
+                     [(stage, time.time(), url) for url in urls])
+        metrics.inc("staging_articles", len(urls), stage=stage)
+
+    # Send failed summaries back to be requested again (failed -> fetched, refine_failed -> refine), except
+    # articles that already failed `max_attempts` times since the queue was opened; those wait for a restart.
+    # Returns the number of articles retried.
+    def retry_failed(self, max_attempts=NEWS_STAGING_MAX_ATTEMPTS):
+        retried = 0
+        with self._lock:
+            self.conn.execute("BEGIN;")
+            try:
+                for stage, previous in ((FAILED, FETCHED), (REFINE_FAILED, REFINE)):
+                    retried += self.conn.execute(
+                        "UPDATE news_article SET stage = ?, updated_at = ? WHERE stage = ? AND attempts < ?;",
+                        (previous, time.time(), stage, max_attempts)).rowcount
+                parked = self.conn.execute("SELECT COUNT(*) FROM news_article WHERE stage IN (?, ?);",
+                                           (FAILED, REFINE_FAILED)).fetchone()[0]
+                self.conn.execute("COMMIT;")
+            except Exception:
+                self.conn.execute("ROLLBACK;")
+                raise
+        if retried:
+            metrics.inc("staging_retries", retried)
+            logger.info("Staging queue: retrying %d failed summaries.", retried)
+        if parked:
+            logger.warning("Staging queue: %d articles failed %d summary attempts; they are retried on restart.",
+                           parked, max_attempts)
+        return retried
+
+    # Store sentiment results: {url: {'polarity', 'subjectivity'}} (stage UPDATING for refinements)
+    def set_scores(self, scores, stage=SCORED):
+        self._update("UPDATE news_article SET polarity = ?, subjectivity = ?, stage = ?, updated_at = ? WHERE url = ?;",
+                     [(score['polarity'], score['subjectivity'], stage, time.time(), url)
+                      for url, score in scores.items()])
+        metrics.inc("staging_articles", len(scores), stage=stage)
+
+    # Fast path: store title scores and keep the article for refinement once it is written
+    def set_title_scores(self, scores):
+        self._update("""
+            UPDATE news_article SET polarity = ?, subjectivity = ?, title_polarity = ?, title_subjectivity = ?,
+                                    refine = 1, stage = ?, updated_at = ?
+            WHERE url = ?;
+        """, [(score['polarity'], score['subjectivity'], score['polarity'], score['subjectivity'], SCORED, time.time(),
+               url) for url, score in scores.items()])
+        metrics.inc("staging_articles", len(scores), stage="title_scored")
+
+    # SourceWriter's on_written callback: committed rows are dropped, except fast-path rows, which move on to
+    # REFINE; committed refinements are recorded in score_comparison and dropped
+    def mark_written(self, urls):
+        params = [(url,) for url in urls]
+        if not params:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN;")
+            try:
+                self.conn.executemany("""
+                    INSERT OR REPLACE INTO score_comparison (url, title, summary, title_polarity, title_subjectivity,
+                                                             polarity, subjectivity, refined_at)
+                    SELECT url, title, summary, title_polarity, title_subjectivity, polarity, subjectivity, ?
+                    FROM news_article WHERE url = ? AND stage = ?;
+                """, [(time.time(), url, UPDATING) for url in urls])
+                self.conn.executemany(f"""
+                    DELETE FROM news_article WHERE url = ? AND NOT (stage = '{WRITING}' AND refine = 1);
+                """, params)
+                self.conn.executemany("UPDATE news_article SET stage = ?, updated_at = ? WHERE url = ? AND stage = ?;",
+                                      [(REFINE, time.time(), url, WRITING) for url in urls])
+                self.conn.execute("COMMIT;")
+            except Exception:
+                self.conn.execute("ROLLBACK;")
+                raise
+        metrics.inc("staging_articles", len(urls), stage="written")
+
+    def _update(self, query, params):
+        if not params:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN;")
+            try:
+                self.conn.executemany(query, params)
+                self.conn.execute("COMMIT;")
+            except Exception:
+                self.conn.execute("ROLLBACK;")
+                raise
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# Staging queue for the news ingester (in memory when NEWS_STAGING_PATH is "off")
+def open_default_staging():
+    if NEWS_STAGING_PATH.lower() in ("", "off", "none"):
+        return StagingQueue(":memory:")
+    return StagingQueue()
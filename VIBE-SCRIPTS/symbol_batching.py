@@ -0,0 +1,70 @@
+import json
+import os
+
+# Batched symbol identification: several posts per request, up to a token budget
+SYMBOL_BATCH_ENABLED = os.getenv("SYMBOL_BATCH_ENABLED", "1") not in ("0", "false", "off")
+SYMBOL_BATCH_TOKEN_BUDGET = int(os.getenv("SYMBOL_BATCH_TOKEN_BUDGET", "6000"))
+SYMBOL_BATCH_MAX_POSTS = int(os.getenv("SYMBOL_BATCH_MAX_POSTS", "20"))
+
+BATCH_SYSTEM_PROMPT = (
+    "Identify stock ticker symbols in each post. "
+    "Reply with a JSON object of the form {\"results\": {\"<post id>\": [\"TICKER\", ...]}} "
+    "containing every post id exactly once; use an empty list when a post mentions no tickers."
+)
+
+
+# Rough token count (about four characters per token for English text)
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+# Split posts into batches that fit the token budget; posts too large for any batch come back on their own
+def pack_batches(posts, token_budget=SYMBOL_BATCH_TOKEN_BUDGET, max_posts=SYMBOL_BATCH_MAX_POSTS):
+    batches, singles = [], []
+    batch, used = [], 0
+    for post in posts:
+        tokens = estimate_tokens(post['text']) + 10  # id and separators
+        if tokens > token_budget:
+            singles.append(post)
+            continue
+        if batch and (used + tokens > token_budget or len(batch) >= max_posts):
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(post)
+        used += tokens
+    if batch:
+        batches.append(batch)
+    return batches, singles
+
+
+# One chat-completion request covering every post in the batch; post ids are their positions
+def batch_symbols_request(batch):
+    sections = [f"### Post {post_id}\n{post['text']}" for post_id, post in enumerate(batch, 1)]
+    return {
+        'model': "gpt-4o-mini",
+        'messages': [
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": "\n\n".join(sections)}
+        ],
+        'temperature': 0.1,
+        'response_format': {"type": "json_object"}
+    }
+
+
+# Validate a batch reply and map it back to the posts; raises ValueError if it doesn't fit
+def parse_batch_reply(reply, batch):
+    try:
+        results = json.loads(reply)['results']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"reply is not the expected JSON object: {e}")
+    expected = {str(post_id) for post_id in range(1, len(batch) + 1)}
+    if not isinstance(results, dict) or set(results) != expected:
+        raise ValueError(f"reply covers posts {sorted(results) if isinstance(results, dict) else results}, "
+                         f"expected {sorted(expected)}")
+    symbols_by_post = []
+    for post_id, post in enumerate(batch, 1):
+        symbols = results[str(post_id)]
+        if not isinstance(symbols, list) or not all(isinstance(symbol, str) for symbol in symbols):
+            raise ValueError(f"post {post_id} symbols are not a list of strings")
+        symbols_by_post.append((post, [symbol.strip() for symbol in symbols if symbol.strip()]))
+    return symbols_by_post
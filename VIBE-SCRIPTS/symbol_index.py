@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+import time
+from db_pool import get_connection
+
+# Seconds between incremental refreshes (0 disables automatic refresh)
+STOCK_INDEX_REFRESH_SECONDS = float(os.getenv("STOCK_INDEX_REFRESH_SECONDS", "300"))
+
+logger = logging.getLogger(__name__)
+
+
+# Process-wide map of lowercase stock abbreviation -> stock id (and company name).
+# Loaded once, kept current by add(), and refreshed by watermark (max stock id) instead of a full reload.
+class StockSymbolIndex:
+    def __init__(self, refresh_seconds=STOCK_INDEX_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.ids = {}
+        self.names = {}  # lowercase abbreviation -> company name
+        self.watermark = 0
+        self.loaded = False
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self.ids)
+
+    # Stock id for a symbol (case-insensitive), or None
+    def get(self, symbol):
+        self._ensure_loaded()
+        return self.ids.get(symbol.lower())
+
+    # Snapshot of (lowercase abbreviation, stock id) pairs
+    def items(self):
+        self._ensure_loaded()
+        with self._lock:
+            return list(self.ids.items())
+
+    # Record a stock inserted by this process
+    def add(self, symbol, stock_id, name=None):
+        with self._lock:
+            self.ids[symbol.lower()] = stock_id
+            if name:
+                self.names[symbol.lower()] = name
+            self.watermark = max(self.watermark, stock_id)
+
+    # Pull only stocks added since the watermark
+    def refresh(self):
+        self._ensure_loaded()
+        rows = self._fetch("SELECT id, LOWER(abbreviation), name FROM stock WHERE id > %s ORDER BY id;", (self.watermark,))
+        if rows is None:
+            return 0
+        self._apply(rows)
+        if rows:
+            logger.info("Stock index: %d new stocks since last refresh.", len(rows))
+        return len(rows)
+
+    # Refresh if the last refresh is older than refresh_seconds
+    def refresh_if_stale(self):
+        if self.refresh_seconds and time.monotonic() - self.refreshed_at >= self.refresh_seconds:
+            self.refresh()
+
+    def _ensure_loaded(self):
+        if self.loaded:
+            return
+        rows = self._fetch("SELECT id, LOWER(abbreviation), name FROM stock;", ())
+        if rows is None:
+            return
+        self._apply(rows)
+        self.loaded = True
+        logger.info("Stock index: loaded %d stocks.", len(self.ids))
+
+    def _fetch(self, query, params):
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, params)
+                    return cur.fetchall()
+        except Exception as e:
+            logger.error("Error fetching stocks: %s", e)
+            return None
+
+    def _apply(self, rows):
+        with self._lock:
+            for stock_id, abbreviation, name in rows:
+                if abbreviation is not None:
+                    self.ids[abbreviation] = stock_id
+                    if name:
+                        self.names[abbreviation] = name
+                self.watermark = max(self.watermark, stock_id)
+            self.refreshed_at = time.monotonic()
+
+
+_index = None
+
+
+# Shared index for the process
+def get_symbol_index():
+    global _index
+    if _index is None:
+        _index = StockSymbolIndex()
+    return _index
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import pytest
+
+pytest.importorskip("pgserver")
+from bench_pipelines import BenchDatabase, make_symbols
+
+# A failed Reddit write must leave its posts new for the retry: the daemon and the stream keep one KnownUrls
+# for every poll, so a URL marked known before its commit would be skipped (and its cursor advanced) forever.
+# Runs against a temporary Postgres (pgserver); symbols are cashtags, so no LLM is needed.
+
+ORIGIN = "WallStreetBets"
+
+
+@pytest.fixture(scope="module")
+def db():
+    workdir = tempfile.mkdtemp(prefix="vibe-test-")
+    database = BenchDatabase()
+    database.create(make_symbols(4))
+    # The pipeline modules read their settings at import time
+    os.environ.update({
+        'DATABASE_URL': database.url,
+        'LLM_CACHE_PATH': "off",
+        'NEAR_DUP_INDEX_PATH': os.path.join(workdir, "near_dup_index.sqlite3"),
+        'REDDIT_CURSOR_PATH': os.path.join(workdir, "reddit_cursor.json"),
+    })
+    yield database
+    from db_pool import close_pool
+    from near_duplicates import close_near_duplicate_index
+    from sentiment_engine import close_sentiment_engine
+    close_near_duplicate_index()
+    close_sentiment_engine()
+    close_pool()
+    database.drop()
+
+
+# Make every SourceWriter write raise while `failing['on']` is set
+@pytest.fixture
+def failing(monkeypatch):
+    from source_writer import SourceWriter
+    state = {'on': True}
+    write_batch = SourceWriter._write_batch
+
+    def flaky(self, *args, **kwargs):
+        if state['on']:
+            raise RuntimeError("database unavailable")
+        return write_batch(self, *args, **kwargs)
+
+    monkeypatch.setattr(SourceWriter, '_write_batch', flaky)
+    return state
+
+
+def make_posts(name, count):
+    symbols = make_symbols(4)
+    return [{'title': f"Post {number} about {symbols[number % 4]}",
+             'text': f"Deep dive number {number} on ${symbols[number % 4]} with plenty of detail {name}",
+             'url': f"https://www.reddit.com/r/wallstreetbets/comments/{name}{number}", 'author': "user",
+             'created_utc': 1700000000 + number, 'subreddit': "wallstreetbets"} for number in range(count)]
+
+
+def test_failed_write_is_retried(db, failing):
+    import reddit_api_SourcesTable as reddit
+    from source_dedupe import KnownUrls
+
+    posts = make_posts("retry", 5)
+    known_urls = KnownUrls()
+    before = db.counts()[0]
+    assert reddit.process_posts(posts, ORIGIN, known_urls) is None
+    assert db.counts()[0] == before
+
+    failing['on'] = False
+    assert reddit.process_posts(posts, ORIGIN, known_urls) == len(posts)
+    assert db.counts()[0] == before + len(posts)
+    # Written now, so a third poll skips them
+    assert reddit.process_posts(posts, ORIGIN, known_urls) == 0
+
+
+def test_daemon_keeps_cursor_until_written(db, failing):
+    from concurrent.futures import Future
+    from ingest_daemon import IngestDaemon
+    from reddit_api_SourcesTable import process_posts
+    from reddit_cursor import RedditCursor
+
+    daemon = IngestDaemon(news=False, sources_spec=f"wallstreetbets:*::{ORIGIN}")
+    daemon.cursor = RedditCursor()
+    key = next(iter(daemon.sources))
+    posts = make_posts("daemon", 3)
+    before = db.counts()[0]
+
+    def poll():
+        future = Future()
+        future.set_result({'posts': posts, 'newest': ("t3_daemon2", posts[-1]['created_utc'])})
+        daemon._handle(daemon.reddit_schedule, key, future, None, process_posts)
+
+    poll()
+    assert key not in daemon.cursor.positions
+    failing['on'] = False
+    poll()
+    assert daemon.cursor.positions[key]['fullname'] == "t3_daemon2"
+    assert db.counts()[0] == before + len(posts)
+
+
+def test_stream_retries_failed_batch(db, failing):
+    from types import SimpleNamespace
+    from bench_pipelines import FakeSubmission
+    from reddit_api_SourcesTable import stream_posts
+    from reddit_cursor import RedditCursor
+    from reddit_sources import parse_sources, source_key
+
+    symbols = make_symbols(4)
+    submissions = [FakeSubmission("wallstreetbets", 9000 + number, 1800000000 + number, "DD", f"Stream post {number}",
+                                  f"Stream number {number} on ${symbols[number % 4]} with plenty of detail")
+                   for number in range(3)]
+
+    # One response with the posts, a pause that flushes them into a failing write, a pause that flushes them
+    # again once writes work, then Ctrl-C
+    def submissions_stream(pause_after=None):
+        yield from submissions
+        yield None
+        failing['on'] = False
+        yield None
+        raise KeyboardInterrupt
+
+    subreddit = SimpleNamespace(display_name="wallstreetbets",
+                                stream=SimpleNamespace(submissions=submissions_stream))
+    reddit = SimpleNamespace(subreddit=lambda name: subreddit)
+    sources = parse_sources(f"wallstreetbets:*::{ORIGIN}")
+    cursor = RedditCursor()
+    before = db.counts()[0]
+
+    stream_posts(reddit, cursor, sources)
+    assert db.counts()[0] == before + len(submissions)
+    assert cursor.positions[source_key(sources[0])]['fullname'] == submissions[-1].fullname
@@ -0,0 +1,13 @@
+import pytest
+from check_startup import ALLOWED_MODULES, STARTUP_BUDGETS, measure
+from vibe import COMMANDS
+
+# Import-time budget of each vibe.py subcommand (best of three fresh interpreters), and no heavy module
+# loaded before its stage needs it
+
+
+@pytest.mark.parametrize("command", COMMANDS)
+def test_startup_budget(command):
+    seconds, modules = measure(command, runs=3)
+    assert seconds <= STARTUP_BUDGETS[command], f"{command} imports in {seconds * 1000:.0f} ms"
+    assert not [module for module in modules if module not in ALLOWED_MODULES.get(command, set())]
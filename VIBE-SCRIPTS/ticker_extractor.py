@@ -0,0 +1,170 @@
+import logging
+import os
+import re
+from collections import namedtuple
+
+# "prepass": trust confident local results and send only ambiguous posts to GPT
+# "compare": always ask GPT too and report how often the two agree
+# "off":     GPT only (previous behaviour)
+TICKER_EXTRACTOR_MODE = os.getenv("TICKER_EXTRACTOR_MODE", "prepass").lower()
+
+logger = logging.getLogger(__name__)
+
+CASHTAG_RE = re.compile(r"\$([A-Za-z]{1,6}(?:\.[A-Za-z]{1,2})?)\b")
+TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9&.'-]*[A-Za-z0-9]|[A-Za-z]")
+UPPER_TICKER_RE = re.compile(r"^[A-Z]{1,5}(?:\.[A-Z]{1,2})?$")
+
+# Tickers that are also everyday words or Reddit/finance slang; only a cashtag or a company name counts for these
+STOPLIST = {
+    'A', 'I', 'AM', 'AN', 'ARE', 'AS', 'AT', 'BE', 'BY', 'DO', 'GO', 'HE', 'IF', 'IN', 'IS', 'IT', 'ME', 'MY',
+    'NO', 'OF', 'ON', 'OR', 'SO', 'TO', 'UP', 'US', 'WE', 'ALL', 'AND', 'ANY', 'BIG', 'CAN', 'FOR',
+    'GET', 'HAS', 'HOT', 'NEW', 'NOW', 'ONE', 'OUT', 'OWN', 'RUN', 'SEE', 'THE', 'TWO', 'WAY', 'WHO', 'YOU',
+    'BEST', 'CASH', 'EVER', 'FAST', 'FOUR', 'FUN', 'GOOD', 'HOLD', 'HOPE', 'JUST', 'LIFE', 'LOVE', 'MOON',
+    'NEXT', 'OPEN', 'PLAY', 'REAL', 'SAFE', 'TRUE', 'VERY', 'WELL', 'WORK', 'EDIT', 'TLDR', 'LMAO', 'LOL',
+    'DD', 'CEO', 'CFO', 'CTO', 'IPO', 'EPS', 'PE', 'ATH', 'ATL', 'ETF', 'ITM', 'OTM', 'ATM', 'IV', 'PT',
+    'YOLO', 'FOMO', 'HODL', 'IMO', 'IMHO', 'FYI', 'TA', 'FA', 'EV', 'AI', 'USA', 'UK', 'EU', 'GDP', 'CPI',
+    'FED', 'SEC', 'FDA', 'NYSE', 'OTC', 'Q1', 'Q2', 'Q3', 'Q4', 'YOY', 'QOQ', 'EOD', 'EOW', 'WSB', 'OP',
+    'BUY', 'SELL', 'CALL', 'CALLS', 'PUT', 'PUTS', 'LONG', 'SHORT', 'BULL', 'BEAR', 'OK', 'NOT', 'BUT', 'WHY',
+    'HOW', 'WHAT', 'THIS', 'THAT', 'WITH', 'FROM', 'WILL', 'TL', 'DR', 'NFA', 'IRA', 'USD', 'EUR', 'AH', 'PM',
+    'EST', 'PST', 'GAAP', 'FCF', 'EBITDA', 'ROI', 'ROE', 'YTD', 'MOM', 'API', 'IMPORTANT', 'UPDATE', 'NOTE',
+}
+
+# Words dropped from company names before matching ("Apple Inc." -> "apple")
+NAME_SUFFIXES = {
+    'inc', 'incorporated', 'corp', 'corporation', 'co', 'company', 'ltd', 'limited', 'plc', 'llc', 'lp',
+    'sa', 'ag', 'nv', 'holdings', 'holding', 'group', 'the', 'class', 'common', 'stock', 'shares',
+}
+
+Extraction = namedtuple('Extraction', ['symbols', 'confident', 'reasons'])
+
+
+def _words(text):
+    return [token.lower().strip(".'-") for token in TOKEN_RE.findall(text)]
+
+
+# Company name -> normalized word sequence used as a match pattern
+def _name_pattern(name):
+    words = [word for word in _words(name) if word and word not in NAME_SUFFIXES]
+    return tuple(words)
+
+
+# Local ticker extractor: cashtags, upper-case tickers and company names from the `stock` table.
+# Names are matched with a word-level trie walked from every token, so all patterns are found in a
+# single pass over the text (multi-pattern matching in the spirit of Aho-Corasick, at word boundaries).
+class TickerExtractor:
+    def __init__(self, abbreviations, names=None, stoplist=STOPLIST):
+        self.tickers = {abbreviation.upper() for abbreviation in abbreviations}
+        self.stoplist = stoplist
+        self.trie = {}
+        self.max_depth = 0
+        for abbreviation, name in (names or {}).items():
+            pattern = _name_pattern(name)
+            if not pattern or pattern == (abbreviation.lower(),):
+                continue
+            node = self.trie
+            for word in pattern:
+                node = node.setdefault(word, {})
+            node[None] = abbreviation.upper()
+            self.max_depth = max(self.max_depth, len(pattern))
+
+    @classmethod
+    def from_index(cls, index):
+        return cls(index.ids.keys(), index.names)
+
+    def extract(self, text):
+        found = []
+        reasons = []
+
+        def keep(symbol):
+            if symbol not in found:
+                found.append(symbol)
+
+        # 1. Cashtags are explicit, even for tickers we don't know yet
+        for match in CASHTAG_RE.finditer(text):
+            keep(match.group(1).upper())
+
+        # 2. Upper-case tokens that are known tickers and not common words
+        ambiguous = []
+        for token in TOKEN_RE.findall(text):
+            if not UPPER_TICKER_RE.match(token):
+                continue
+            if token in self.tickers and token not in self.stoplist:
+                keep(token)
+            elif token in self.tickers:
+                ambiguous.append(token)
+            elif token not in found and token not in self.stoplist and len(token) >= 2:
+                reasons.append(f"unknown upper-case token {token}")
+
+        # 3. Company names, longest match at each position
+        words = _words(text)
+        i = 0
+        while i < len(words):
+            node, match, length = self.trie, None, 0
+            for depth in range(min(self.max_depth, len(words) - i)):
+                node = node.get(words[i + depth])
+                if node is None:
+                    break
+                if None in node:
+                    match, length = node[None], depth + 1
+            if match:
+                keep(match)
+                i += length
+            else:
+                i += 1
+
+        for token in ambiguous:
+            if token not in found:
+                reasons.append(f"common-word ticker {token}")
+        if not found:
+            reasons.append("no tickers found")
+        return Extraction(found, not reasons, reasons)
+
+
+# Running agreement between the local extractor and GPT ("compare" mode)
+class AgreementStats:
+    def __init__(self):
+        self.posts = 0
+        self.exact = 0
+        self.confident = 0
+        self.confident_exact = 0
+        self.true_positive = 0
+        self.local_total = 0
+        self.llm_total = 0
+
+    def record(self, extraction, llm_symbols):
+        local = set(extraction.symbols)
+        llm = {symbol.upper().lstrip('$') for symbol in llm_symbols}
+        self.posts += 1
+        self.exact += local == llm
+        self.confident += extraction.confident
+        self.confident_exact += extraction.confident and local == llm
+        self.true_positive += len(local & llm)
+        self.local_total += len(local)
+        self.llm_total += len(llm)
+        if local != llm:
+            logger.debug("Extractor disagreement: local=%s gpt=%s confident=%s (%s)", sorted(local), sorted(llm),
+                         extraction.confident, '; '.join(extraction.reasons) or 'no doubts')
+
+    def print_stats(self):
+        if not self.posts:
+            return
+        precision = self.true_positive / self.local_total if self.local_total else 0.0
+        recall = self.true_positive / self.llm_total if self.llm_total else 0.0
+        confident_rate = self.confident_exact / self.confident if self.confident else 0.0
+        logger.info("Ticker extractor vs GPT: %d/%d posts identical, precision %.0f%%, recall %.0f%%; "
+                    "%d confident, %.0f%% of those identical.", self.exact, self.posts, precision * 100, recall * 100,
+                    self.confident, confident_rate * 100)
+
+
+_extractor = None
+_extractor_watermark = None
+
+
+# Extractor built from the shared symbol index, rebuilt when the index grows
+def get_ticker_extractor(index):
+    global _extractor, _extractor_watermark
+    len(index)  # make sure the index is loaded
+    if _extractor is None or _extractor_watermark != (index.watermark, len(index.ids)):
+        _extractor = TickerExtractor.from_index(index)
+        _extractor_watermark = (index.watermark, len(index.ids))
+    return _extractor
@@ -0,0 +1,158 @@
+import logging
+import os
+import socket
+import uuid
+from db_pool import get_connection
+from metrics import metrics
+
+# Tickers claimed per round trip, seconds a claim stays valid without renewal, and how old a ticker's last
+# sweep must be before any worker fetches it again
+TICKER_LEASE_BATCH = int(os.getenv("TICKER_LEASE_BATCH", "25"))
+TICKER_LEASE_SECONDS = float(os.getenv("TICKER_LEASE_SECONDS", "300"))
+TICKER_SWEEP_SECONDS = float(os.getenv("TICKER_SWEEP_SECONDS", "1800"))
+
+LEASE_DDL = """
+CREATE TABLE IF NOT EXISTS ticker_lease (
+    stock_id INTEGER PRIMARY KEY REFERENCES stock (id) ON DELETE CASCADE,
+    owner TEXT,
+    expires_at TIMESTAMPTZ,
+    swept_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS ticker_lease_swept_at_idx ON ticker_lease (swept_at NULLS FIRST);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+# "I/N" -> (I, N) for static hash partitioning by stock id
+def parse_shard(spec):
+    index, count = (int(part) for part in spec.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard '{spec}' must be I/N with 0 <= I < N")
+    return index, count
+
+
+# Work distribution for the news ticker sweep through a Postgres lease table.
+# Any number of workers, on one machine or several, claim small batches of tickers with
+# FOR UPDATE SKIP LOCKED, so no two workers hold the same ticker. A ticker is claimable when its last sweep
+# is older than `sweep_seconds` and it has no live lease. Leases expire after `lease_seconds`, so a crashed
+# worker's tickers are picked up again by whoever claims next. Finished tickers are marked swept in batches.
+class TickerLeases:
+    def __init__(self, owner=None, batch_size=TICKER_LEASE_BATCH, lease_seconds=TICKER_LEASE_SECONDS,
+                 sweep_seconds=TICKER_SWEEP_SECONDS):
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.sweep_seconds = sweep_seconds
+        self.finished = []  # stock ids swept but not yet marked
+        self.stats = {'claimed': 0, 'swept': 0, 'batches': 0}
+        self._prepared = False
+        self.watermark = 0  # highest stock id known to have a lease row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Create the lease table if needed and add a row for every stock that has none
+    def prepare(self):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                # Workers starting together would race on CREATE TABLE; take turns
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext('ticker_lease'));")
+                cur.execute(LEASE_DDL)
+                cur.execute("INSERT INTO ticker_lease (stock_id) SELECT id FROM stock ON CONFLICT DO NOTHING;")
+                cur.execute("SELECT COALESCE(MAX(id), 0) FROM stock;")
+                self.watermark = cur.fetchone()[0]
+            conn.commit()
+        self._prepared = True
+
+    # Claim up to batch_size due tickers; returns [(stock id, abbreviation)], empty when the sweep is done.
+    # Stocks added since the last claim (above the watermark, an index range scan) get their lease row first,
+    # so long-running workers pick them up too.
+    def claim(self):
+        if not self._prepared:
+            self.prepare()
+        with metrics.timer("lease_claim"):
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO ticker_lease (stock_id) SELECT id FROM stock WHERE id > %s
+                        ON CONFLICT DO NOTHING;
+                    """, (self.watermark,))
+                    cur.execute("SELECT COALESCE(MAX(id), %(w)s) FROM stock WHERE id > %(w)s;", {'w': self.watermark})
+                    watermark = cur.fetchone()[0]
+                    cur.execute("""
+                        WITH due AS (
+                            SELECT stock_id FROM ticker_lease
+                            WHERE (swept_at IS NULL OR swept_at < now() - make_interval(secs => %(sweep)s))
+                              AND (expires_at IS NULL OR expires_at < now())
+                            ORDER BY swept_at NULLS FIRST, stock_id
+                            LIMIT %(limit)s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        UPDATE ticker_lease l
+                        SET owner = %(owner)s, expires_at = now() + make_interval(secs => %(lease)s)
+                        FROM due, stock s
+                        WHERE l.stock_id = due.stock_id AND s.id = l.stock_id
+                        RETURNING l.stock_id, s.abbreviation;
+                    """, {'owner': self.owner, 'lease': self.lease_seconds, 'sweep': self.sweep_seconds,
+                          'limit': self.batch_size})
+                    tickers = sorted(cur.fetchall())
+                    # Keep this worker's unfinished claims alive while it works through them
+                    cur.execute("""
+                        UPDATE ticker_lease SET expires_at = now() + make_interval(secs => %s)
+                        WHERE owner = %s AND expires_at IS NOT NULL;
+                    """, (self.lease_seconds, self.owner))
+                conn.commit()
+        self.watermark = watermark
+        self.stats['claimed'] += len(tickers)
+        self.stats['batches'] += 1
+        metrics.inc("tickers_claimed", len(tickers))
+        return tickers
+
+    # Every due ticker, claimed batch by batch as the caller consumes them
+    def tickers(self):
+        while True:
+            tickers = self.claim()
+            if not tickers:
+                return
+            yield from tickers
+
+    # Record a ticker as swept; marks are written every batch_size tickers and on close()
+    def done(self, stock_id):
+        self.finished.append(stock_id)
+        if len(self.finished) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.finished:
+            return
+        finished, self.finished = self.finished, []
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE ticker_lease SET swept_at = now(), owner = NULL, expires_at = NULL
+                        WHERE stock_id = ANY(%s) AND owner = %s;
+                    """, (finished, self.owner))
+                    self.stats['swept'] += cur.rowcount
+                conn.commit()
+        except Exception as e:
+            # The leases simply expire and another worker sweeps these tickers again
+            logger.error("Error marking %d tickers swept: %s", len(finished), e)
+
+    # Mark finished tickers and hand back any claims this worker didn't get to
+    def close(self):
+        self.flush()
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("UPDATE ticker_lease SET owner = NULL, expires_at = NULL WHERE owner = %s;",
+                                (self.owner,))
+                conn.commit()
+        except Exception as e:
+            logger.error("Error releasing ticker leases: %s", e)
+        logger.info("Ticker leases (%s): %d claimed in %d batches, %d swept.", self.owner, self.stats['claimed'],
+                    self.stats['batches'], self.stats['swept'])
@@ -0,0 +1,32 @@
+import argparse
+import importlib
+import sys
+
+# Subcommand -> (module, help). Only the chosen module is imported, and each one defers its heavy
+# dependencies (yfinance, openai, praw, textblob) to the stage that needs them.
+COMMANDS = {
+    'news': ('news_api_SourcesTable', "ingest Yahoo Finance news for every stock"),
+    'reddit': ('reddit_api_SourcesTable', "ingest Reddit posts (--stream keeps running)"),
+    'prices': ('price_store', "bring the local OHLCV price store up to date"),
+    'daemon': ('ingest_daemon', "keep polling news and Reddit on adaptive per-source intervals"),
+    'scores': ('score_report', "compare fast-path title scores with their LLM-refined scores"),
+}
+
+
+# Import the module behind a subcommand
+def load(command):
+    return importlib.import_module(COMMANDS[command][0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="VIBE ingesters. Options after the subcommand go to it (`vibe.py reddit --help`).")
+    parser.add_argument("command", choices=list(COMMANDS),
+                        help="; ".join(f"{name}: {text}" for name, (_, text) in COMMANDS.items()))
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    load(args.command).cli(args.args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])